@@ -1,39 +1,43 @@
 import streamlit as st
 import google.generativeai as genai
-import re
 import os
 import json
 import datetime
 from dotenv import load_dotenv
 
+from edugenie import (analytics, backends, bank, breakers, contentstore, counters, dedup, generation,
+                      identity, irt, jobs, mastery, metrics, prefetch, sharedstate, topics, usage, variants)
+from edugenie.quizzes import BLOOMS_LEVELS, QUESTION_TYPES, build_quiz_prompt, parse_quiz
+
 # Load environment variables
 load_dotenv()
 
-try:
-    import firebase_admin
-    from firebase_admin import credentials, firestore
-except Exception:
-    firebase_admin = None
-
 # --- Configuration ---
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY') or st.secrets.get('GEMINI_API_KEY', '')
-if not GEMINI_API_KEY:
-    st.error("⚠️ GEMINI_API_KEY not found. Please configure it in .env or Streamlit secrets.")
-    st.stop()
+# EDUGENIE_OFFLINE=1 runs against local stand-ins and needs no credentials
+if not backends.is_offline():
+    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY') or st.secrets.get('GEMINI_API_KEY', '')
+    if not GEMINI_API_KEY:
+        st.error("⚠️ GEMINI_API_KEY not found. Please configure it in .env or Streamlit secrets.")
+        st.stop()
+
+    genai.configure(api_key=GEMINI_API_KEY)
 
-genai.configure(api_key=GEMINI_API_KEY)
+GEMINI_MODEL = 'models/gemini-flash-latest'
+metrics.start_from_env()
 
 st.set_page_config(
     page_title="Quiz Generation - Edugenie",
     page_icon="🧠",
     layout="wide"
 )
+# Full script runs; fragment reruns of the quiz panel show up as the quiz_panel span instead
+metrics.inc('edugenie_script_runs_total', page='quiz')
 
 # Initialize session state
 if 'quiz_generated' not in st.session_state:
     st.session_state.quiz_generated = False
-if 'quiz_questions' not in st.session_state:
-    st.session_state.quiz_questions = []
+if 'quiz_questions_key' not in st.session_state:
+    st.session_state.quiz_questions_key = None  # questions live in the process content store
 if 'current_question' not in st.session_state:
     st.session_state.current_question = 0
 if 'user_answers' not in st.session_state:
@@ -42,237 +46,495 @@ if 'quiz_completed' not in st.session_state:
     st.session_state.quiz_completed = False
 if 'quiz_started' not in st.session_state:
     st.session_state.quiz_started = False
+if 'insights_stale' not in st.session_state:
+    st.session_state.insights_stale = True
+if 'insights' not in st.session_state:
+    st.session_state.insights = None
+if 'quiz_job' not in st.session_state:
+    st.session_state.quiz_job = None
+if 'prefetch_prefs' not in st.session_state:
+    st.session_state.prefetch_prefs = {'enabled': False, 'next_level': False}
+if 'use_question_bank' not in st.session_state:
+    st.session_state.use_question_bank = True
+if 'adaptive_quiz' not in st.session_state:
+    st.session_state.adaptive_quiz = None
+if 'quiz_variant_id' not in st.session_state:
+    st.session_state.quiz_variant_id = None
+    st.session_state.quiz_canonical_key = None
 
-def parse_quiz(quiz_text, question_type):
-    """Parses the generated text to extract questions, options, answers, and explanations."""
-    questions = []
-    
-    if question_type == 'Multiple Choice':
-        # Split by question numbers and process each
-        parts = re.split(r'\n(?=\d+\.)', quiz_text.strip())
-        for part in parts:
-            if not part.strip():
-                continue
-                
-            lines = part.strip().split('\n')
-            question_line = ""
-            options = []
-            answer = ""
-            explanation = ""
-            
-            i = 0
-            while i < len(lines):
-                line = lines[i].strip()
-                if line and (line[0].isdigit() or line.startswith('Question')):
-                    question_line = line
-                elif line.startswith(('A.', 'B.', 'C.', 'D.')):
-                    options.append(line)
-                elif 'Answer' in line or 'Correct' in line:
-                    answer = line.split(':')[-1].strip() if ':' in line else line
-                elif 'Explanation' in line:
-                    explanation = line.split(':', 1)[-1].strip() if ':' in line else ""
-                    # Get remaining lines as part of explanation
-                    while i + 1 < len(lines) and not lines[i + 1].strip().startswith(('Answer', 'Correct', '1.', '2.', '3.', '4.', '5.')):
-                        i += 1
-                        explanation += " " + lines[i].strip()
-                i += 1
-            
-            if question_line and len(options) >= 4:
-                questions.append({
-                    "question": question_line,
-                    "options": options,
-                    "answer": answer,
-                    "explanation": explanation
-                })
+def load_quiz_questions():
+    """The current quiz's questions from the content store; [] if there is none or it was reaped"""
+    return contentstore.get(st.session_state.quiz_questions_key, [])
+
+def store_quiz_questions(questions):
+    st.session_state.quiz_questions_key = contentstore.put(questions) if questions else None
+
+# Quiz progress shared between replicas, so a reconnect to another one resumes the quiz
+PROGRESS_FIELDS = ('quiz_generated', 'quiz_questions_key', 'quiz_canonical_key', 'quiz_variant_id',
+                   'current_question', 'quiz_completed', 'quiz_started', 'quiz_saved',
+                   'quiz_topic', 'quiz_type', 'quiz_blooms_level')
+
+def progress_snapshot():
+    """The session's quiz progress as JSON-friendly values"""
+    if st.session_state.adaptive_quiz is not None:
+        # The adaptive quiz's posterior lives in this process only; don't resume an older quiz instead
+        return {}
+    snapshot = {field: st.session_state.get(field) for field in PROGRESS_FIELDS}
+    snapshot['user_answers'] = sorted(st.session_state.user_answers.items())
+    return snapshot
+
+def sync_progress():
+    """Restore shared quiz progress on a session's first run, otherwise share any change (one round trip at most)"""
+    shared = sharedstate.sync(st.session_state, f"progress:{current_user_key()}", progress_snapshot())
+    if shared and shared.get('quiz_generated') and not st.session_state.quiz_generated:
+        for field in PROGRESS_FIELDS:
+            st.session_state[field] = shared.get(field)
+        st.session_state.user_answers = {int(idx): answer for idx, answer in shared['user_answers']}
+        for idx, answer in st.session_state.user_answers.items():
+            if answer is not None:
+                st.session_state[f"q_{idx}"] = answer
+
+def grade_quiz(quiz_questions, user_answers):
+    """Score a quiz and build per-question results for Firestore"""
+    score = 0
+
+    # Prepare questions data with user answers for Firestore
+    questions_data = []
+
+    # Calculate score and prepare data
+    for i, q in enumerate(quiz_questions):
+        user_ans = user_answers.get(i, "")
+        correct_ans = q['answer']
+        is_correct = False
     
-    elif question_type == 'True/False':
-        parts = re.split(r'\n(?=\d+\.)', quiz_text.strip())
-        for part in parts:
-            if not part.strip():
-                continue
-                
-            lines = part.strip().split('\n')
-            question_line = ""
-            answer = ""
-            explanation = ""
-            
-            for i, line in enumerate(lines):
-                line = line.strip()
-                if line and (line[0].isdigit() or line.startswith('Question')):
-                    question_line = line
-                elif 'Answer' in line or 'Correct' in line:
-                    answer = line.split(':')[-1].strip() if ':' in line else line
-                elif 'Explanation' in line:
-                    explanation = line.split(':', 1)[-1].strip() if ':' in line else ""
-            
-            if question_line:
-                questions.append({
-                    "question": question_line,
-                    "options": ["True", "False"],
-                    "answer": answer,
-                    "explanation": explanation
-                })
+        if q['options']:  # Multiple choice or True/False
+            # Extract the letter/option from the correct answer
+            if len(correct_ans) > 0:
+                if correct_ans.upper().startswith('A') or correct_ans.upper().startswith('B') or correct_ans.upper().startswith('C') or correct_ans.upper().startswith('D'):
+                    correct_letter = correct_ans[0].upper()
+                    user_letter = user_ans[0].upper() if user_ans else ""
+                    if correct_letter == user_letter:
+                        score += 1
+                        is_correct = True
+                elif user_ans.strip().lower() == correct_ans.strip().lower():
+                    score += 1
+                    is_correct = True
+        else:  # Short answer
+            if user_ans.strip().lower() == correct_ans.strip().lower():
+                score += 1
+                is_correct = True
     
-    elif question_type == 'Short Answer':
-        parts = re.split(r'\n(?=\d+\.)', quiz_text.strip())
-        for part in parts:
-            if not part.strip():
-                continue
-                
-            lines = part.strip().split('\n')
-            question_line = ""
-            answer = ""
-            explanation = ""
-            
-            for i, line in enumerate(lines):
-                line = line.strip()
-                if line and (line[0].isdigit() or line.startswith('Question')):
-                    question_line = line
-                elif 'Answer' in line or 'Correct' in line:
-                    answer = line.split(':')[-1].strip() if ':' in line else line
-                elif 'Explanation' in line:
-                    explanation = line.split(':', 1)[-1].strip() if ':' in line else ""
-            
-            if question_line:
-                questions.append({
-                    "question": question_line,
-                    "options": [],
-                    "answer": answer,
-                    "explanation": explanation
-                })
+        # Prepare question data for Firestore
+        questions_data.append({
+            'question': q['question'],
+            'options': q['options'],
+            'answer': q['answer'],
+            'explanation': q['explanation'],
+            'user_answer': user_ans,
+            'is_correct': is_correct
+        })
+        if q.get('blooms_level'):
+            # Adaptive quizzes mix Bloom's levels
+            questions_data[-1]['blooms_level'] = q['blooms_level']
     
-    return questions
+    return score, questions_data
 
 def reset_quiz():
     """Reset all quiz-related session state"""
     st.session_state.quiz_generated = False
-    st.session_state.quiz_questions = []
+    st.session_state.quiz_questions_key = None
     st.session_state.current_question = 0
     st.session_state.user_answers = {}
     st.session_state.quiz_completed = False
     st.session_state.quiz_started = False
+    st.session_state.prefetch_started = False
+    st.session_state.quiz_variant_id = None
+    st.session_state.quiz_canonical_key = None
+    st.session_state.adaptive_quiz = None
 
-def init_firestore():
-    """Initialize Firestore client"""
-    if firebase_admin is None:
-        return None, "firebase-admin not installed"
-
-    try:
-        app = None
-        try:
-            app = firebase_admin.get_app()
-        except ValueError:
-            pass
+def next_blooms_level(level):
+    """The Bloom's level above `level`, or `level` itself at the top"""
+    if level not in BLOOMS_LEVELS:
+        return level
+    return BLOOMS_LEVELS[min(BLOOMS_LEVELS.index(level) + 1, len(BLOOMS_LEVELS) - 1)]
 
-        if app is None:
-            cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH')
-            cred_json = os.getenv('FIREBASE_CREDENTIALS_JSON')
-            
-            try:
-                if 'firebase_credentials' in st.secrets:
-                    cred_dict = dict(st.secrets['firebase_credentials'])
-                    cred = credentials.Certificate(cred_dict)
-                    firebase_admin.initialize_app(cred)
-                elif cred_json:
-                    cred_dict = json.loads(cred_json)
-                    cred = credentials.Certificate(cred_dict)
-                    firebase_admin.initialize_app(cred)
-                elif cred_path and os.path.exists(cred_path):
-                    cred = credentials.Certificate(cred_path)
-                    firebase_admin.initialize_app(cred)
-                else:
-                    return None, "No Firebase credentials found"
-            except Exception:
-                return None, "Firebase initialization failed"
-
-        db = firestore.client()
-        return db, None
-    except Exception as e:
-        return None, str(e)
+def current_user_key():
+    """ID of the current student, for saved attempts and per-user state"""
+    return identity.current_user_id()
 
-def save_quiz_attempt(db, topic, blooms_level, total_questions, correct_answers, score_percentage, questions_data, user_id='default_user'):
-    """Save quiz attempt with all questions to Firestore"""
+def save_quiz_attempt(db, topic, blooms_level, total_questions, correct_answers, score_percentage, questions_data, user_id, question_type=None, display_name=None, variant_id=None, ability=None):
+    """Save quiz attempt with all questions and update the user's counters in one batch"""
     try:
-        attempt_data = {
-            'user_id': user_id,
-            'topic': topic,
-            'blooms_level': blooms_level,
-            'total_questions': total_questions,
-            'correct_answers': correct_answers,
-            'score_percentage': score_percentage,
-            'timestamp': datetime.datetime.utcnow(),
-            'created_at': datetime.datetime.utcnow()
-        }
-        
-        # Create the quiz attempt document
-        attempt_ref = db.collection('quiz_attempts').document()
-        attempt_ref.set(attempt_data)
-        
-        # Save each question as a subcollection
-        for idx, question in enumerate(questions_data):
-            question_doc = {
-                'question_number': idx + 1,
-                'question_text': question.get('question', ''),
-                'options': question.get('options', []),
-                'correct_answer': question.get('answer', ''),
-                'explanation': question.get('explanation', ''),
-                'user_answer': question.get('user_answer', ''),
-                'is_correct': question.get('is_correct', False),
+        with breakers.guard('firestore'), metrics.span('save_quiz_attempt', page='quiz'):
+            question_type = question_type or bank.infer_question_type(questions_data[0].get('options') if questions_data else [])
+            attempt_data = {
+                'user_id': user_id,
+                'topic': topic,
+                'topic_key': topics.topic_key(topic),
+                'blooms_level': blooms_level,
+                'question_type': question_type,
+                'total_questions': total_questions,
+                'correct_answers': correct_answers,
+                'score_percentage': score_percentage,
+                'variant_id': variant_id,
+                'ability': ability,
+                'timestamp': datetime.datetime.utcnow(),
                 'created_at': datetime.datetime.utcnow()
             }
-            attempt_ref.collection('questions').add(question_doc)
         
+            # Attempt, questions and counter increment commit together
+            batch = db.batch()
+            attempt_ref = db.collection('quiz_attempts').document()
+            batch.set(attempt_ref, attempt_data)
+        
+            # Save each question as a subcollection
+            for idx, question in enumerate(questions_data):
+                question_doc = {
+                    'question_number': idx + 1,
+                    'question_text': question.get('question', ''),
+                    'options': question.get('options', []),
+                    'correct_answer': question.get('answer', ''),
+                    'explanation': question.get('explanation', ''),
+                    'user_answer': question.get('user_answer', ''),
+                    'is_correct': question.get('is_correct', False),
+                    'created_at': datetime.datetime.utcnow()
+                }
+                # Indexed fields let the question bank find this question again
+                question_level = question.get('blooms_level') or blooms_level
+                question_doc.update(bank.index_fields(topic, question_level, question_type, question_doc['question_text'], user_id=user_id))
+                batch.set(attempt_ref.collection('questions').document(), question_doc)
+        
+            counters.increment(db, user_id, counters.attempt_values(total_questions, correct_answers, score_percentage), batch=batch)
+            analytics.leaderboard_update(db, user_id, display_name, total_questions, correct_answers, batch)
+            mastery_state = mastery.update(db, user_id, topic, blooms_level, question_type, questions_data, batch)
+            batch.commit()
+            mastery.remember(user_id, mastery_state)
+        
+            analytics.record_attempt(user_id, topic, blooms_level, question_type, total_questions, correct_answers,
+                                     score_percentage, attempt_data['timestamp'], display_name=display_name)
+        
+        by_level = {}
+        for question in questions_data:
+            by_level.setdefault(question.get('blooms_level') or blooms_level, []).append(question)
+        for level, level_questions in by_level.items():
+            bank.add(topic, level, question_type, level_questions)
         return True
     except Exception as e:
         st.error(f"Failed to save quiz attempt: {e}")
         return False
 
-def get_user_insights(db, user_id='default_user'):
-    """Get user insights from Firestore"""
-    try:
-        attempts_ref = db.collection('quiz_attempts').where('user_id', '==', user_id).limit(100)
-        attempts = list(attempts_ref.stream())
-        
-        if not attempts:
+def get_user_insights(db, user_id):
+    """Get user insights from the sharded counters plus the five latest attempts
+
+    Returns None when the user has no attempts yet; raises if Firestore is unavailable.
+    """
+    with breakers.guard('firestore'), metrics.span('get_user_insights', page='quiz'):
+        totals = counters.read(db, user_id)
+        if not totals['attempts']:
             return None
+    
+        recent = (db.collection('quiz_attempts')
+                  .where('user_id', '==', user_id)
+                  .order_by('timestamp', direction='DESCENDING')
+                  .limit(5))
+        recent_scores = [doc.to_dict().get('score_percentage', 0) for doc in recent.stream()]
+        recent_scores.reverse()  # oldest first
+    
+    total_questions = totals['questions']
+    accuracy = (totals['correct'] / total_questions * 100) if total_questions > 0 else 0
+    avg_score = totals['score_sum'] / totals['attempts']
+    
+    return {
+        'total_attempts': totals['attempts'],
+        'total_questions': total_questions,
+        'correct_answers': totals['correct'],
+        'accuracy': accuracy,
+        'average_score': avg_score,
+        'recent_scores': recent_scores
+    }
+
+def _store_answer(q_idx):
+    """Copy the current widget value into the persistent answers dict"""
+    st.session_state.user_answers[q_idx] = st.session_state.get(f"q_{q_idx}")
+
+def _go_previous():
+    st.session_state.current_question -= 1
+
+def _go_next(q_idx):
+    _store_answer(q_idx)
+    st.session_state.current_question += 1
+
+def _use_recommendation(topic, blooms_level):
+    st.session_state.topic = topic
+    st.session_state.blooms = blooms_level
+
+def _adaptive_step(q_idx):
+    """Score the answer to the last adaptive question and serve the next one; returns True when finished"""
+    adaptive = st.session_state.adaptive_quiz
+    questions = load_quiz_questions()
+    score, _ = grade_quiz([questions[q_idx]], {0: st.session_state.user_answers.get(q_idx)})
+    adaptive.record(score == 1)
+    if adaptive.done:
+        return True
+    question = adaptive.next_question()
+    questions.append(dict(question, question=f"{q_idx + 2}. {bank.strip_number(question['question'])}"))
+    store_quiz_questions(questions)
+    bank.mark_seen(current_user_key(), st.session_state.quiz_topic, [question])
+    dedup.remember(current_user_key(), [question])
+    return False
+
+def _adaptive_next(q_idx):
+    _store_answer(q_idx)
+    if _adaptive_step(q_idx):
+        st.session_state.quiz_completed = True
+    else:
+        st.session_state.current_question += 1
+
+@st.fragment
+def quiz_panel():
+    """Question panel for Phase 2.
+
+    Runs as a fragment so answering and navigating only re-renders this panel,
+    not the sidebar stats or the rest of the page. Submitting triggers a full rerun.
+    """
+    with metrics.span('quiz_panel', page='quiz'):
+        _quiz_panel()
+
+def _quiz_panel():
+    if st.session_state.quiz_completed:
+        # An adaptive quiz finished in the callback; show the results page
+        st.rerun()
+    sync_progress()
+
+    current_q_idx = st.session_state.current_question
+    questions = load_quiz_questions()
+    total_questions = len(questions)
+    current_q = questions[current_q_idx]
+    adaptive = st.session_state.adaptive_quiz
+
+    # Progress bar
+    if adaptive is not None:
+        st.progress((current_q_idx + 1) / adaptive.max_questions)
+        st.write(f"Question {current_q_idx + 1} of up to {adaptive.max_questions}")
+    else:
+        progress = (current_q_idx + 1) / total_questions
+        st.progress(progress)
+        st.write(f"Question {current_q_idx + 1} of {total_questions}")
+
+    # Question display
+    st.subheader(current_q['question'])
+
+    # Answer input
+    if current_q['options'] and len(current_q['options']) > 0:
+        st.radio("Choose your answer:", current_q['options'], key=f"q_{current_q_idx}")
+    else:
+        st.text_input("Your answer:", key=f"q_{current_q_idx}")
+
+    # Navigation buttons
+    col1, col2, col3 = st.columns([1, 1, 1])
+
+    with col1:
+        # Adaptive answers are scored as they are given, so there is no going back
+        if current_q_idx > 0 and adaptive is None:
+            st.button("⬅️ Previous", on_click=_go_previous)
+
+    with col3:
+        if current_q_idx < total_questions - 1:
+            st.button("➡️ Next", on_click=_go_next, args=(current_q_idx,))
+        elif adaptive is not None:
+            st.button("➡️ Next", type="primary", on_click=_adaptive_next, args=(current_q_idx,))
+        else:
+            if st.button("✅ Submit Quiz", type="primary"):
+                _store_answer(current_q_idx)
+                st.session_state.quiz_completed = True
+                st.rerun()
+
+def generate_questions(topic, blooms_level, num_questions, question_type, avoid=None, user_key=None):
+    """Ask Gemini for `num_questions` new questions and parse them"""
+    labels = {'page': 'quiz', 'question_type': question_type, 'model': GEMINI_MODEL}
+    with metrics.span('prompt_build', page='quiz', question_type=question_type):
+        prompt = build_quiz_prompt(topic, blooms_level, num_questions, question_type, avoid=avoid)
+    model = backends.get_model(GEMINI_MODEL)
+    quiz_text, rounds = generation.generate_with_continuation(model, prompt, labels=labels)
+    usage.record_rounds(rounds, user_id=user_key, topic=topic, **labels)
+    with metrics.span('parse_quiz', **labels):
+        return parse_quiz(quiz_text, question_type)[:num_questions]
+
+def generate_quiz(topic, blooms_level, num_questions, question_type, db=None, user_key=None):
+    """Build a quiz from the question bank, generating only the remainder; runs on the background job pool"""
+    questions = []
+    if db is not None:
+        with metrics.span('question_bank', page='quiz', question_type=question_type):
+            questions = bank.draw(db, topic, blooms_level, question_type, num_questions, user_id=user_key)
+    banked = len(questions)
+    
+    if num_questions > banked:
+        try:
+            questions += generate_questions(topic, blooms_level, num_questions - banked, question_type, user_key=user_key)
+        except breakers.CircuitOpenError:
+            # Gemini is down: a shorter quiz from the bank beats no quiz
+            if not banked:
+                raise
+    else:
+        usage.record(user_id=user_key, page='quiz', topic=topic, model=GEMINI_MODEL,
+                     question_type=question_type, cache_hit=True)
+    
+    # Regenerate only the slots that repeat another question or the user's recent history
+    questions = dedup.replace_duplicates(
+        questions, lambda count, avoid: generate_questions(topic, blooms_level, count, question_type, avoid=avoid,
+                                                           user_key=user_key),
+        user_key=user_key)
+    
+    metrics.inc(bank.BANK_METRIC, banked, source='bank', question_type=question_type)
+    metrics.inc(bank.BANK_METRIC, len(questions) - banked, source='generated', question_type=question_type)
+    return bank.renumber(questions)
+
+def generate_adaptive_quiz(topic, blooms_level, max_questions, question_type, db=None, user_key=None):
+    """Question pool for an adaptive quiz; runs on the background job pool
+
+    The pool is the usual quiz at the chosen level plus unseen banked questions
+    from the other levels, so the quiz can move up or down in difficulty
+    without generating more.
+    """
+    pool = [dict(q, blooms_level=blooms_level)
+            for q in generate_quiz(topic, blooms_level, max_questions, question_type, db=db, user_key=user_key)]
+    params, prior_mean = {}, 0.0
+    if db is not None:
+        for level in BLOOMS_LEVELS:
+            if level != blooms_level:
+                pool += [dict(q, blooms_level=level)
+                         for q in bank.draw(db, topic, level, question_type, max_questions, user_id=user_key)]
+        try:
+            params = irt.item_params(db, topic)
+            prior_mean = irt.ability(db, user_key)
+        except Exception:
+            metrics.inc('edugenie_irt_errors_total')
+    quiz = irt.AdaptiveQuiz(pool, params, max_questions, prior_mean=prior_mean)
+    metrics.inc('edugenie_adaptive_pool_questions_total', len(pool), fitted='yes' if quiz.fitted else 'no')
+    return quiz
+
+@st.fragment(run_every=1)
+def quiz_job_status():
+    """Poll the background generation job and load the quiz once it is ready"""
+    job_info = st.session_state.quiz_job
+    job = jobs.get(job_info['id'])
+    
+    if job is not None and not job.finished:
+        st.info(f"⏳ Generating your personalized quiz, please wait... ({job.elapsed():.0f}s)")
+        return
+    
+    st.session_state.quiz_job = None
+    if job is None:
+        st.session_state.quiz_job_error = "The quiz generation job expired. Please generate the quiz again."
+    elif job.status == jobs.FAILED:
+        st.session_state.quiz_job_error = f"An error occurred while generating the quiz: {job.error}"
+    elif not job.result:
+        st.session_state.quiz_job_error = "Failed to generate quiz questions properly. Please try again."
+    else:
+        questions = job.result
+        if job_info.get('adaptive'):
+            # Only the questions actually served count as seen
+            st.session_state.adaptive_quiz = job.result
+            questions = bank.renumber([job.result.next_question()])
+        store_quiz_questions(questions)
+        requested = job_info.get('num_questions')
+        if not job_info.get('adaptive') and requested and len(questions) < requested:
+            st.session_state.quiz_job_notice = (
+                f"Only {len(questions)} of the {requested} questions came out distinct from each other and from "
+                "your recent quizzes, so this quiz is shorter.")
+        st.session_state.quiz_generated = True
+        st.session_state.quiz_topic = job_info['topic']
+        st.session_state.quiz_type = job_info['type']
+        st.session_state.quiz_blooms_level = job_info['blooms_level']
+        st.session_state.quiz_saved = False  # Reset save flag
+        bank.mark_seen(current_user_key(), job_info['topic'], questions)
+        dedup.remember(current_user_key(), questions)
+    
+    if job is not None:
+        jobs.discard(job.id)
+    st.rerun()
+
+def exam_versions_panel():
+    """Shuffled versions of the ready quiz for exams, with answer keys"""
+    with st.expander("🔀 Exam Versions"):
+        st.caption("Every version has the same questions in a different order, with multiple choice options "
+                   "shuffled. Results are saved against the original quiz.")
+        col1, col2 = st.columns(2)
+        with col1:
+            count = st.number_input("Number of versions", min_value=2, max_value=100, value=30, key="variant_count")
+        with col2:
+            seed = st.number_input("Seed", min_value=0, value=0, key="variant_seed",
+                                   help="The same seed always gives the same versions")
         
-        total_attempts = len(attempts)
-        total_questions = 0
-        correct_answers = 0
-        recent_scores = []
-        
-        for attempt in attempts:
-            data = attempt.to_dict()
-            total_questions += data.get('total_questions', 0)
-            correct_answers += data.get('correct_answers', 0)
-            recent_scores.append(data.get('score_percentage', 0))
+        variant_set = variants.VariantSet(load_quiz_questions(), int(count), int(seed))
+        ids = variant_set.ids()
+        keys = variant_set.answer_keys()
+        st.dataframe([{'Version': n + 1, 'ID': vid, 'Answer key': key} for n, (vid, key) in enumerate(zip(ids, keys))],
+                     hide_index=True, use_container_width=True)
         
-        accuracy = (correct_answers / total_questions * 100) if total_questions > 0 else 0
-        avg_score = sum(recent_scores) / len(recent_scores) if recent_scores else 0
+        export = [{'version': n + 1, 'variant_id': vid, 'answer_key': key, 'questions': variant_set.variant(n)}
+                  for n, (vid, key) in enumerate(zip(ids, keys))]
+        st.download_button("⬇️ Download Versions (JSON)", json.dumps(export, indent=2),
+                           file_name=f"{st.session_state.quiz_topic}_versions.json", mime="application/json")
         
-        return {
-            'total_attempts': total_attempts,
-            'total_questions': total_questions,
-            'correct_answers': correct_answers,
-            'accuracy': accuracy,
-            'average_score': avg_score,
-            'recent_scores': recent_scores[-5:]  # Last 5 scores
-        }
-    except Exception as e:
-        return None
+        version = st.number_input("Take version", min_value=1, max_value=int(count), value=1, key="variant_take")
+        if st.button("🎯 Start This Version", use_container_width=True):
+            st.session_state.quiz_canonical_key = st.session_state.quiz_questions_key
+            store_quiz_questions(variant_set.variant(int(version) - 1))
+            st.session_state.quiz_variant_id = ids[int(version) - 1]
+            st.session_state.quiz_started = True
+            st.rerun()
+
+def start_prefetch():
+    """Queue the follow-up quiz once per quiz, if the student opted in"""
+    prefs = st.session_state.prefetch_prefs
+    if not prefs['enabled'] or st.session_state.get('prefetch_started') or st.session_state.adaptive_quiz is not None:
+        return
+    st.session_state.prefetch_started = True
+    
+    topic = st.session_state.quiz_topic
+    question_type = st.session_state.quiz_type
+    blooms_level = st.session_state.quiz_blooms_level
+    if prefs['next_level']:
+        blooms_level = next_blooms_level(blooms_level)
+    num_questions = len(load_quiz_questions())
+    
+    db = backends.page_firestore()[0] if st.session_state.use_question_bank else None
+    params = {'topic': topic, 'type': question_type, 'blooms_level': blooms_level, 'num_questions': num_questions}
+    prefetch.start(current_user_key(), params, generate_quiz, topic, blooms_level, num_questions, question_type,
+                   db=db, user_key=current_user_key())
 
 # Main App
 st.title("📝 Quiz Generation")
 st.markdown("Generate personalized quizzes on any topic with AI-powered questions")
+for message in breakers.outage_messages():
+    st.warning(message)
+
+sync_progress()
+contentstore.touch(identity.session_id(),
+                   [st.session_state.quiz_questions_key, st.session_state.quiz_canonical_key])
+if st.session_state.quiz_generated and not load_quiz_questions():
+    reset_quiz()
+    st.info("⌛ Your quiz expired after a long break. Generate a new one to continue.")
 
 # Sidebar with User Insights
 with st.sidebar:
     st.header("📊 Your Learning Stats")
     
-    # Try to get insights from Firestore
-    db, db_err = init_firestore()
-    if db:
-        insights = get_user_insights(db)
+    # Only hit Firestore on first load and after a quiz is saved
+    if st.session_state.insights_stale:
+        db, db_err = backends.page_firestore()
+        try:
+            st.session_state.insights = get_user_insights(db, current_user_key()) if db else None
+            st.session_state.mastery = mastery.load(db, current_user_key()) if db else None
+            st.session_state.insights_db_ready = db is not None
+            st.session_state.insights_stale = False
+        except Exception:
+            # Keep showing the last loaded stats and try again on a later rerun
+            st.caption("⚠️ Stats couldn't be refreshed right now")
+
+    if st.session_state.get('insights_db_ready'):
+        insights = st.session_state.insights
         if insights:
             st.metric("Total Quizzes", insights['total_attempts'])
             st.metric("Questions Attempted", insights['total_questions'])
@@ -283,6 +545,18 @@ with st.sidebar:
                 st.subheader("Recent Scores")
                 for idx, score in enumerate(reversed(insights['recent_scores']), 1):
                     st.write(f"{idx}. {score:.1f}%")
+            
+            mastery_state = st.session_state.get('mastery')
+            if mastery_state and mastery_state['skills']:
+                st.subheader("🧠 Mastery")
+                for topic, level, p, answers in mastery.summary(mastery_state):
+                    st.progress(p, text=f"{topic} · {level} ({answers} answers)")
+                suggestion = mastery.recommend(mastery_state)
+                if suggestion:
+                    topic, level, reason = suggestion
+                    st.caption(f"Recommended next: **{topic}** at **{level}** ({reason})")
+                    if not st.session_state.quiz_generated:
+                        st.button("📌 Use this", on_click=_use_recommendation, args=(topic, level))
         else:
             st.info("Complete quizzes to see your stats here!")
     else:
@@ -290,6 +564,7 @@ with st.sidebar:
     
     st.markdown("---")
     st.caption("💡 Keep taking quizzes to improve your stats!")
+    identity.render_account_controls()
 
 # Phase 1: Quiz Setup (only show if quiz not generated)
 if not st.session_state.quiz_generated:
@@ -302,7 +577,7 @@ if not st.session_state.quiz_generated:
             topic_input = st.text_input("Topic:", placeholder="e.g., The Solar System", key="topic")
             blooms_taxonomy_level = st.selectbox(
                 "Bloom's Taxonomy Level:",
-                ['Remember', 'Understand', 'Apply', 'Analyze', 'Evaluate', 'Create'],
+                BLOOMS_LEVELS,
                 key="blooms"
             )
         
@@ -310,168 +585,133 @@ if not st.session_state.quiz_generated:
             num_questions_slider = st.slider("Number of Questions:", min_value=1, max_value=20, value=5, key="num_q")
             question_type_dropdown = st.selectbox(
                 "Question Type:",
-                ['Multiple Choice', 'True/False'],
+                QUESTION_TYPES,
                 key="q_type"
             )
     
-    generate_button = st.button("🚀 Generate Quiz", type="primary", use_container_width=True)
+    # Opt-in: generate the follow-up quiz while this one is being answered
+    prefs = st.session_state.prefetch_prefs
+    col1, col2 = st.columns(2)
+    with col1:
+        prefs['enabled'] = st.checkbox(
+            "⚡ Prepare my next quiz while I answer",
+            value=prefs['enabled'],
+            help="Generates a follow-up quiz on the same topic in the background so the next one starts instantly"
+        )
+    with col2:
+        prefs['next_level'] = st.checkbox(
+            "📈 Step up to the next Bloom's level",
+            value=prefs['next_level'],
+            disabled=not prefs['enabled']
+        )
+    st.session_state.use_question_bank = st.checkbox(
+        "♻️ Reuse questions from the question bank",
+        value=st.session_state.use_question_bank,
+        help="Fills the quiz with stored questions on this topic you haven't seen yet and only generates the rest"
+    )
+    adaptive_mode = st.checkbox(
+        "🎯 Adaptive quiz",
+        key="adaptive_mode",
+        help="Picks each question to match how you're doing and stops as soon as your level is measured; "
+             "the number of questions becomes the maximum"
+    )
+    
+    generate_button = st.button(
+        "🚀 Generate Quiz",
+        type="primary",
+        use_container_width=True,
+        disabled=st.session_state.quiz_job is not None
+    )
+    
+    if st.session_state.get('quiz_job_error'):
+        st.error(st.session_state.pop('quiz_job_error'))
+        st.error("Please check your API key and try again.")
+    if st.session_state.get('quiz_job_notice'):
+        st.warning(st.session_state.pop('quiz_job_notice'))
     
     if generate_button:
         if not topic_input:
             st.error("Please enter a topic for the quiz.")
         else:
-            with st.spinner("Generating your personalized quiz, please wait..."):
-                prompt = f"""
-                Generate exactly {num_questions_slider} quiz questions based on these specifications:
-                - Topic: {topic_input}
-                - Bloom's Taxonomy Level: {blooms_taxonomy_level}
-                - Question Type: {question_type_dropdown}
-
-                Format each question exactly as follows:
-
-                1. [Question text here]
-                {"A. [Option A]" if question_type_dropdown == 'Multiple Choice' else ""}
-                {"B. [Option B]" if question_type_dropdown == 'Multiple Choice' else ""}
-                {"C. [Option C]" if question_type_dropdown == 'Multiple Choice' else ""}
-                {"D. [Option D]" if question_type_dropdown == 'Multiple Choice' else ""}
-                Answer: [Correct answer]
-                Explanation: [Detailed explanation]
-
-                {"2. [Next question...]" if num_questions_slider > 1 else ""}
-
-                Make sure to provide exactly {num_questions_slider} complete questions with all required components.
-                """
-
-                try:
-                    model = genai.GenerativeModel('models/gemini-flash-latest')
-                    response = model.generate_content(prompt)
-                    quiz_questions = parse_quiz(response.text, question_type_dropdown)
-                    
-                    if len(quiz_questions) >= 1:
-                        st.session_state.quiz_questions = quiz_questions
-                        st.session_state.quiz_generated = True
-                        st.session_state.quiz_topic = topic_input
-                        st.session_state.quiz_type = question_type_dropdown
-                        st.session_state.quiz_blooms_level = blooms_taxonomy_level
-                        st.session_state.quiz_saved = False  # Reset save flag
-                        st.rerun()
-                    else:
-                        st.error("Failed to generate quiz questions properly. Please try again.")
-                        
-                except Exception as e:
-                    st.error(f"An error occurred while generating the quiz: {e}")
-                    st.error("Please check your API key and try again.")
+            db = backends.page_firestore()[0] if st.session_state.use_question_bank else None
+            
+            # Runs on the shared worker pool so reruns don't lose the generation
+            st.session_state.quiz_job = {
+                'id': jobs.submit(generate_adaptive_quiz if adaptive_mode else generate_quiz, topic_input, blooms_taxonomy_level, num_questions_slider,
+                                  question_type_dropdown, db=db, user_key=current_user_key(), kind='quiz',
+                                  owner=current_user_key()),
+                'topic': topic_input,
+                'type': question_type_dropdown,
+                'blooms_level': blooms_taxonomy_level,
+                'num_questions': num_questions_slider,
+                'adaptive': adaptive_mode
+            }
+            st.rerun()
+    
+    if st.session_state.quiz_job:
+        quiz_job_status()
 
 # Phase 2: Take Quiz
 elif st.session_state.quiz_generated and not st.session_state.quiz_completed:
     if not st.session_state.quiz_started:
         st.header(f"📚 Quiz Ready: {st.session_state.quiz_topic}")
-        st.info(f"**Total Questions:** {len(st.session_state.quiz_questions)} | **Type:** {st.session_state.quiz_type}")
+        adaptive = st.session_state.adaptive_quiz
+        if adaptive is not None:
+            st.info(f"**Adaptive quiz:** up to {adaptive.max_questions} questions | **Type:** {st.session_state.quiz_type}")
+        else:
+            st.info(f"**Total Questions:** {len(load_quiz_questions())} | **Type:** {st.session_state.quiz_type}")
         
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             if st.button("🎯 Start Quiz", type="primary", use_container_width=True):
                 st.session_state.quiz_started = True
                 st.rerun()
-    else:
-        # Display current question
-        current_q_idx = st.session_state.current_question
-        total_questions = len(st.session_state.quiz_questions)
-        current_q = st.session_state.quiz_questions[current_q_idx]
-        
-        # Progress bar
-        progress = (current_q_idx + 1) / total_questions
-        st.progress(progress)
-        st.write(f"Question {current_q_idx + 1} of {total_questions}")
-        
-        # Question display
-        st.subheader(current_q['question'])
-        
-        # Answer input
-        if current_q['options'] and len(current_q['options']) > 0:
-            user_answer = st.radio("Choose your answer:", current_q['options'], key=f"q_{current_q_idx}")
-        else:
-            user_answer = st.text_input("Your answer:", key=f"q_{current_q_idx}")
-        
-        # Navigation buttons
-        col1, col2, col3 = st.columns([1, 1, 1])
         
-        with col1:
-            if current_q_idx > 0:
-                if st.button("⬅️ Previous"):
-                    st.session_state.current_question -= 1
-                    st.rerun()
-        
-        with col3:
-            if current_q_idx < total_questions - 1:
-                if st.button("➡️ Next"):
-                    st.session_state.user_answers[current_q_idx] = user_answer
-                    st.session_state.current_question += 1
-                    st.rerun()
-            else:
-                if st.button("✅ Submit Quiz", type="primary"):
-                    st.session_state.user_answers[current_q_idx] = user_answer
-                    st.session_state.quiz_completed = True
-                    st.rerun()
+        if adaptive is None:
+            exam_versions_panel()
+    else:
+        start_prefetch()
+        quiz_panel()
 
 # Phase 3: Show Results
 elif st.session_state.quiz_completed:
     st.header("🎉 Quiz Results")
     
-    quiz_questions = st.session_state.quiz_questions
+    quiz_questions = load_quiz_questions()
     user_answers = st.session_state.user_answers
-    score = 0
-    
-    # Prepare questions data with user answers for Firestore
-    questions_data = []
-    
-    # Calculate score and prepare data
-    for i, q in enumerate(quiz_questions):
-        user_ans = user_answers.get(i, "")
-        correct_ans = q['answer']
-        is_correct = False
-        
-        if q['options']:  # Multiple choice or True/False
-            # Extract the letter/option from the correct answer
-            if len(correct_ans) > 0:
-                if correct_ans.upper().startswith('A') or correct_ans.upper().startswith('B') or correct_ans.upper().startswith('C') or correct_ans.upper().startswith('D'):
-                    correct_letter = correct_ans[0].upper()
-                    user_letter = user_ans[0].upper() if user_ans else ""
-                    if correct_letter == user_letter:
-                        score += 1
-                        is_correct = True
-                elif user_ans.strip().lower() == correct_ans.strip().lower():
-                    score += 1
-                    is_correct = True
-        else:  # Short answer
-            if user_ans.strip().lower() == correct_ans.strip().lower():
-                score += 1
-                is_correct = True
-        
-        # Prepare question data for Firestore
-        questions_data.append({
-            'question': q['question'],
-            'options': q['options'],
-            'answer': q['answer'],
-            'explanation': q['explanation'],
-            'user_answer': user_ans,
-            'is_correct': is_correct
-        })
+    with metrics.span('grading', page='quiz', question_type=st.session_state.get('quiz_type')):
+        score, questions_data = grade_quiz(quiz_questions, user_answers)
+        saved_data = questions_data
+        if st.session_state.quiz_variant_id:
+            # Store the attempt against the original quiz so its answers line up across versions
+            canonical = contentstore.get(st.session_state.quiz_canonical_key)
+            canonical_answers = variants.to_canonical(canonical, st.session_state.quiz_variant_id, user_answers)
+            _, saved_data = grade_quiz(canonical, canonical_answers)
     
     # Display score
     percentage = (score / len(quiz_questions)) * 100
     st.metric("Your Score", f"{score}/{len(quiz_questions)}", f"{percentage:.1f}%")
+    adaptive = st.session_state.adaptive_quiz
+    if adaptive is not None:
+        st.metric("Estimated Ability", f"{adaptive.theta:+.2f}", help=f"Standard error ± {adaptive.se:.2f}; 0 is average")
     
     # Save to Firestore (if not already saved)
     if 'quiz_saved' not in st.session_state or not st.session_state.quiz_saved:
-        db, db_err = init_firestore()
+        db, db_err = backends.page_firestore()
         if db:
             topic = st.session_state.get('quiz_topic', 'Unknown')
             blooms_level = st.session_state.get('quiz_blooms_level', 'Unknown')
             
-            if save_quiz_attempt(db, topic, blooms_level, len(quiz_questions), score, percentage, questions_data):
+            if save_quiz_attempt(db, topic, blooms_level, len(quiz_questions), score, percentage, saved_data,
+                                 current_user_key(), question_type=st.session_state.get('quiz_type'),
+                                 display_name=identity.display_name(),
+                                 variant_id=st.session_state.quiz_variant_id,
+                                 ability=adaptive.theta if adaptive is not None else None):
                 st.session_state.quiz_saved = True
+                sync_progress()  # before anything else can interrupt, so no replica saves it twice
+                st.session_state.insights_stale = True
                 st.toast("✅ Quiz results saved to your insights!", icon="💾")
+                st.rerun()  # refresh sidebar stats with the new attempt
         # Don't show error if Firestore is not configured - it's optional
     
     if percentage >= 80:
@@ -490,21 +730,7 @@ elif st.session_state.quiz_completed:
             
             user_ans = user_answers.get(i, "No answer provided")
             correct_ans = q['answer']
-            
-            # Check if correct
-            is_correct = False
-            if q['options']:
-                if len(correct_ans) > 0:
-                    if correct_ans.upper().startswith('A') or correct_ans.upper().startswith('B') or correct_ans.upper().startswith('C') or correct_ans.upper().startswith('D'):
-                        correct_letter = correct_ans[0].upper()
-                        user_letter = user_ans[0].upper() if user_ans else ""
-                        if correct_letter == user_letter:
-                            is_correct = True
-                    elif user_ans.strip().lower() == correct_ans.strip().lower():
-                        is_correct = True
-            else:
-                if user_ans.strip().lower() == correct_ans.strip().lower():
-                    is_correct = True
+            is_correct = questions_data[i]['is_correct']
             
             if is_correct:
                 st.success(f"✅ Your answer: {user_ans}")
@@ -518,6 +744,18 @@ elif st.session_state.quiz_completed:
     st.divider()
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
+        next_quiz = prefetch.peek(current_user_key())
         if st.button("🔄 Create New Quiz", type="primary", use_container_width=True):
             reset_quiz()
-            st.rerun()
\ No newline at end of file
+            slot = prefetch.claim(current_user_key())
+            if slot is not None:
+                # Hand the prefetched job to the normal polling path
+                st.session_state.quiz_job = {'id': slot.job_id, **slot.params}
+            st.rerun()
+        
+        if next_quiz is not None:
+            st.caption(f"⚡ Next up: {next_quiz.params['topic']} · {next_quiz.params['blooms_level']}")
+            if st.button("✏️ Choose a Different Topic", use_container_width=True):
+                prefetch.discard(current_user_key(), reason='declined')
+                reset_quiz()
+                st.rerun()
\ No newline at end of file
@@ -0,0 +1 @@
+"""Shared helpers for the Edugenie Streamlit pages"""
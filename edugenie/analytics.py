@@ -0,0 +1,303 @@
+"""
+Learning analytics rollups without downloading raw attempts.
+
+Two interchangeable backends answer the same questions:
+
+- FirestoreAnalytics runs count/sum/avg aggregation queries on quiz_attempts,
+  one per group (topic, Bloom's level, week). Firestore bills aggregations per
+  batch of index entries rather than per document, and nothing but the numbers
+  leaves the server.
+- SQLAnalytics keeps a local SQLite copy of attempts (EDUGENIE_ANALYTICS_DB)
+  and answers with GROUP BY queries.
+
+get_analytics() picks the backend; its results are cached for
+EDUGENIE_ANALYTICS_TTL_SECONDS, and the last good result is served past that
+while Firestore is failing or its circuit breaker is open. Every method takes an
+optional user_id; without it the rollup is class-wide.
+
+Firestore needs composite indexes on quiz_attempts for the per-student
+rollups: (user_id, topic_key), (user_id, blooms_level) and (user_id, timestamp).
+"""
+import datetime
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+from edugenie import breakers, cache, metrics, topics
+from edugenie.counters import Increment
+from edugenie.quizzes import BLOOMS_LEVELS
+
+ANALYTICS_DB = os.getenv('EDUGENIE_ANALYTICS_DB', '')
+ANALYTICS_TTL = float(os.getenv('EDUGENIE_ANALYTICS_TTL_SECONDS', '60'))
+TOPIC_SAMPLE_SIZE = int(os.getenv('EDUGENIE_ANALYTICS_TOPIC_SAMPLE', '200'))
+LEADERBOARD_COLLECTION = 'leaderboard'
+
+_results = cache.get_cache('analytics', maxsize=1024, ttl=ANALYTICS_TTL)
+_last_good = cache.get_cache('analytics_last_good', maxsize=1024)
+
+
+def week_start(moment):
+    """Monday 00:00 of the week containing `moment`"""
+    day = moment.date() if isinstance(moment, datetime.datetime) else moment
+    return datetime.datetime.combine(day - datetime.timedelta(days=day.weekday()), datetime.time())
+
+
+def _rollup(attempts, questions, correct, score_sum):
+    attempts = attempts or 0
+    return {
+        'attempts': attempts,
+        'questions': questions or 0,
+        'correct': correct or 0,
+        'accuracy': (correct or 0) / questions * 100 if questions else 0.0,
+        'average_score': (score_sum or 0) / attempts if attempts else 0.0,
+    }
+
+
+def leaderboard_update(db, user_id, display_name, total_questions, correct_answers, batch):
+    """Add one attempt to the student's leaderboard entry as part of `batch`
+
+    One write per finished quiz per student, far below the per-document limit.
+    """
+    ref = db.collection(LEADERBOARD_COLLECTION).document(user_id)
+    batch.set(ref, {
+        'user_id': user_id,
+        'display_name': display_name,
+        'points': Increment(correct_answers),
+        'questions': Increment(total_questions),
+        'attempts': Increment(1),
+    }, merge=True)
+
+
+class FirestoreAnalytics:
+    name = 'firestore'
+
+    def __init__(self, db):
+        self.db = db
+
+    def _attempts(self, user_id=None):
+        query = self.db.collection('quiz_attempts')
+        if user_id:
+            query = query.where('user_id', '==', user_id)
+        return query
+
+    def _aggregate(self, query):
+        aggregation = (query.count(alias='attempts')
+                       .sum('total_questions', alias='questions')
+                       .sum('correct_answers', alias='correct')
+                       .sum('score_percentage', alias='score_sum'))
+        with metrics.span('analytics_aggregate', backend=self.name):
+            values = {result.alias: result.value for result in aggregation.get()[0]}
+        return _rollup(values.get('attempts'), values.get('questions'), values.get('correct'), values.get('score_sum'))
+
+    def overview(self, user_id=None):
+        return self._aggregate(self._attempts(user_id))
+
+    def by_topic(self, user_id=None, limit=10):
+        # Aggregations have no GROUP BY: find the active topics from a small
+        # projection of recent attempts, then aggregate each one
+        sample = (self._attempts(user_id)
+                  .order_by('timestamp', direction='DESCENDING')
+                  .limit(TOPIC_SAMPLE_SIZE)
+                  .select(['topic', 'topic_key']))
+        counts, names = Counter(), {}
+        for doc in sample.stream():
+            data = doc.to_dict()
+            key = data.get('topic_key') or topics.topic_key(data.get('topic', ''))
+            counts[key] += 1
+            names.setdefault(key, data.get('topic') or key)
+        rows = []
+        for key, _ in counts.most_common(limit):
+            row = self._aggregate(self._attempts(user_id).where('topic_key', '==', key))
+            rows.append(dict(row, topic=names[key]))
+        return rows
+
+    def by_blooms_level(self, user_id=None):
+        rows = []
+        for level in BLOOMS_LEVELS:
+            row = self._aggregate(self._attempts(user_id).where('blooms_level', '==', level))
+            if row['attempts']:
+                rows.append(dict(row, blooms_level=level))
+        return rows
+
+    def weekly_trend(self, user_id=None, weeks=8, now=None):
+        current = week_start(now or datetime.datetime.utcnow())
+        rows = []
+        for offset in range(weeks - 1, -1, -1):
+            start = current - datetime.timedelta(weeks=offset)
+            query = (self._attempts(user_id)
+                     .where('timestamp', '>=', start)
+                     .where('timestamp', '<', start + datetime.timedelta(weeks=1)))
+            rows.append(dict(self._aggregate(query), week_start=start.date()))
+        return rows
+
+    def leaderboard(self, limit=10):
+        query = (self.db.collection(LEADERBOARD_COLLECTION)
+                 .order_by('points', direction='DESCENDING')
+                 .limit(limit))
+        rows = []
+        for doc in query.stream():
+            data = doc.to_dict()
+            rows.append({
+                'user_id': data.get('user_id', doc.id),
+                'display_name': data.get('display_name'),
+                'points': data.get('points', 0),
+                'attempts': data.get('attempts', 0),
+                'accuracy': data.get('points', 0) / data['questions'] * 100 if data.get('questions') else 0.0,
+            })
+        return rows
+
+
+class SQLAnalytics:
+    """Analytics over a local SQLite store fed by record_attempt()"""
+
+    name = 'sql'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS quiz_attempts (
+            user_id TEXT NOT NULL,
+            display_name TEXT,
+            topic TEXT,
+            topic_key TEXT,
+            blooms_level TEXT,
+            question_type TEXT,
+            total_questions INTEGER NOT NULL,
+            correct_answers INTEGER NOT NULL,
+            score_percentage REAL NOT NULL,
+            timestamp TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS attempts_user_time ON quiz_attempts (user_id, timestamp);
+        CREATE INDEX IF NOT EXISTS attempts_topic ON quiz_attempts (topic_key);
+    """
+
+    AGGREGATES = "COUNT(*), SUM(total_questions), SUM(correct_answers), SUM(score_percentage)"
+
+    def __init__(self, path=':memory:'):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript(self.SCHEMA)
+
+    def record_attempt(self, user_id, topic, blooms_level, question_type, total_questions,
+                       correct_answers, score_percentage, timestamp, display_name=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO quiz_attempts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, display_name, topic, topics.topic_key(topic), blooms_level, question_type,
+                 total_questions, correct_answers, score_percentage, timestamp.isoformat()),
+            )
+            self._conn.commit()
+
+    def _query(self, sql, params=()):
+        with metrics.span('analytics_aggregate', backend=self.name):
+            with self._lock:
+                return self._conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _where(user_id, *clauses):
+        conditions = list(clauses)
+        params = []
+        if user_id:
+            conditions.insert(0, "user_id = ?")
+            params.append(user_id)
+        return ("WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def overview(self, user_id=None):
+        where, params = self._where(user_id)
+        (row,) = self._query(f"SELECT {self.AGGREGATES} FROM quiz_attempts {where}", params)
+        return _rollup(*row)
+
+    def by_topic(self, user_id=None, limit=10):
+        where, params = self._where(user_id)
+        rows = self._query(
+            f"SELECT MIN(topic), {self.AGGREGATES} FROM quiz_attempts {where} "
+            f"GROUP BY topic_key ORDER BY COUNT(*) DESC LIMIT ?", params + [limit])
+        return [dict(_rollup(*row[1:]), topic=row[0]) for row in rows]
+
+    def by_blooms_level(self, user_id=None):
+        where, params = self._where(user_id)
+        rows = dict((row[0], row[1:]) for row in self._query(
+            f"SELECT blooms_level, {self.AGGREGATES} FROM quiz_attempts {where} GROUP BY blooms_level", params))
+        return [dict(_rollup(*rows[level]), blooms_level=level) for level in BLOOMS_LEVELS if level in rows]
+
+    def weekly_trend(self, user_id=None, weeks=8, now=None):
+        current = week_start(now or datetime.datetime.utcnow())
+        first = current - datetime.timedelta(weeks=weeks - 1)
+        where, params = self._where(user_id, "timestamp >= ?")
+        # SQLite's weekday 0 is Sunday; shift so weeks start on Monday
+        rows = dict((row[0], row[1:]) for row in self._query(
+            f"SELECT date(timestamp, '-6 days', 'weekday 1'), {self.AGGREGATES} FROM quiz_attempts {where} "
+            f"GROUP BY 1", params + [first.isoformat()]))
+        trend = []
+        for offset in range(weeks):
+            start = (first + datetime.timedelta(weeks=offset)).date()
+            trend.append(dict(_rollup(*rows.get(start.isoformat(), (0, 0, 0, 0))), week_start=start))
+        return trend
+
+    def leaderboard(self, limit=10):
+        rows = self._query(
+            "SELECT user_id, MAX(display_name), SUM(correct_answers), COUNT(*), SUM(total_questions) "
+            "FROM quiz_attempts GROUP BY user_id ORDER BY SUM(correct_answers) DESC LIMIT ?", (limit,))
+        return [{
+            'user_id': user_id,
+            'display_name': display_name,
+            'points': points,
+            'attempts': attempts,
+            'accuracy': points / questions * 100 if questions else 0.0,
+        } for user_id, display_name, points, attempts, questions in rows]
+
+
+_local_store = None
+_local_lock = threading.Lock()
+
+
+def local_store():
+    """The SQLite store when EDUGENIE_ANALYTICS_DB is set, else None"""
+    global _local_store
+    if not ANALYTICS_DB:
+        return None
+    with _local_lock:
+        if _local_store is None:
+            _local_store = SQLAnalytics(ANALYTICS_DB)
+        return _local_store
+
+
+def record_attempt(*args, **kwargs):
+    """Mirror a saved attempt into the local store, if one is configured"""
+    store = local_store()
+    if store is not None:
+        store.record_attempt(*args, **kwargs)
+
+
+def get_analytics(db):
+    """The local SQL backend if configured, else Firestore aggregations over `db`"""
+    return local_store() or FirestoreAnalytics(db)
+
+
+def cached(backend, method, *args, **kwargs):
+    """backend.method(*args, **kwargs), cached for EDUGENIE_ANALYTICS_TTL_SECONDS
+
+    If the backend fails, the last good result is returned instead, when there is one.
+    """
+    key = cache.make_key(backend.name, method, args, kwargs)
+    result = _results.get(key)
+    if result is None:
+        try:
+            if backend.name == 'firestore':
+                with breakers.guard('firestore'):
+                    result = getattr(backend, method)(*args, **kwargs)
+            else:
+                result = getattr(backend, method)(*args, **kwargs)
+        except Exception:
+            result = _last_good.get(key)
+            if result is None:
+                raise
+            metrics.inc('edugenie_analytics_stale_total', method=method)
+            return result
+        _results.set(key, result)
+        _last_good.set(key, result)
+    return result
+
+
+def clear_cache():
+    _results.clear()
@@ -0,0 +1,155 @@
+"""
+Selects real or local stand-in backends for Gemini and Firestore.
+
+Set EDUGENIE_OFFLINE=1 to run both pages without credentials against the fakes
+in edugenie.fakes. Optional tuning for the fakes:
+    EDUGENIE_FAKE_LATENCY            - seconds per Gemini call
+    EDUGENIE_FAKE_LATENCY_JITTER     - extra random seconds per Gemini call
+    EDUGENIE_FAKE_ERROR_RATE         - probability a Gemini call fails
+    EDUGENIE_FAKE_SEED               - seed for synthesized output
+    EDUGENIE_FAKE_RECORDINGS         - JSON file of recorded responses
+    EDUGENIE_FAKE_MAX_OUTPUT_CHARS   - truncate output and report MAX_TOKENS
+    EDUGENIE_FAKE_FIRESTORE_LATENCY  - seconds per Firestore round trip
+"""
+import json
+import os
+import threading
+
+from edugenie import fakes
+
+try:
+    import google.generativeai as genai
+except Exception:
+    genai = None
+
+_lock = threading.Lock()
+_fake_db = None
+_page_db = None
+_recordings = None
+
+
+def is_offline():
+    """True when the pages should use the local stand-ins"""
+    return os.getenv('EDUGENIE_OFFLINE', '').strip().lower() in ('1', 'true', 'yes')
+
+
+def _env_float(name, default=0.0):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _load_recordings():
+    global _recordings
+    with _lock:
+        if _recordings is None:
+            path = os.getenv('EDUGENIE_FAKE_RECORDINGS')
+            _recordings = fakes.load_recordings(path) if path and os.path.exists(path) else {}
+        return _recordings
+
+
+def configure_gemini():
+    """Configure the Gemini SDK from GEMINI_API_KEY for command-line tools (no-op offline)"""
+    if is_offline():
+        return
+    if genai is None:
+        raise RuntimeError("google.generativeai not installed")
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY is not set")
+    genai.configure(api_key=api_key)
+
+
+def get_model(model_name):
+    """Gemini model for `model_name`, or the fake when offline"""
+    if is_offline():
+        return fakes.FakeGenerativeModel(
+            model_name,
+            latency=_env_float('EDUGENIE_FAKE_LATENCY'),
+            latency_jitter=_env_float('EDUGENIE_FAKE_LATENCY_JITTER'),
+            error_rate=_env_float('EDUGENIE_FAKE_ERROR_RATE'),
+            recordings=_load_recordings(),
+            seed=int(_env_float('EDUGENIE_FAKE_SEED')),
+            max_output_chars=int(_env_float('EDUGENIE_FAKE_MAX_OUTPUT_CHARS')) or None,
+        )
+    if genai is None:
+        raise RuntimeError("google.generativeai not installed")
+    return genai.GenerativeModel(model_name)
+
+
+def get_fake_firestore():
+    """Process-wide in-memory Firestore shared by all sessions and pages"""
+    global _fake_db
+    with _lock:
+        if _fake_db is None:
+            _fake_db = fakes.FakeFirestoreClient(latency=_env_float('EDUGENIE_FAKE_FIRESTORE_LATENCY'))
+        return _fake_db
+
+
+def get_firestore(credentials_info=None):
+    """Firestore client for command-line tools and pages, or the fake when offline
+
+    Uses `credentials_info` (a service account dict, e.g. from st.secrets),
+    FIREBASE_CREDENTIALS_JSON or FIREBASE_CREDENTIALS_PATH, falling back to
+    application default credentials. With FIRESTORE_EMULATOR_HOST set, connects
+    to the local emulator instead.
+    """
+    if os.getenv('FIRESTORE_EMULATOR_HOST'):
+        from google.cloud import firestore as cloud_firestore
+        return cloud_firestore.Client(project=os.getenv('GOOGLE_CLOUD_PROJECT', 'edugenie-local'))
+    if is_offline():
+        return get_fake_firestore()
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    with _lock:
+        if not firebase_admin._apps:
+            cred_json = os.getenv('FIREBASE_CREDENTIALS_JSON')
+            cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH')
+            if credentials_info:
+                firebase_admin.initialize_app(credentials.Certificate(credentials_info))
+            elif cred_json:
+                firebase_admin.initialize_app(credentials.Certificate(json.loads(cred_json)))
+            elif cred_path:
+                firebase_admin.initialize_app(credentials.Certificate(cred_path))
+            else:
+                firebase_admin.initialize_app()
+    return firestore.client()
+
+
+def page_firestore():
+    """(Firestore client, None) for the Streamlit pages, or (None, error)
+
+    Credentials come from st.secrets['firebase_credentials'],
+    FIREBASE_CREDENTIALS_JSON or FIREBASE_CREDENTIALS_PATH; unlike
+    get_firestore() there is no fallback to application default credentials,
+    so a page without any reports that instead. The client is shared by every
+    session, and the first one starts the usage flusher.
+    """
+    global _page_db
+    if _page_db is not None:
+        return _page_db, None
+
+    import streamlit as st
+    from edugenie import usage
+
+    try:
+        info = dict(st.secrets['firebase_credentials']) if 'firebase_credentials' in st.secrets else None
+    except Exception:  # no secrets file
+        info = None
+    cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH')
+    configured = (info or os.getenv('FIREBASE_CREDENTIALS_JSON') or (cred_path and os.path.exists(cred_path))
+                  or os.getenv('FIRESTORE_EMULATOR_HOST'))
+    if not is_offline() and not configured:
+        return None, "No Firebase credentials found"
+    try:
+        db = get_firestore(info)
+    except ImportError:
+        return None, "firebase-admin not installed"
+    except Exception as e:
+        return None, f"Firebase initialization failed: {e}"
+    usage.start_flusher(db)
+    _page_db = db
+    return db, None
@@ -0,0 +1,221 @@
+"""
+Question bank built from questions already stored with quiz attempts.
+
+save_quiz_attempt() writes every question to quiz_attempts/{id}/questions
+together with its normalized topic, Bloom's level, question type, user ID and
+a content key. The bank reads them back with one collection-group query per
+(topic, level, type), deduplicates by content key and keeps the result in a
+process-wide cache; questions saved in this process are added to the cached
+bank straight away.
+
+Questions stored before these fields existed can be indexed with
+
+    python -m edugenie.bank --backfill
+
+Collection-group queries need the single-field indexes on `topic_key`,
+`blooms_level`, `question_type` and `user_id` enabled for the `questions`
+collection group in the Firebase console.
+"""
+import argparse
+import hashlib
+import os
+import random
+import re
+
+from edugenie import breakers, cache, metrics, topics
+
+BANK_TTL = float(os.getenv('EDUGENIE_BANK_TTL_SECONDS', '600'))
+LOAD_LIMIT = int(os.getenv('EDUGENIE_BANK_LOAD_LIMIT', '500'))
+BANK_METRIC = 'edugenie_question_bank_questions_total'
+
+_banks = cache.get_cache('question_bank', maxsize=1024, ttl=BANK_TTL)
+_seen = cache.get_cache('question_bank_seen', maxsize=4096, ttl=BANK_TTL)
+
+_NUMBER_PREFIX = re.compile(r'^\s*(?:question\s*)?\d+\s*[.):]\s*', re.IGNORECASE)
+
+
+def strip_number(text):
+    """Question text without its leading "3." / "Question 3:" numbering"""
+    return _NUMBER_PREFIX.sub('', text or '', count=1).strip()
+
+
+def question_key(text):
+    """Content key of a question, ignoring numbering, case and punctuation"""
+    normalized = ' '.join(re.findall(r'\w+', strip_number(text).casefold()))
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def bank_key(topic, blooms_level, question_type):
+    return cache.make_key(topics.topic_key(topic), blooms_level, question_type)
+
+
+def infer_question_type(options):
+    """Question type of a stored question that predates the question_type field"""
+    options = options or []
+    if not options:
+        return 'Short Answer'
+    if [o.strip().lower() for o in options] == ['true', 'false']:
+        return 'True/False'
+    return 'Multiple Choice'
+
+
+def index_fields(topic, blooms_level, question_type, question_text, user_id=None):
+    """Fields stored on each question document so the bank can query it"""
+    return {
+        'topic': topic,
+        'topic_key': topics.topic_key(topic),
+        'blooms_level': blooms_level,
+        'question_type': question_type,
+        'question_key': question_key(question_text),
+        'user_id': user_id,
+    }
+
+
+def from_document(data):
+    """Quiz question dict from a stored question document, or None if it is incomplete"""
+    text = strip_number(data.get('question_text', ''))
+    options = list(data.get('options') or [])
+    answer = (data.get('correct_answer') or '').strip()
+    if not text or not answer:
+        return None
+    question_type = data.get('question_type') or infer_question_type(options)
+    if question_type == 'Multiple Choice' and len(options) < 4:
+        return None
+    return {
+        'question': text,
+        'options': options,
+        'answer': answer,
+        'explanation': data.get('explanation', ''),
+    }
+
+
+def _dedupe(questions, exclude=()):
+    keys = set(exclude)
+    unique = []
+    for question in questions:
+        key = question_key(question['question'])
+        if key not in keys:
+            keys.add(key)
+            unique.append(question)
+    return unique
+
+
+def load(db, topic, blooms_level, question_type):
+    """Deduplicated stored questions for (topic, level, type), cached per process"""
+    key = bank_key(topic, blooms_level, question_type)
+    questions = _banks.get(key)
+    if questions is not None:
+        return questions
+
+    with breakers.guard('firestore'), metrics.span('question_bank_load', page='quiz', question_type=question_type):
+        query = (db.collection_group('questions')
+                 .where('topic_key', '==', topics.topic_key(topic))
+                 .where('blooms_level', '==', blooms_level)
+                 .where('question_type', '==', question_type)
+                 .limit(LOAD_LIMIT))
+        docs = [from_document(doc.to_dict()) for doc in query.stream()]
+    questions = _dedupe(q for q in docs if q)
+    _banks.set(key, questions)
+    return questions
+
+
+def add(topic, blooms_level, question_type, questions):
+    """Merge newly saved questions into the cached bank, if it is loaded"""
+    key = bank_key(topic, blooms_level, question_type)
+    current = _banks.get(key)
+    if current is not None:
+        fresh = [{
+            'question': strip_number(q['question']),
+            'options': list(q.get('options') or []),
+            'answer': q.get('answer', ''),
+            'explanation': q.get('explanation', ''),
+        } for q in questions]
+        _banks.set(key, current + _dedupe(fresh, exclude=(question_key(q['question']) for q in current)))
+
+
+def seen_keys(db, user_id, topic):
+    """Content keys of the questions this user has already been shown for a topic"""
+    key = cache.make_key(user_id, topics.topic_key(topic))
+    keys = _seen.get(key)
+    if keys is None:
+        keys = set()
+        if db is not None and user_id:
+            query = (db.collection_group('questions')
+                     .where('user_id', '==', user_id)
+                     .where('topic_key', '==', topics.topic_key(topic)))
+            keys = {doc.to_dict().get('question_key') for doc in query.stream()}
+            keys.discard(None)
+        _seen.set(key, keys)
+    return keys
+
+
+def mark_seen(user_id, topic, questions):
+    """Remember that this user has been shown `questions`"""
+    key = cache.make_key(user_id, topics.topic_key(topic))
+    keys = set(_seen.get(key) or ())
+    keys.update(question_key(q['question']) for q in questions)
+    _seen.set(key, keys)
+
+
+def draw(db, topic, blooms_level, question_type, count, user_id=None, rng=None):
+    """Up to `count` banked questions the user has not seen, in random order
+
+    Firestore errors are counted and treated as an empty bank, so generation
+    still goes ahead.
+    """
+    try:
+        questions = load(db, topic, blooms_level, question_type)
+        seen = seen_keys(db, user_id, topic) if user_id else set()
+    except Exception:
+        metrics.inc('edugenie_question_bank_errors_total')
+        return []
+
+    unseen = [q for q in questions if question_key(q['question']) not in seen]
+    picked = (rng or random).sample(unseen, min(count, len(unseen)))
+    return [dict(q) for q in picked]
+
+
+def renumber(questions):
+    """Copies of `questions` numbered 1..n in order"""
+    return [dict(q, question=f"{idx}. {strip_number(q['question'])}") for idx, q in enumerate(questions, 1)]
+
+
+def backfill(db, batch_size=400):
+    """Add the bank fields to stored questions that lack them; returns the number updated"""
+    updated = 0
+    batch, pending = db.batch(), 0
+    for attempt in db.collection('quiz_attempts').stream():
+        data = attempt.to_dict()
+        for doc in attempt.reference.collection('questions').stream():
+            question = doc.to_dict()
+            if question.get('question_key'):
+                continue
+            question_type = data.get('question_type') or infer_question_type(question.get('options'))
+            fields = index_fields(data.get('topic', ''), data.get('blooms_level', ''), question_type,
+                                  question.get('question_text', ''), user_id=data.get('user_id'))
+            batch.set(doc.reference, fields, merge=True)
+            pending += 1
+            updated += 1
+            if pending >= batch_size:
+                batch.commit()
+                batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+    return updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the Edugenie question bank")
+    parser.add_argument('--backfill', action='store_true',
+                        help="index stored questions saved before the bank existed")
+    args = parser.parse_args(argv)
+    if not args.backfill:
+        parser.print_help()
+        return
+
+    from edugenie import backends
+    print(f"Indexed {backfill(backends.get_firestore())} stored questions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Circuit breakers for Gemini and Firestore.
+
+One breaker per dependency is shared by every session in the process. A breaker
+is closed while calls succeed. Once at least EDUGENIE_BREAKER_MIN_CALLS calls in
+the last EDUGENIE_BREAKER_WINDOW_SECONDS have failed at a rate of
+EDUGENIE_BREAKER_FAILURE_RATE or more, it opens and every call fails
+immediately with CircuitOpenError instead of waiting on timeouts. After
+EDUGENIE_BREAKER_OPEN_SECONDS it lets a single probe call through (half-open):
+success closes it, failure opens it for another period.
+
+    with breakers.guard('firestore'):
+        ...
+
+Metrics: edugenie_circuit_state{dependency} (0 closed, 1 half-open, 2 open),
+edugenie_circuit_transitions_total{dependency,state} and
+edugenie_circuit_rejected_total{dependency}.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from edugenie import metrics
+
+FAILURE_RATE = float(os.getenv('EDUGENIE_BREAKER_FAILURE_RATE', '0.5'))
+MIN_CALLS = int(os.getenv('EDUGENIE_BREAKER_MIN_CALLS', '5'))
+WINDOW_SECONDS = float(os.getenv('EDUGENIE_BREAKER_WINDOW_SECONDS', '60'))
+OPEN_SECONDS = float(os.getenv('EDUGENIE_BREAKER_OPEN_SECONDS', '30'))
+STATE_METRIC = 'edugenie_circuit_state'
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+DEPENDENCY_NAMES = {'gemini': 'Gemini', 'firestore': 'Firestore', 'shared_state': 'Shared state'}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+    def __init__(self, name, retry_in):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"{DEPENDENCY_NAMES.get(name, name)} is temporarily unavailable; "
+                         f"retrying in {max(1, round(retry_in))}s")
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker with a half-open probe"""
+
+    def __init__(self, name, failure_rate=FAILURE_RATE, min_calls=MIN_CALLS, window=WINDOW_SECONDS,
+                 open_seconds=OPEN_SECONDS, clock=time.monotonic):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outcomes = deque()  # (time, ok)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        metrics.set_gauge(STATE_METRIC, STATE_VALUES[CLOSED], dependency=name)
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def retry_in(self):
+        """Seconds until an open breaker lets a probe through (0 if it would now)"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.open_seconds - self._clock())
+
+    def rejecting(self):
+        """True while calls would be refused without a probe, i.e. open and cooling down"""
+        return self.retry_in() > 0
+
+    def _set_state_locked(self, state):
+        self._state = state
+        if state == OPEN:
+            self._opened_at = self._clock()
+        if state == CLOSED:
+            self._outcomes.clear()
+        metrics.set_gauge(STATE_METRIC, STATE_VALUES[state], dependency=self.name)
+        metrics.inc('edugenie_circuit_transitions_total', dependency=self.name, state=state)
+
+    def allow(self):
+        """Reserve a call; returns True if it may go ahead
+
+        A True from a half-open breaker is the probe and must be followed by
+        record_success() or record_failure().
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+                self._set_state_locked(HALF_OPEN)
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+        metrics.inc('edugenie_circuit_rejected_total', dependency=self.name)
+        return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = False
+                self._set_state_locked(CLOSED)
+            elif self._state == CLOSED:
+                self._outcomes.append((self._clock(), True))
+                self._trim_locked()
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = False
+                self._set_state_locked(OPEN)
+            elif self._state == CLOSED:
+                self._outcomes.append((self._clock(), False))
+                self._trim_locked()
+                failures = sum(1 for _, ok in self._outcomes if not ok)
+                if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                    self._set_state_locked(OPEN)
+
+    def _trim_locked(self):
+        horizon = self._clock() - self.window
+        while self._outcomes and self._outcomes[0][0] < horizon:
+            self._outcomes.popleft()
+
+    @contextmanager
+    def guard(self):
+        """Run the block as one call through the breaker"""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_in())
+        try:
+            yield
+        except CircuitOpenError:
+            # Another dependency's breaker; says nothing about this one
+            self._release()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+
+    def _release(self):
+        with self._lock:
+            self._probing = False
+
+    def reset(self):
+        with self._lock:
+            self._probing = False
+            self._set_state_locked(CLOSED)
+
+
+_lock = threading.Lock()
+_breakers = {}
+
+
+def get(name):
+    """The process-wide breaker for a dependency, created on first use"""
+    with _lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def guard(name):
+    return get(name).guard()
+
+
+def outage_messages():
+    """A user-facing notice for every dependency whose breaker is open"""
+    with _lock:
+        breakers = list(_breakers.values())
+    return [f"⚠️ {DEPENDENCY_NAMES.get(b.name, b.name)} is having trouble, so some features are paused. "
+            f"Retrying in {max(1, round(b.retry_in()))}s."
+            for b in breakers if b.rejecting()]
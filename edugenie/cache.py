@@ -0,0 +1,124 @@
+"""
+Process-level caches shared by all Streamlit sessions.
+
+Page scripts are re-executed on every rerun, so anything that must outlive a
+single run lives here rather than in the page module. Caches created with
+shared=True also read and write through to the replicas' shared state (see
+edugenie.sharedstate) when one is configured; their values must be JSON.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from edugenie import sharedstate
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional per-entry TTL in seconds"""
+
+    def __init__(self, maxsize=256, ttl=None, shared_name=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared_name = shared_name
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return _MISSING
+
+    def get(self, key, default=None):
+        value = self._get_local(key)
+        if value is _MISSING and self.shared_name:
+            value = self._get_shared([key]).get(key, _MISSING)
+        return default if value is _MISSING else value
+
+    def get_many(self, keys):
+        """{key: value} for the keys present; shared misses are fetched in one round trip"""
+        found = {}
+        for key in keys:
+            value = self._get_local(key)
+            if value is not _MISSING:
+                found[key] = value
+        missing = [key for key in keys if key not in found]
+        if missing and self.shared_name:
+            found.update(self._get_shared(missing))
+        return found
+
+    def _get_shared(self, keys):
+        found = sharedstate.get_many([f"cache:{self.shared_name}:{key}" for key in keys])
+        values = {}
+        for key in keys:
+            value = found.get(f"cache:{self.shared_name}:{key}", _MISSING)
+            if value is not _MISSING:
+                self._set_local(key, value, None)
+                values[key] = value
+        return values
+
+    def _set_local(self, key, value, ttl):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def set(self, key, value, ttl=None):
+        self._set_local(key, value, ttl)
+        if self.shared_name:
+            shared_ttl = (self.ttl if ttl is None else ttl) or sharedstate.CACHE_TTL
+            sharedstate.set_many({f"cache:{self.shared_name}:{key}": value}, ttl=shared_ttl)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name, maxsize=256, ttl=None, shared=False):
+    """Named process-wide cache; created on first use
+
+    With `shared`, entries are also kept in the replicas' shared state when
+    one is configured.
+    """
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = _caches[name] = LRUCache(maxsize=maxsize, ttl=ttl, shared_name=name if shared else None)
+        return cache
+
+
+def make_key(*parts):
+    """Stable hash key for a tuple of JSON-serializable parts"""
+    raw = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
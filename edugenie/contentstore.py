@@ -0,0 +1,260 @@
+"""
+Process-level store for large session payloads.
+
+Generated study material and quiz questions are kept here instead of in each
+session's state; the session only holds the content key. Values are stored
+JSON-encoded and zlib-compressed under the SHA-256 of their encoding, so
+sessions with the same content share one copy and every get() returns a
+fresh object that callers may change freely.
+
+The in-memory tier is an LRU bounded to EDUGENIE_CONTENT_STORE_MEMORY_MB;
+entries it evicts spill to files in EDUGENIE_CONTENT_STORE_DIR, itself bounded
+to EDUGENIE_CONTENT_STORE_DISK_MB (oldest files go first). Pages call touch()
+on every run with the keys their session references. A reaper thread drops
+sessions idle for EDUGENIE_SESSION_IDLE_SECONDS and deletes entries that no
+live session references and nobody has read for that long, so abandoned tabs
+stop costing memory or disk. A session whose content has been reaped gets
+None back and starts over.
+
+With shared state configured (see edugenie.sharedstate) new entries are also
+written there, and a key missing locally is looked up there before giving
+up, so a session that reconnects to another replica keeps its content.
+
+Metrics: edugenie_content_store_bytes{tier}, edugenie_content_store_sessions,
+edugenie_content_store_requests_total{result}.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from edugenie import metrics, sharedstate
+
+MEMORY_BYTES = int(float(os.getenv('EDUGENIE_CONTENT_STORE_MEMORY_MB', '64')) * 1024 * 1024)
+DISK_BYTES = int(float(os.getenv('EDUGENIE_CONTENT_STORE_DISK_MB', '1024')) * 1024 * 1024)
+STORE_DIR = os.getenv('EDUGENIE_CONTENT_STORE_DIR') or os.path.join(tempfile.gettempdir(), 'edugenie-content')
+IDLE_SECONDS = float(os.getenv('EDUGENIE_SESSION_IDLE_SECONDS', '1800'))
+REAP_INTERVAL = float(os.getenv('EDUGENIE_SESSION_REAP_SECONDS', '60'))
+
+
+def encode(value):
+    return zlib.compress(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8'), 1)
+
+
+def decode(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+class ContentStore:
+    """Content-addressed LRU with a disk spill tier and per-session pins"""
+
+    def __init__(self, directory=STORE_DIR, memory_bytes=MEMORY_BYTES, disk_bytes=DISK_BYTES,
+                 idle_seconds=IDLE_SECONDS, clock=time.monotonic):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.idle_seconds = idle_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()   # key -> blob, least recently used first
+        self._memory_size = 0
+        self._disk = None              # key -> size, oldest first; scanned on first use
+        self._disk_size = 0
+        self._last_used = {}           # key -> clock time of the last put/get
+        self._sessions = {}            # session id -> (last seen, keys)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def _load_disk_index_locked(self):
+        if self._disk is not None:
+            return
+        self._disk = OrderedDict()
+        try:
+            entries = [(entry.stat().st_mtime, entry.name[:-4], entry.stat().st_size)
+                       for entry in os.scandir(self.directory) if entry.name.endswith('.bin')]
+        except FileNotFoundError:
+            entries = []
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+
+    def put(self, value):
+        """Store `value` (anything JSON-serializable); returns its key"""
+        blob = encode(value)
+        key = hashlib.sha256(blob).hexdigest()
+        with self._lock:
+            self._last_used[key] = self._clock()
+            self._load_disk_index_locked()
+            is_new = key not in self._memory and key not in self._disk
+            if key in self._memory:
+                self._memory.move_to_end(key)
+            else:
+                self._memory[key] = blob
+                self._memory_size += len(blob)
+                self._evict_memory_locked()
+        if is_new:
+            sharedstate.set_many({f"content:{key}": blob}, ttl=sharedstate.PROGRESS_TTL, raw=True)
+        self._report()
+        return key
+
+    def get(self, key, default=None):
+        """The value stored under `key`, or `default` if it was never stored or has been reaped"""
+        if not key:
+            return default
+        with self._lock:
+            blob = self._memory.get(key)
+            if blob is not None:
+                self._memory.move_to_end(key)
+                self._last_used[key] = self._clock()
+                tier = 'memory'
+            else:
+                blob = self._read_disk_locked(key)
+                tier = 'disk' if blob is not None else 'miss'
+                if blob is not None:
+                    # Promote; the disk copy stays, so evicting it again costs no write
+                    self._promote_locked(key, blob)
+        if blob is None:
+            blob = sharedstate.get_many([f"content:{key}"], raw=True).get(f"content:{key}")
+            if blob is not None:
+                tier = 'shared'
+                with self._lock:
+                    if key not in self._memory:
+                        self._promote_locked(key, blob)
+        metrics.inc('edugenie_content_store_requests_total', result=tier)
+        return default if blob is None else decode(blob)
+
+    def _promote_locked(self, key, blob):
+        self._last_used[key] = self._clock()
+        self._memory[key] = blob
+        self._memory_size += len(blob)
+        self._evict_memory_locked()
+
+    def _read_disk_locked(self, key):
+        self._load_disk_index_locked()
+        if key not in self._disk:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                blob = f.read()
+        except FileNotFoundError:
+            self._disk_size -= self._disk.pop(key)
+            return None
+        self._disk.move_to_end(key)
+        return blob
+
+    def _evict_memory_locked(self):
+        while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+            key, blob = self._memory.popitem(last=False)
+            self._memory_size -= len(blob)
+            self._spill_locked(key, blob)
+
+    def _spill_locked(self, key, blob):
+        self._load_disk_index_locked()
+        if key in self._disk:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._path(key) + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp, self._path(key))
+        self._disk[key] = len(blob)
+        self._disk_size += len(blob)
+        while self._disk_size > self.disk_bytes and len(self._disk) > 1:
+            old_key, _ = next(iter(self._disk.items()))
+            self._delete_disk_locked(old_key)
+
+    def _delete_disk_locked(self, key):
+        size = self._disk.pop(key, None)
+        if size is None:
+            return
+        self._disk_size -= size
+        if key not in self._memory:
+            self._last_used.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def touch(self, session_id, keys):
+        """Mark a session as active and referencing `keys`"""
+        with self._lock:
+            self._sessions[session_id] = (self._clock(), {k for k in keys if k})
+
+    def reap(self):
+        """Drop idle sessions and the content only they referenced; returns (sessions, entries) removed"""
+        with self._lock:
+            horizon = self._clock() - self.idle_seconds
+            idle = [sid for sid, (seen, _) in self._sessions.items() if seen < horizon]
+            for sid in idle:
+                del self._sessions[sid]
+            pinned = set().union(*(keys for _, keys in self._sessions.values()))
+            self._load_disk_index_locked()
+            stale = [key for key in set(self._memory) | set(self._disk)
+                     if key not in pinned and self._last_used.get(key, 0.0) < horizon]
+            for key in stale:
+                blob = self._memory.pop(key, None)
+                if blob is not None:
+                    self._memory_size -= len(blob)
+                self._delete_disk_locked(key)
+                self._last_used.pop(key, None)
+        self._report()
+        return len(idle), len(stale)
+
+    def stats(self):
+        with self._lock:
+            return {'memory_bytes': self._memory_size, 'memory_entries': len(self._memory),
+                    'disk_bytes': self._disk_size, 'disk_entries': len(self._disk or ()),
+                    'sessions': len(self._sessions)}
+
+    def _report(self):
+        stats = self.stats()
+        metrics.set_gauge('edugenie_content_store_bytes', stats['memory_bytes'], tier='memory')
+        metrics.set_gauge('edugenie_content_store_bytes', stats['disk_bytes'], tier='disk')
+        metrics.set_gauge('edugenie_content_store_sessions', stats['sessions'])
+
+
+_store = ContentStore()
+_reaper = None
+_reaper_lock = threading.Lock()
+
+
+def get_store():
+    return _store
+
+
+def put(value):
+    return _store.put(value)
+
+
+def get(key, default=None):
+    return _store.get(key, default)
+
+
+def touch(session_id, keys):
+    """Record the session's keys and make sure the reaper is running"""
+    start_reaper()
+    _store.touch(session_id, keys)
+
+
+def start_reaper(interval=REAP_INTERVAL):
+    global _reaper
+    with _reaper_lock:
+        if _reaper is not None:
+            return _reaper
+
+        def _loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    _store.reap()
+                except Exception:
+                    metrics.inc('edugenie_content_store_reap_errors_total')
+
+        _reaper = threading.Thread(target=_loop, name='edugenie-content-reaper', daemon=True)
+        _reaper.start()
+        return _reaper
@@ -0,0 +1,164 @@
+"""
+Sharded per-user counters for quiz insights.
+
+A single aggregate document per user would take every write for that user and
+Firestore sustains only about one write per second per document. Each user's
+totals are instead spread over EDUGENIE_COUNTER_SHARDS documents,
+
+    user_stats/{user_id}/shards/{0..n-1}
+
+and every write increments one randomly chosen shard. Reads fetch all shards
+with a single get_all() and add them up. The shard count can be raised at any
+time; lowering it hides the higher-numbered shards, so don't.
+
+    python -m edugenie.counters --rebuild            # recompute from quiz_attempts
+    python -m edugenie.counters --benchmark          # write contention, 1 vs N shards
+
+The benchmark runs against FIRESTORE_EMULATOR_HOST when it is set, otherwise
+against the offline fake, which queues writes to one document at
+--write-interval seconds apart (Firestore's real limit is about 1 s; the
+default 0.1 s keeps the run short while showing the same hotspot).
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+from edugenie import metrics
+
+try:
+    from google.cloud.firestore import Increment
+except ImportError:
+    from edugenie.fakes import Increment
+
+NUM_SHARDS = int(os.getenv('EDUGENIE_COUNTER_SHARDS', '10'))
+COLLECTION = 'user_stats'
+FIELDS = ('attempts', 'questions', 'correct', 'score_sum')
+
+
+def shard_refs(db, user_id, num_shards=NUM_SHARDS):
+    parent = db.collection(COLLECTION).document(user_id)
+    return [parent.collection('shards').document(str(idx)) for idx in range(num_shards)]
+
+
+def increment(db, user_id, values, num_shards=NUM_SHARDS, batch=None):
+    """Add `values` ({field: amount}) to one random shard, inside `batch` if given"""
+    ref = db.collection(COLLECTION).document(user_id).collection('shards').document(str(random.randrange(num_shards)))
+    update = {field: Increment(amount) for field, amount in values.items()}
+    if batch is not None:
+        batch.set(ref, update, merge=True)
+    else:
+        ref.set(update, merge=True)
+
+
+def read(db, user_id, num_shards=NUM_SHARDS):
+    """Totals for a user summed over all shards with one get_all()"""
+    totals = dict.fromkeys(FIELDS, 0)
+    with metrics.span('counters_read'):
+        for snapshot in db.get_all(shard_refs(db, user_id, num_shards)):
+            data = snapshot.to_dict() if snapshot.exists else None
+            for field, value in (data or {}).items():
+                totals[field] = totals.get(field, 0) + (value or 0)
+    return totals
+
+
+def attempt_values(total_questions, correct_answers, score_percentage):
+    """Counter increments for one saved quiz attempt"""
+    return {
+        'attempts': 1,
+        'questions': total_questions,
+        'correct': correct_answers,
+        'score_sum': score_percentage,
+    }
+
+
+def rebuild(db, num_shards=NUM_SHARDS):
+    """Recompute every user's shards from quiz_attempts; returns the number of users"""
+    totals = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+    for attempt in db.collection('quiz_attempts').stream():
+        data = attempt.to_dict()
+        values = attempt_values(data.get('total_questions', 0), data.get('correct_answers', 0),
+                                data.get('score_percentage', 0))
+        user_totals = totals[data.get('user_id') or 'default_user']
+        for field, amount in values.items():
+            user_totals[field] += amount
+
+    for user_id, user_totals in totals.items():
+        batch = db.batch()
+        refs = shard_refs(db, user_id, num_shards)
+        batch.set(refs[0], user_totals)
+        for ref in refs[1:]:
+            batch.set(ref, dict.fromkeys(FIELDS, 0))
+        batch.commit()
+    return len(totals)
+
+
+def benchmark(db, shard_counts=(1, NUM_SHARDS), writers=20, writes_per_writer=5):
+    """Concurrent increments to one user's counters for each shard count
+
+    Returns {num_shards: {'writes_per_second', 'p50_ms', 'p95_ms', 'correct'}}.
+    """
+    results = {}
+    for num_shards in shard_counts:
+        user_id = f"benchmark-{num_shards}-{random.getrandbits(32):08x}"
+        latencies = []
+        lock = threading.Lock()
+
+        def writer():
+            for _ in range(writes_per_writer):
+                start = time.perf_counter()
+                increment(db, user_id, {'attempts': 1}, num_shards=num_shards)
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=writer) for _ in range(writers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        total = writers * writes_per_writer
+        results[num_shards] = {
+            'writes_per_second': total / elapsed,
+            'p50_ms': latencies[len(latencies) // 2] * 1000,
+            'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+            'correct': read(db, user_id, num_shards)['attempts'] == total,
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain or benchmark the sharded insight counters")
+    parser.add_argument('--rebuild', action='store_true', help="recompute all counters from quiz_attempts")
+    parser.add_argument('--benchmark', action='store_true', help="measure write contention for 1 vs N shards")
+    parser.add_argument('--shards', default=f"1,{NUM_SHARDS}", help="comma-separated shard counts to benchmark")
+    parser.add_argument('--writers', type=int, default=20)
+    parser.add_argument('--writes', type=int, default=5, help="writes per writer")
+    parser.add_argument('--write-interval', type=float, default=0.1,
+                        help="per-document write spacing of the offline fake, in seconds")
+    args = parser.parse_args(argv)
+
+    from edugenie import backends, fakes
+    if args.rebuild:
+        print(f"Rebuilt counters for {rebuild(backends.get_firestore())} users")
+    elif args.benchmark:
+        # Never against production: the emulator if one is running, else the fake
+        if os.getenv('FIRESTORE_EMULATOR_HOST'):
+            db = backends.get_firestore()
+        else:
+            db = fakes.FakeFirestoreClient(latency=0.01, document_write_interval=args.write_interval)
+        shard_counts = [int(n) for n in args.shards.split(',')]
+        for num_shards, row in benchmark(db, shard_counts, args.writers, args.writes).items():
+            print(f"{num_shards:>3} shards: {row['writes_per_second']:7.1f} writes/s  "
+                  f"p50 {row['p50_ms']:8.1f} ms  p95 {row['p95_ms']:8.1f} ms  totals {'ok' if row['correct'] else 'WRONG'}")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Near-duplicate detection for quiz questions.
+
+Question text is normalized (numbering, case and punctuation dropped) and
+shingled into character 5-grams; an LSH index over MinHash signatures finds
+questions whose shingle Jaccard similarity reaches EDUGENIE_QUESTION_SIMILARITY.
+A similar stem is only a repeat if the answer choices are the same too: the
+options, without their letters and in any order, or the answer of a question
+without options. A quiz is checked against itself and against the user's recent history, a
+bounded per-user index of the last EDUGENIE_DEDUP_HISTORY questions they were
+shown, so only the rejected slots need to be regenerated; replace_duplicates()
+does that for up to EDUGENIE_DEDUP_REPLACEMENT_ROUNDS rounds.
+
+Metrics: edugenie_question_duplicates_total{scope="quiz|history"},
+edugenie_short_quizzes_total{page}
+"""
+import argparse
+import os
+import random
+import re
+import time
+
+from edugenie import bank, breakers, cache, metrics, similarity
+
+SIMILARITY_THRESHOLD = float(os.getenv('EDUGENIE_QUESTION_SIMILARITY', '0.7'))
+HISTORY_SIZE = int(os.getenv('EDUGENIE_DEDUP_HISTORY', '200'))
+HISTORY_TTL = float(os.getenv('EDUGENIE_DEDUP_HISTORY_TTL_SECONDS', '86400'))
+REPLACEMENT_ROUNDS = int(os.getenv('EDUGENIE_DEDUP_REPLACEMENT_ROUNDS', '2'))
+SHINGLE_SIZE = 5
+DUPLICATES_METRIC = 'edugenie_question_duplicates_total'
+_OPTION_LABEL = re.compile(r'^\s*[A-Da-d]\s*[.)]\s*')
+
+_histories = cache.get_cache('question_history', maxsize=4096, ttl=HISTORY_TTL)
+
+
+def _normalize(text):
+    return ' '.join(re.findall(r'\w+', (text or '').casefold()))
+
+
+def question_shingles(text):
+    """Character shingles of a question's normalized text"""
+    return similarity.char_shingles(_normalize(bank.strip_number(text)), SHINGLE_SIZE)
+
+
+def choices_key(question):
+    """Normalized options, unlettered and sorted, or the answer of a question without options"""
+    options = sorted(_normalize(_OPTION_LABEL.sub('', option)) for option in question.get('options') or ())
+    return '|'.join(options) if options else _normalize(question.get('answer'))
+
+
+def _same_choices(question):
+    choices = choices_key(question)
+    return lambda key: key[1] == choices
+
+
+def _new_index(max_size=None):
+    return similarity.LSHIndex(SIMILARITY_THRESHOLD, max_size=max_size, evict=max_size is not None)
+
+
+def history(user_key):
+    """The user's recent-question index, created on first use"""
+    index = _histories.get(user_key)
+    if index is None:
+        index = _new_index(HISTORY_SIZE)
+        _histories.set(user_key, index)
+    return index
+
+
+def remember(user_key, questions):
+    """Add questions the user has been shown to their recent history"""
+    if not user_key:
+        return
+    index = history(user_key)
+    for question in questions:
+        shingles = question_shingles(question['question'])
+        index.add((bank.question_key(question['question']), choices_key(question)), shingles)
+
+
+def find_duplicates(questions, user_key=None):
+    """Indexes of questions that repeat an earlier question in the list or the user's history
+
+    Earlier questions win, so put the ones you would rather keep first.
+    """
+    seen = _new_index()
+    recent = _histories.get(user_key) if user_key else None
+    rejected = []
+    for idx, question in enumerate(questions):
+        shingles = question_shingles(question['question'])
+        bands = seen.band_keys(shingles) if shingles else None
+        same_choices = _same_choices(question)
+        if recent is not None and recent.query(shingles, bands, accept=same_choices) is not None:
+            rejected.append(idx)
+            metrics.inc(DUPLICATES_METRIC, scope='history')
+        elif seen.query(shingles, bands, accept=same_choices) is not None:
+            rejected.append(idx)
+            metrics.inc(DUPLICATES_METRIC, scope='quiz')
+        else:
+            seen.add((idx, choices_key(question)), shingles, bands)
+    return rejected
+
+
+def replace_duplicates(questions, regenerate, user_key=None, rounds=REPLACEMENT_ROUNDS, page='quiz'):
+    """`questions` without repeats, regenerating the rejected slots up to `rounds` times
+
+    regenerate(count, avoid) returns up to `count` new questions, avoiding the
+    texts in `avoid`. Slots still duplicated after the last round, or when
+    Gemini's breaker is open, are dropped, so the quiz can come back short of
+    what was asked for; callers should tell the student or log it.
+    """
+    questions = list(questions)
+    with metrics.span('dedup', page=page):
+        rejected = find_duplicates(questions, user_key=user_key)
+    for _ in range(rounds):
+        if not rejected:
+            break
+        kept = [q['question'] for idx, q in enumerate(questions) if idx not in rejected]
+        try:
+            replacements = regenerate(len(rejected), kept)
+        except breakers.CircuitOpenError:
+            break
+        for idx, replacement in zip(rejected, replacements):
+            questions[idx] = replacement
+        with metrics.span('dedup', page=page):
+            rejected = find_duplicates(questions, user_key=user_key)
+    if rejected:
+        metrics.inc('edugenie_short_quizzes_total', page=page)
+    return [q for idx, q in enumerate(questions) if idx not in rejected]
+
+
+def benchmark(num_questions=20, history_size=HISTORY_SIZE, rounds=200, seed=0):
+    """Mean microseconds for find_duplicates() on one quiz against a full history"""
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 9)))
+                  for _ in range(2000)]
+
+    def question():
+        return {'question': ' '.join(rng.sample(vocabulary, rng.randint(8, 16))) + '?'}
+
+    user_key = f"benchmark-{seed}"
+    _histories.pop(user_key)
+    remember(user_key, [question() for _ in range(history_size)])
+    quizzes = [[question() for _ in range(num_questions)] for _ in range(rounds)]
+
+    start = time.perf_counter()
+    for quiz in quizzes:
+        find_duplicates(quiz, user_key=user_key)
+    elapsed = time.perf_counter() - start
+    _histories.pop(user_key)
+    return elapsed / rounds * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark per-quiz question de-duplication")
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--history', type=int, default=HISTORY_SIZE)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args(argv)
+    micros = benchmark(args.questions, args.history, args.rounds)
+    print(f"{micros / 1000:.2f} ms per {args.questions}-question quiz against {args.history} recent questions")
+
+
+if __name__ == '__main__':
+    main()
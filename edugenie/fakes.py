@@ -0,0 +1,720 @@
+"""
+Deterministic in-process stand-ins for Gemini and Firestore.
+
+FakeGenerativeModel answers prompts with recorded text when a recording exists
+and otherwise synthesizes text in the exact format `parse_quiz` and the study
+material page expect. Latency, error injection and streaming are configurable.
+
+FakeFirestoreClient is an in-memory document store covering the subset of the
+Firestore API the pages use: collection/document/subcollections, where,
+order_by, limit, select, stream, get, add, set, update, delete, batch,
+get_all, collection_group, count/sum/avg aggregation queries and Increment
+transforms. `document_write_interval` models
+Firestore's sustained limit of about one write per second per document.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+import hashlib
+import datetime
+import itertools
+
+from edugenie.prompts import estimate_tokens
+
+
+class FakeServiceError(Exception):
+    """Raised by the fakes when an error is injected"""
+
+
+# Shared across model instances: the pages build a new model object per request
+_call_counter = itertools.count(1)
+
+
+# --- Gemini ---
+
+class FinishReason:
+    """Mimics the proto enum exposed as candidate.finish_reason"""
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def __int__(self):
+        return self.value
+
+    def __eq__(self, other):
+        if isinstance(other, FinishReason):
+            return self.value == other.value
+        if isinstance(other, str):
+            return self.name == other
+        return self.value == other
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __repr__(self):
+        return f"<FinishReason.{self.name}: {self.value}>"
+
+
+STOP = FinishReason('STOP', 1)
+MAX_TOKENS = FinishReason('MAX_TOKENS', 2)
+
+
+class FakeUsageMetadata:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = 0
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class FakeCandidate:
+    def __init__(self, finish_reason):
+        self.finish_reason = finish_reason
+
+
+class FakeResponse:
+    """Shape-compatible with GenerateContentResponse for the fields we read"""
+
+    def __init__(self, text, prompt_tokens, finish_reason=STOP):
+        self.text = text
+        self.candidates = [FakeCandidate(finish_reason)]
+        self.usage_metadata = FakeUsageMetadata(prompt_tokens, estimate_tokens(text))
+
+
+class FakeStreamResponse:
+    """Iterable of chunk responses; `.text` is available once fully consumed"""
+
+    def __init__(self, chunks, prompt_tokens, chunk_delay, finish_reason=STOP):
+        self._chunks = chunks
+        self._prompt_tokens = prompt_tokens
+        self._chunk_delay = chunk_delay
+        self._finish_reason = finish_reason
+        self.text = ''
+        self.candidates = [FakeCandidate(finish_reason)]
+        self.usage_metadata = None
+
+    def __iter__(self):
+        for idx, chunk in enumerate(self._chunks):
+            if self._chunk_delay:
+                time.sleep(self._chunk_delay)
+            self.text += chunk
+            last = idx == len(self._chunks) - 1
+            yield FakeResponse(chunk, self._prompt_tokens, self._finish_reason if last else STOP)
+        self.usage_metadata = FakeUsageMetadata(self._prompt_tokens, estimate_tokens(self.text))
+
+    def resolve(self):
+        for _ in self:
+            pass
+
+
+class FakeTokenCount:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+
+def prompt_key(prompt):
+    """Stable key for recorded responses"""
+    return hashlib.sha256(prompt.strip().encode('utf-8')).hexdigest()
+
+
+_FILLER_CONCEPTS = [
+    'core principle', 'key process', 'historical development', 'common misconception',
+    'real-world application', 'underlying mechanism', 'defining property', 'major component',
+    'cause and effect', 'limiting factor', 'experimental evidence', 'practical example',
+]
+
+
+def _prompt_field(prompt, pattern, default=''):
+    match = re.search(pattern, prompt, re.IGNORECASE | re.MULTILINE)
+    return match.group(1).strip() if match else default
+
+
+def synthesize_quiz(topic, num_questions, question_type, rng):
+    """Quiz text in the numbered format parse_quiz reads"""
+    blocks = []
+    for n in range(1, num_questions + 1):
+        concept = rng.choice(_FILLER_CONCEPTS)
+        if question_type == 'Multiple Choice':
+            correct = rng.choice('ABCD')
+            options = [f"{letter}. {topic} {concept} variant {rng.randint(1, 99)}" for letter in 'ABCD']
+            blocks.append('\n'.join([
+                f"{n}. Which statement best describes the {concept} of {topic} (item {n})?",
+                *options,
+                f"Answer: {correct}",
+                f"Explanation: Option {correct} matches the {concept} of {topic}.",
+            ]))
+        elif question_type == 'True/False':
+            truth = rng.choice(['True', 'False'])
+            blocks.append('\n'.join([
+                f"{n}. The {concept} of {topic} is well established (item {n}).",
+                f"Answer: {truth}",
+                f"Explanation: The statement is {truth.lower()} for this {concept}.",
+            ]))
+        else:
+            blocks.append('\n'.join([
+                f"{n}. Name the {concept} of {topic} (item {n}).",
+                f"Answer: {concept}",
+                f"Explanation: The {concept} is central to {topic}.",
+            ]))
+    return '\n\n'.join(blocks)
+
+
+def synthesize_study_material(topic, num_items, goal, rng):
+    """Numbered study items in the format requested by the study material prompt"""
+    blocks = []
+    for n in range(1, num_items + 1):
+        concept = rng.choice(_FILLER_CONCEPTS)
+        if goal == 'Flashcards':
+            blocks.append(f"{n}. Q: What is the {concept} of {topic}?\nA: It is the {concept} that explains {topic} (card {n}).")
+        else:
+            sentences = ' '.join(
+                f"The {concept} of {topic} connects to idea {n}.{k}." for k in range(1, rng.randint(3, 6))
+            )
+            blocks.append(f"{n}. {concept.title()} of {topic}\n{sentences}")
+    return '\n\n'.join(blocks)
+
+
+def synthesize_response(prompt, rng):
+    """Produce plausible output for the prompts the pages send"""
+    quiz_count = _prompt_field(prompt, r'Generate exactly (\d+) quiz questions')
+    if quiz_count:
+        topic = _prompt_field(prompt, r'Topic:\s*(.+)', 'the topic')
+        question_type = _prompt_field(prompt, r'Question Type:\s*(.+)', 'Multiple Choice')
+        return synthesize_quiz(topic, int(quiz_count), question_type, rng)
+
+    study_count = _prompt_field(prompt, r'Generate (\d+) high-quality study items')
+    if study_count:
+        topic = _prompt_field(prompt, r'for the topic:\s*(.+?)\.?$', 'the topic')
+        goal = _prompt_field(prompt, r'Study goal:\s*(.+)', 'Summary')
+        return synthesize_study_material(topic, int(study_count), goal, rng)
+
+    outline_count = _prompt_field(prompt, r'(?:outline of|with) exactly (\d+) (?:more )?section titles')
+    if outline_count:
+        topic = _prompt_field(prompt, r'Topic:\s*(.+)', 'the topic')
+        start = int(_prompt_field(prompt, r'numbered from (\d+)', '1'))
+        return '\n'.join(
+            f"{n}. {_FILLER_CONCEPTS[(n - 1) % len(_FILLER_CONCEPTS)].title()} of {topic} ({n})"
+            for n in range(start, start + int(outline_count))
+        )
+
+    section_title = _prompt_field(prompt, r'Section title:\s*(.+)')
+    if section_title:
+        return ' '.join(f"{section_title} point {k}: detail {rng.randint(1, 999)}." for k in range(1, rng.randint(4, 8)))
+
+    return f"Response {rng.randint(1000, 9999)} for: {prompt.strip()[:80]}"
+
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel with deterministic output
+
+    latency        - seconds slept per call (split across chunks when streaming)
+    latency_jitter - extra uniform random latency in [0, jitter)
+    error_rate     - probability that a call raises FakeServiceError
+    recordings     - dict of prompt_key(prompt) -> response text
+    seed           - base seed; output depends only on seed and prompt
+    max_output_chars     - truncate output beyond this and report MAX_TOKENS
+    continuation_overlap - characters a continuation repeats from the partial answer
+    """
+
+    def __init__(self, model_name='fake-gemini', latency=0.0, latency_jitter=0.0,
+                 error_rate=0.0, recordings=None, seed=0, stream_chunk_chars=200,
+                 max_output_chars=None, continuation_overlap=20):
+        self.model_name = model_name
+        self.max_output_chars = max_output_chars
+        self.continuation_overlap = continuation_overlap
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.recordings = recordings if recordings is not None else {}
+        self.seed = seed
+        self.stream_chunk_chars = stream_chunk_chars
+        self.calls = 0
+
+    def _rng(self, prompt):
+        return random.Random(self.seed * 1_000_003 + zlib.crc32(prompt.encode('utf-8')))
+
+    def _respond(self, prompt):
+        self.calls += 1
+        call_no = next(_call_counter)
+        # Error and jitter draws vary per call so retries can succeed
+        call_rng = random.Random(self.seed * 7919 + call_no)
+        delay = self.latency + (call_rng.random() * self.latency_jitter if self.latency_jitter else 0.0)
+        if self.error_rate and call_rng.random() < self.error_rate:
+            time.sleep(delay)
+            raise FakeServiceError("Injected Gemini failure")
+        text = self.recordings.get(prompt_key(prompt))
+        if text is None:
+            text = synthesize_response(prompt, self._rng(prompt))
+        return text, delay
+
+    def generate_content(self, contents, stream=False, generation_config=None, **kwargs):
+        prompt, written = _split_contents(contents)
+        text, delay = self._respond(prompt)
+        prompt_tokens = estimate_tokens(prompt + (written or ''))
+
+        if written is not None:
+            # Continuation turn: pick up the full answer where the model turn stops
+            text = text[max(0, len(written) - self.continuation_overlap):]
+
+        finish_reason = STOP
+        if self.max_output_chars and len(text) > self.max_output_chars:
+            text = text[:self.max_output_chars]
+            finish_reason = MAX_TOKENS
+
+        if stream:
+            size = max(1, self.stream_chunk_chars)
+            chunks = [text[i:i + size] for i in range(0, len(text), size)] or ['']
+            return FakeStreamResponse(chunks, prompt_tokens, delay / len(chunks), finish_reason)
+
+        if delay:
+            time.sleep(delay)
+        return FakeResponse(text, prompt_tokens, finish_reason)
+
+    def count_tokens(self, contents):
+        prompt, written = _split_contents(contents)
+        return FakeTokenCount(estimate_tokens(prompt + (written or '')))
+
+
+def _split_contents(contents):
+    """(first user prompt, concatenated model turns or None) from generate_content input"""
+    if isinstance(contents, str):
+        return contents, None
+    user_parts, model_parts = [], []
+    for item in contents:
+        if isinstance(item, dict):
+            parts = ''.join(str(p) for p in item.get('parts', []))
+            (model_parts if item.get('role') == 'model' else user_parts).append(parts)
+        else:
+            user_parts.append(str(item))
+    if model_parts:
+        return user_parts[0], ''.join(model_parts)
+    return '\n'.join(user_parts), None
+
+
+def load_recordings(path):
+    """Load a JSON file of {prompt_key: text} or a list of {"prompt", "text"} records"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return {prompt_key(item['prompt']): item['text'] for item in data}
+    return dict(data)
+
+
+# --- Firestore ---
+
+class Increment:
+    """Stand-in for firestore.Increment when the SDK is not installed"""
+
+    def __init__(self, value):
+        self.value = value
+
+
+class FakeQuery:
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+    def __init__(self, client, path, filters=(), orders=(), limit_count=None, cursor=None, group=False, fields=None):
+        self._client = client
+        self._path = path
+        self._group = group
+        self._fields = fields
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_count
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        params = {
+            'filters': self._filters,
+            'orders': self._orders,
+            'limit_count': self._limit,
+            'cursor': self._cursor,
+            'group': self._group,
+            'fields': self._fields,
+        }
+        params.update(changes)
+        return FakeQuery(self._client, self._path, **params)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit_count=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(fields=tuple(field_paths))
+
+    def count(self, alias=None):
+        return FakeAggregationQuery(self).count(alias)
+
+    def sum(self, field_ref, alias=None):
+        return FakeAggregationQuery(self).sum(field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return FakeAggregationQuery(self).avg(field_ref, alias)
+
+    def _run(self):
+        if self._group:
+            docs = self._client._list_group(self._path)
+        else:
+            docs = self._client._list_collection(self._path)
+        docs = [d for d in docs if all(_matches(d.to_dict(), f, op, v) for f, op, v in self._filters)]
+        for field, direction in reversed(self._orders):
+            docs = [d for d in docs if _get_field(d.to_dict(), field) is not _MISSING]
+            docs.sort(key=lambda d: _sort_key(_get_field(d.to_dict(), field)),
+                      reverse=(direction == self.DESCENDING))
+        if self._cursor is not None:
+            docs = self._apply_cursor(docs)
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        if self._fields is not None:
+            docs = [FakeDocumentSnapshot(d.reference, {k: v for k, v in d.to_dict().items() if k in self._fields})
+                    for d in docs]
+        return docs
+
+    def _apply_cursor(self, docs):
+        cursor = self._cursor
+        if isinstance(cursor, FakeDocumentSnapshot):
+            for idx, doc in enumerate(docs):
+                if doc.id == cursor.id:
+                    return docs[idx + 1:]
+            values = [_get_field(cursor.to_dict(), f) for f, _ in self._orders]
+        else:
+            values = [cursor.get(f, _MISSING) for f, _ in self._orders]
+
+        def after(doc):
+            for (field, direction), value in zip(self._orders, values):
+                current = _sort_key(_get_field(doc.to_dict(), field))
+                target = _sort_key(value)
+                if current == target:
+                    continue
+                return current < target if direction == self.DESCENDING else current > target
+            return False
+
+        return [d for d in docs if after(d)]
+
+    def stream(self, transaction=None):
+        self._client._maybe_delay()
+        return iter(self._run())
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+
+class FakeAggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class FakeAggregationQuery:
+    """count/sum/avg over a query's matches without returning the documents"""
+
+    def __init__(self, query):
+        self._query = query
+        self._aggregations = []
+
+    def _add(self, kind, field, alias):
+        self._aggregations.append((kind, field, alias or f"field_{len(self._aggregations) + 1}"))
+        return self
+
+    def count(self, alias=None):
+        return self._add('count', None, alias)
+
+    def sum(self, field_ref, alias=None):
+        return self._add('sum', field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return self._add('avg', field_ref, alias)
+
+    def get(self, transaction=None):
+        self._query._client._maybe_delay()
+        data = [d.to_dict() for d in self._query._run()]
+        results = []
+        for kind, field, alias in self._aggregations:
+            if kind == 'count':
+                value = len(data)
+            else:
+                numbers = [v for v in (_get_field(d, field) for d in data)
+                           if isinstance(v, (int, float)) and not isinstance(v, bool)]
+                if kind == 'sum':
+                    value = sum(numbers)
+                else:
+                    value = sum(numbers) / len(numbers) if numbers else None
+            results.append(FakeAggregationResult(alias, value))
+        return [results]
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._client, f"{self._path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.set(document_data)
+        return datetime.datetime.utcnow(), ref
+
+    def list_documents(self):
+        return [d.reference for d in self._client._list_collection(self._path)]
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return _deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        return _get_field(self._data or {}, field_path)
+
+
+class FakeDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, collection_id):
+        return FakeCollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def get(self, field_paths=None, transaction=None):
+        self._client._maybe_delay()
+        return FakeDocumentSnapshot(self, self._client._read(self.path))
+
+    def set(self, document_data, merge=False):
+        self._client._maybe_delay()
+        self._client._throttle([self.path])
+        self._client._write(self.path, document_data, merge=merge)
+
+    def update(self, field_updates):
+        self._client._maybe_delay()
+        self._client._throttle([self.path])
+        if self._client._read(self.path) is None:
+            raise FakeServiceError(f"No document to update: {self.path}")
+        self._client._write(self.path, field_updates, merge=True, nested=False)
+
+    def delete(self):
+        self._client._maybe_delay()
+        self._client._delete(self.path)
+
+
+class FakeWriteBatch:
+    MAX_OPERATIONS = 500
+
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def _add(self, op):
+        if len(self._ops) >= self.MAX_OPERATIONS:
+            raise FakeServiceError("Maximum 500 writes allowed per batch")
+        self._ops.append(op)
+
+    def set(self, reference, document_data, merge=False):
+        self._add(('set', reference.path, document_data, merge))
+
+    def update(self, reference, field_updates):
+        self._add(('update', reference.path, field_updates, True))
+
+    def delete(self, reference):
+        self._add(('delete', reference.path, None, False))
+
+    def commit(self):
+        self._client._maybe_delay()
+        self._client._throttle([path for _, path, _, _ in self._ops])
+        with self._client._lock:
+            for op, path, data, merge in self._ops:
+                if op == 'delete':
+                    self._client._delete(path)
+                else:
+                    self._client._write(path, data, merge=merge, nested=op == 'set')
+        results = [datetime.datetime.utcnow()] * len(self._ops)
+        self._ops = []
+        return results
+
+
+class FakeFirestoreClient:
+    """In-memory Firestore client; safe to share between threads and sessions
+
+    latency                 - seconds slept per read/write round trip
+    error_rate              - probability that a round trip raises FakeServiceError
+    document_write_interval - minimum seconds between writes to one document;
+                              writes queue up behind each other like contended
+                              writes to a hot Firestore document
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0, document_write_interval=0.0):
+        self._docs = {}
+        self._lock = threading.RLock()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.document_write_interval = document_write_interval
+        self._next_write = {}
+        self._rng = random.Random(seed)
+
+    def _maybe_delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate:
+            with self._lock:
+                failed = self._rng.random() < self.error_rate
+            if failed:
+                raise FakeServiceError("Injected Firestore failure")
+
+    def _throttle(self, paths):
+        if not self.document_write_interval:
+            return
+        now = time.monotonic()
+        wait = 0.0
+        with self._lock:
+            for path in set(paths):
+                slot = max(now, self._next_write.get(path, now))
+                self._next_write[path] = slot + self.document_write_interval
+                wait = max(wait, slot - now)
+        if wait:
+            time.sleep(wait)
+
+    def collection(self, collection_id):
+        return FakeCollectionReference(self, collection_id)
+
+    def document(self, document_path):
+        return FakeDocumentReference(self, document_path)
+
+    def collection_group(self, collection_id):
+        return FakeQuery(self, collection_id, group=True)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        self._maybe_delay()
+        for ref in references:
+            yield FakeDocumentSnapshot(ref, self._read(ref.path))
+
+    def _read(self, path):
+        with self._lock:
+            data = self._docs.get(path)
+            return _deepcopy(data) if data is not None else None
+
+    def _write(self, path, data, merge=False, nested=True):
+        """Store `data` at `path`; with `merge`, nested maps merge field by field
+        as set(merge=True) does, unless `nested` is False (update() replaces maps)"""
+        with self._lock:
+            current = self._docs.get(path) if merge else None
+            self._docs[path] = _deepcopy(_merge(current or {}, data, nested))
+
+    def _delete(self, path):
+        with self._lock:
+            self._docs.pop(path, None)
+
+    def _list_collection(self, path):
+        depth = path.count('/') + 1
+        prefix = path + '/'
+        with self._lock:
+            items = [(p, d) for p, d in self._docs.items() if p.startswith(prefix) and p.count('/') == depth]
+        return [FakeDocumentSnapshot(FakeDocumentReference(self, p), _deepcopy(d)) for p, d in items]
+
+    def _list_group(self, collection_id):
+        with self._lock:
+            items = [(p, d) for p, d in self._docs.items() if p.split('/')[-2:-1] == [collection_id]]
+        return [FakeDocumentSnapshot(FakeDocumentReference(self, p), _deepcopy(d)) for p, d in items]
+
+
+_MISSING = object()
+
+
+def _get_field(data, field_path):
+    current = data
+    for part in field_path.split('.'):
+        if not isinstance(current, dict) or part not in current:
+            return _MISSING
+        current = current[part]
+    return current
+
+
+def _sort_key(value):
+    # Firestore orders mixed types by type first; approximate with a type rank
+    if value is None or value is _MISSING:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime.datetime):
+        return (3, value.timestamp() if value.tzinfo else value.replace(tzinfo=datetime.timezone.utc).timestamp())
+    if isinstance(value, str):
+        return (4, value)
+    return (5, str(value))
+
+
+def _matches(data, field, op, value):
+    current = _get_field(data, field)
+    if current is _MISSING:
+        return False
+    if op == '==':
+        return current == value
+    if op == '!=':
+        return current != value
+    if op in ('<', '<=', '>', '>='):
+        a, b = _sort_key(current), _sort_key(value)
+        if a[0] != b[0]:
+            return False
+        return {'<': a < b, '<=': a <= b, '>': a > b, '>=': a >= b}[op]
+    if op == 'in':
+        return current in value
+    if op == 'not-in':
+        return current not in value
+    if op == 'array-contains':
+        return isinstance(current, list) and value in current
+    if op == 'array-contains-any':
+        return isinstance(current, list) and any(v in current for v in value)
+    raise FakeServiceError(f"Unsupported operator: {op}")
+
+
+def _apply_transform(current, value):
+    # Supports firestore.Increment and compatible objects
+    if type(value).__name__ == 'Increment' and hasattr(value, 'value'):
+        return (current or 0) + value.value
+    return value
+
+
+def _merge(current, data, nested=True):
+    merged = dict(current)
+    for key, value in data.items():
+        if nested and isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        elif nested and isinstance(value, dict):
+            # Transforms inside a new map still apply
+            merged[key] = _merge({}, value)
+        else:
+            merged[key] = _apply_transform(merged.get(key), value)
+    return merged
+
+
+def _deepcopy(data):
+    if isinstance(data, dict):
+        return {k: _deepcopy(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [_deepcopy(v) for v in data]
+    return data
@@ -0,0 +1,213 @@
+"""
+Flashcards and their spaced-repetition schedule.
+
+Flashcard study material ("Q: ... A: ..." items) is parsed into cards and
+stored per student,
+
+    flashcards/{user_id}/cards/{card_id}
+
+where the card ID is a hash of the front, so saving the same deck twice
+updates the cards instead of duplicating them. Every card carries its SM-2
+state (ease, interval in days, repetitions, lapses) and the `due` time of its
+next review.
+
+Fetching the cards due now is a range query on `due` ordered by `due`,
+answered from Firestore's single-field index on `due` in O(log n) however
+many cards the student has. Review sessions fetch them a page at a time: a
+reviewed card's `due` moves past the session's start time, so the next page
+is simply the first page again and no cursor is needed. Filtering by topic as
+well needs a composite index on the `cards` collection (`topic_key`
+ascending, `due` ascending).
+"""
+import datetime
+import hashlib
+import os
+import re
+
+from edugenie import breakers, metrics, topics
+
+COLLECTION = 'flashcards'
+CARDS = 'cards'
+BATCH_LIMIT = 500
+PAGE_SIZE = int(os.getenv('EDUGENIE_FLASHCARD_PAGE_SIZE', '20'))
+RELEARN_MINUTES = float(os.getenv('EDUGENIE_FLASHCARD_RELEARN_MINUTES', '10'))
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+
+# Review buttons and the SM-2 quality grade (0-5) each one stands for
+GRADES = {'Again': 1, 'Hard': 3, 'Good': 4, 'Easy': 5}
+
+_ITEM = re.compile(r'^\s*(?:\d+\s*[.)]\s*)?(?:\*\*)?\s*(Q|A|Question|Answer)\s*(?:\*\*)?\s*[:.]\s*(?:\*\*)?\s*',
+                   re.IGNORECASE)
+
+
+def parse_flashcards(text):
+    """[{'front': ..., 'back': ...}] from Q:/A: formatted text; text between cards is ignored"""
+    cards = []
+    front = back = None
+    for line in (text or '').splitlines():
+        match = _ITEM.match(line)
+        if match:
+            kind = match.group(1)[0].upper()
+            rest = line[match.end():].strip()
+            if kind == 'Q':
+                if front and back:
+                    cards.append({'front': front, 'back': back})
+                front, back = rest, None
+            elif front is not None:
+                back = rest
+        elif line.strip() and front is not None:
+            # Continuation of the question or the answer
+            if back is None:
+                front = f"{front} {line.strip()}".strip()
+            else:
+                back = f"{back} {line.strip()}".strip()
+    if front and back:
+        cards.append({'front': front, 'back': back})
+    return cards
+
+
+def card_id(front):
+    normalized = ' '.join(re.findall(r'\w+', (front or '').casefold()))
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:20]
+
+
+def cards_ref(db, user_id):
+    return db.collection(COLLECTION).document(user_id).collection(CARDS)
+
+
+def new_card(card, topic, now, material_id=None):
+    return {
+        'front': card['front'],
+        'back': card['back'],
+        'topic': topic,
+        'topic_key': topics.topic_key(topic) if topic else '',
+        'material_id': material_id,
+        'ease': INITIAL_EASE,
+        'interval': 0.0,
+        'repetitions': 0,
+        'lapses': 0,
+        'due': now,
+        'created_at': now,
+        'last_reviewed': None,
+    }
+
+
+def save_cards(db, user_id, topic, cards, material_id=None, now=None):
+    """Add cards to a student's deck, keeping the schedule of cards already in it; returns (added, updated)"""
+    now = now or datetime.datetime.utcnow()
+    collection = cards_ref(db, user_id)
+    unique = {card_id(card['front']): card for card in cards}
+    added = updated = 0
+    with breakers.guard('firestore'), metrics.span('flashcards_save', page='study_material'):
+        ids = list(unique)
+        for start in range(0, len(ids), BATCH_LIMIT):
+            refs = [collection.document(cid) for cid in ids[start:start + BATCH_LIMIT]]
+            existing = {snapshot.id for snapshot in db.get_all(refs) if snapshot.exists}
+            batch = db.batch()
+            for ref in refs:
+                card = unique[ref.id]
+                if ref.id in existing:
+                    batch.set(ref, {'front': card['front'], 'back': card['back']}, merge=True)
+                    updated += 1
+                else:
+                    batch.set(ref, new_card(card, topic, now, material_id))
+                    added += 1
+            batch.commit()
+    metrics.inc('edugenie_flashcards_saved_total', added)
+    return added, updated
+
+
+def schedule(card, quality, now=None):
+    """SM-2 update of a card for a review graded `quality` (0-5); returns the changed fields"""
+    now = now or datetime.datetime.utcnow()
+    ease = card.get('ease', INITIAL_EASE)
+    interval = card.get('interval', 0.0)
+    repetitions = card.get('repetitions', 0)
+    lapses = card.get('lapses', 0)
+
+    if quality >= 3:
+        if repetitions == 0:
+            interval = 1.0
+        elif repetitions == 1:
+            interval = 6.0
+        else:
+            interval = round(interval * ease, 2)
+        repetitions += 1
+        due = now + datetime.timedelta(days=interval)
+    else:
+        # Forgotten: start over and see it again later in this session
+        interval, repetitions, lapses = 0.0, 0, lapses + 1
+        due = now + datetime.timedelta(minutes=RELEARN_MINUTES)
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return {'ease': round(ease, 4), 'interval': interval, 'repetitions': repetitions, 'lapses': lapses,
+            'due': due, 'last_reviewed': now}
+
+
+def _due_query(db, user_id, now, topic=None):
+    query = cards_ref(db, user_id)
+    if topic:
+        query = query.where('topic_key', '==', topics.topic_key(topic))
+    return query.where('due', '<=', now).order_by('due')
+
+
+def due_cards(db, user_id, now=None, limit=PAGE_SIZE, topic=None):
+    """The first `limit` cards due by `now`, earliest first, as [(card_id, card)]"""
+    now = now or datetime.datetime.utcnow()
+    query = _due_query(db, user_id, now, topic)
+    with breakers.guard('firestore'), metrics.span('flashcards_due', page='flashcards'):
+        return [(doc.id, doc.to_dict()) for doc in query.limit(limit).stream()]
+
+
+def due_count(db, user_id, now=None, topic=None):
+    """Number of cards due by `now`, from a count aggregation"""
+    now = now or datetime.datetime.utcnow()
+    with breakers.guard('firestore'):
+        result = _due_query(db, user_id, now, topic).count(alias='due').get()[0]
+    return {r.alias: r.value for r in result}['due']
+
+
+def deck_size(db, user_id):
+    with breakers.guard('firestore'):
+        result = cards_ref(db, user_id).count(alias='cards').get()[0]
+    return {r.alias: r.value for r in result}['cards']
+
+
+def review(db, user_id, cid, card, quality, now=None):
+    """Record a review of one card; returns the card with its new schedule"""
+    changes = schedule(card, quality, now)
+    with breakers.guard('firestore'), metrics.span('flashcards_review', page='flashcards'):
+        cards_ref(db, user_id).document(cid).set(changes, merge=True)
+    metrics.inc('edugenie_flashcard_reviews_total', quality=str(quality))
+    return dict(card, **changes)
+
+
+class ReviewSession:
+    """Walks through the due cards a page at a time
+
+    Pages are read as of the session's start time, so reviewed cards drop out
+    of the range. Once those run out the start time moves to now, which picks
+    up the cards graded Again that have come due since.
+    """
+
+    def __init__(self, user_id, topic=None, page_size=PAGE_SIZE, now=None):
+        self.user_id = user_id
+        self.topic = topic
+        self.page_size = page_size
+        self.started = now or datetime.datetime.utcnow()
+        self.queue = []
+        self.reviewed = 0
+
+    def current(self, db, now=None):
+        """(card_id, card) to show next, or None when nothing is due"""
+        if not self.queue:
+            self.queue = due_cards(db, self.user_id, self.started, self.page_size, self.topic)
+        if not self.queue:
+            self.started = now or datetime.datetime.utcnow()
+            self.queue = due_cards(db, self.user_id, self.started, self.page_size, self.topic)
+        return self.queue[0] if self.queue else None
+
+    def grade(self, db, quality, now=None):
+        cid, card = self.queue.pop(0)
+        self.reviewed += 1
+        return review(db, self.user_id, cid, card, quality, now)
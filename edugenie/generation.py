@@ -0,0 +1,140 @@
+"""
+Gemini calls with automatic continuation of truncated output.
+
+When a response stops with finish reason MAX_TOKENS the conversation is
+continued (original prompt, partial answer as the model turn, then a
+"continue" instruction) and the new text is stitched onto the old one with
+the overlapping seam removed. Token usage and latency are recorded for every
+round, and every call goes through the Gemini rate limiter and circuit breaker.
+"""
+import os
+import time
+
+from edugenie import breakers, metrics, ratelimit
+
+MAX_CONTINUATION_ROUNDS = int(os.getenv('EDUGENIE_MAX_CONTINUATIONS', '3'))
+TOKENS_METRIC = 'edugenie_gemini_tokens_total'
+
+CONTINUE_INSTRUCTION = (
+    "Your previous answer was cut off. Continue exactly where it stopped, "
+    "without repeating anything already written and without any preamble."
+)
+
+
+def finish_reason_name(response):
+    """Finish reason of the first candidate as a string, e.g. 'STOP' or 'MAX_TOKENS'"""
+    try:
+        reason = response.candidates[0].finish_reason
+    except (AttributeError, IndexError, TypeError):
+        return ''
+    name = getattr(reason, 'name', None)
+    if name:
+        return name
+    # Older SDKs expose a bare int; 2 is MAX_TOKENS in the proto enum
+    return 'MAX_TOKENS' if reason == 2 else str(reason)
+
+
+def is_truncated(response):
+    return finish_reason_name(response) == 'MAX_TOKENS'
+
+
+def response_text(response):
+    """response.text, or '' when the candidate has no text parts"""
+    try:
+        return response.text or ''
+    except ValueError:
+        return ''
+
+
+def usage_of(response):
+    """Token usage of a response as a plain dict"""
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+    output_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+    total_tokens = getattr(usage, 'total_token_count', 0) or (prompt_tokens + output_tokens)
+    return {
+        'prompt_tokens': prompt_tokens,
+        'output_tokens': output_tokens,
+        'total_tokens': total_tokens,
+    }
+
+
+def stitch(text, addition, max_overlap=500):
+    """Append `addition` to `text`, dropping any prefix of it that repeats the end of `text`"""
+    if not text:
+        return addition
+    if not addition:
+        return text
+
+    # Longest suffix of text that is also a prefix of addition
+    limit = min(len(text), len(addition), max_overlap)
+    for size in range(limit, 0, -1):
+        if text.endswith(addition[:size]):
+            # Very short matches (a space, a letter) are usually coincidence
+            if size >= 8 or addition[:size].strip() == '':
+                return text + addition[size:]
+            break
+
+    # The model restarted the partially written last line
+    last_break = text.rfind('\n')
+    partial_line = text[last_break + 1:].strip()
+    stripped = addition.lstrip()
+    if len(partial_line) >= 8 and stripped.startswith(partial_line):
+        return text[:last_break + 1] + stripped
+
+    return text + addition
+
+
+def continuation_contents(prompt, text_so_far):
+    """Multi-turn request asking the model to continue its own answer"""
+    return [
+        {'role': 'user', 'parts': [prompt]},
+        {'role': 'model', 'parts': [text_so_far]},
+        {'role': 'user', 'parts': [CONTINUE_INSTRUCTION]},
+    ]
+
+
+def generate_with_continuation(model, prompt, max_rounds=MAX_CONTINUATION_ROUNDS, labels=None):
+    """Generate text, continuing while the model stops for MAX_TOKENS
+
+    Returns (text, rounds) where rounds holds one usage dict per model call,
+    each with 'round', 'finish_reason' and 'latency' (seconds) added. `labels` (page, question_type,
+    model) are attached to the recorded metrics.
+    """
+    labels = labels or {}
+    rounds = []
+
+    ratelimit.acquire('gemini')
+    start = time.perf_counter()
+    with breakers.guard('gemini'), metrics.span('gemini_generate', **labels):
+        response = model.generate_content(prompt)
+    text = response_text(response)
+    _record_round(rounds, response, labels, time.perf_counter() - start)
+
+    while is_truncated(response) and len(rounds) <= max_rounds:
+        ratelimit.acquire('gemini')
+        start = time.perf_counter()
+        with breakers.guard('gemini'), metrics.span('gemini_continue', **labels):
+            response = model.generate_content(continuation_contents(prompt, text))
+        addition = response_text(response)
+        _record_round(rounds, response, labels, time.perf_counter() - start)
+        if not addition.strip():
+            break
+        text = stitch(text, addition)
+
+    if is_truncated(response):
+        metrics.inc('edugenie_gemini_truncated_total', **labels)
+    return text, rounds
+
+
+def _record_round(rounds, response, labels, latency):
+    usage = usage_of(response)
+    usage['round'] = len(rounds)
+    usage['finish_reason'] = finish_reason_name(response)
+    usage['latency'] = latency
+    rounds.append(usage)
+
+    metrics.inc(TOKENS_METRIC, usage['prompt_tokens'], kind='prompt', **labels)
+    metrics.inc(TOKENS_METRIC, usage['output_tokens'], kind='output', **labels)
+    if usage['round'] > 0:
+        metrics.inc('edugenie_gemini_continuations_total', **labels)
@@ -0,0 +1,84 @@
+"""
+Who the current student is.
+
+When Streamlit authentication is configured (an [auth] section in
+secrets.toml) and the student has logged in, their identity provider subject
+or email is the user ID. Otherwise each browser gets an anonymous learner ID
+that is kept in the `uid` query parameter, so a reload or bookmark keeps the
+same stats without an account.
+"""
+import hashlib
+import re
+import uuid
+
+import streamlit as st
+
+_ANONYMOUS_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+def auth_configured():
+    """True when secrets.toml has an [auth] section for st.login()"""
+    try:
+        return 'auth' in st.secrets
+    except Exception:
+        return False
+
+
+def _logged_in_id():
+    if not auth_configured():
+        return None
+    try:
+        if not st.user.is_logged_in:
+            return None
+        subject = st.user.get('sub') or st.user.get('email')
+    except Exception:
+        return None
+    if not subject:
+        return None
+    # Document IDs can't contain '/', and raw emails don't belong in paths
+    return 'u_' + hashlib.sha256(str(subject).encode('utf-8')).hexdigest()[:32]
+
+
+def _anonymous_id():
+    uid = st.query_params.get('uid', '')
+    if not _ANONYMOUS_ID.match(uid):
+        uid = uuid.uuid4().hex
+        st.query_params['uid'] = uid
+    return 'anon_' + uid
+
+
+def current_user_id():
+    """Stable user ID for this session, resolved once per session"""
+    user_id = _logged_in_id()
+    if user_id is None:
+        user_id = st.session_state.get('anonymous_user_id')
+        if user_id is None:
+            user_id = st.session_state.anonymous_user_id = _anonymous_id()
+    return user_id
+
+
+def session_id():
+    """ID of the current browser session (not the student), for per-session bookkeeping"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else 'no-session'
+
+
+def display_name():
+    """Name to greet a logged-in student with, or None"""
+    if _logged_in_id() is None:
+        return None
+    return st.user.get('name') or st.user.get('email')
+
+
+def render_account_controls():
+    """Log in / log out buttons for the sidebar when authentication is configured"""
+    if not auth_configured():
+        return
+    name = display_name()
+    if name:
+        st.caption(f"Signed in as {name}")
+        st.button("Log out", on_click=st.logout)
+    else:
+        st.caption("Log in to keep your stats across devices")
+        st.button("Log in", on_click=st.login)
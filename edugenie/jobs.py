@@ -0,0 +1,145 @@
+"""
+Process-level background jobs for long-running generation.
+
+Pages submit work and keep only the returned job ID in session state. The work
+runs on a shared worker pool, so it keeps going when the script run that
+submitted it is interrupted by a click or a websocket reconnect, and the page
+polls until the result is ready.
+
+Finished jobs are kept in a bounded store: the oldest finished jobs are evicted
+first once EDUGENIE_JOB_STORE_SIZE is reached, and finished jobs older than
+EDUGENIE_JOB_TTL_SECONDS are dropped.
+
+Jobs submitted with an `owner` (a user ID) are refused when they start if that
+user has used up their daily token budget (see edugenie.usage).
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from edugenie import metrics, usage
+
+MAX_WORKERS = int(os.getenv('EDUGENIE_JOB_WORKERS', '8'))
+STORE_SIZE = int(os.getenv('EDUGENIE_JOB_STORE_SIZE', '500'))
+RESULT_TTL = float(os.getenv('EDUGENIE_JOB_TTL_SECONDS', '1800'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_lock = threading.Lock()
+_jobs = OrderedDict()
+_executor = None
+_local = threading.local()
+
+
+class Job:
+    """State of one submitted unit of work"""
+
+    def __init__(self, kind, owner=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.progress = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def elapsed(self):
+        end = self.finished_at or time.time()
+        return end - (self.started_at or self.created_at)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='edugenie-job')
+        return _executor
+
+
+def _evict_locked():
+    now = time.time()
+    for job_id in [j.id for j in _jobs.values() if j.finished and now - j.finished_at > RESULT_TTL]:
+        del _jobs[job_id]
+    if len(_jobs) <= STORE_SIZE:
+        return
+    for job_id in [j.id for j in _jobs.values() if j.finished]:
+        del _jobs[job_id]
+        metrics.inc('edugenie_jobs_evicted_total')
+        if len(_jobs) <= STORE_SIZE:
+            return
+
+
+def _run(job, fn, args, kwargs):
+    job.status = RUNNING
+    job.started_at = time.time()
+    _local.job = job
+    try:
+        if job.owner:
+            usage.check_budget(job.owner)
+        job.result = fn(*args, **kwargs)
+        job.status = DONE
+    except Exception as e:
+        job.error = str(e) or type(e).__name__
+        job.status = FAILED
+    finally:
+        _local.job = None
+        job.finished_at = time.time()
+        metrics.observe('edugenie_job_seconds', job.finished_at - job.created_at, kind=job.kind, status=job.status)
+
+
+def submit(fn, *args, kind='generic', owner=None, **kwargs):
+    """Run fn(*args, **kwargs) on the worker pool and return the job ID
+
+    With `owner`, the job fails instead of running once that user is over budget.
+    """
+    job = Job(kind, owner)
+    with _lock:
+        _jobs[job.id] = job
+        _evict_locked()
+    _get_executor().submit(_run, job, fn, args, kwargs)
+    metrics.inc('edugenie_jobs_submitted_total', kind=kind)
+    return job.id
+
+
+def get(job_id):
+    """The Job for `job_id`, or None if it is unknown or was evicted"""
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def discard(job_id):
+    """Forget a job once its result has been consumed"""
+    with _lock:
+        _jobs.pop(job_id, None)
+
+
+def report_progress(progress):
+    """Publish partial progress for the job running on this thread (no-op elsewhere)"""
+    job = getattr(_local, 'job', None)
+    if job is not None:
+        job.progress = progress
+
+
+def wait(job_id, timeout=None, poll_interval=0.05):
+    """Block until the job finishes or `timeout` passes; returns the Job or None"""
+    deadline = time.time() + timeout if timeout is not None else None
+    while True:
+        job = get(job_id)
+        if job is None or job.finished:
+            return job
+        if deadline is not None and time.time() >= deadline:
+            return job
+        time.sleep(poll_interval)
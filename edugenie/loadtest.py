@@ -0,0 +1,344 @@
+"""
+Multi-session load test for the Streamlit pages.
+
+Drives the real scripts through Streamlit's AppTest with N concurrent simulated
+students against the local Gemini/Firestore stand-ins, then reports throughput,
+per-phase latency percentiles, CPU and memory per session.
+
+AppTest keeps a process-global runtime, so concurrent students run in separate
+worker processes, each driving its share of sessions back to back. CPU per
+session is what bounds a single replica, so the report also gives the implied
+sessions per minute per core.
+
+Rerun cost: for each step the report also counts full script runs, quiz panel
+(fragment) renders with their mean time, and sidebar stats reads, taken from
+the page's own metrics. AppTest always reruns the whole script, so "panel ms"
+next to the step's p50 is what an answer or Previous/Next click costs in a
+browser, where only the fragment reruns, against what a full rerun costs.
+
+    python -m edugenie.loadtest --sessions 50 --concurrency 10 --gemini-latency 1.5
+    python -m edugenie.loadtest --flow content --sessions 20
+
+Quiz flow:    generate -> start -> answer (per question) -> submit (grades and saves)
+Content flow: generate -> save -> library
+"""
+import argparse
+import multiprocessing
+import os
+import pickle
+import resource
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUIZ_SCRIPT = os.path.join(ROOT, 'Quiz_Generator.py')
+CONTENT_SCRIPT = os.path.join(ROOT, 'pages', 'content_generator.py')
+
+# Spans read from edugenie.metrics around every step, and the counter of full script runs
+RERUN_SPANS = ('quiz_panel', 'get_user_insights')
+SCRIPT_RUNS_METRIC = 'edugenie_script_runs_total'
+
+TOPICS = ['Photosynthesis', 'The Solar System', 'World War II', 'Cell Biology', 'Linear Algebra',
+          'Plate Tectonics', 'The French Revolution', 'Machine Learning']
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def _rerun_totals():
+    """{span or 'script_runs': (count, seconds)} recorded so far in this process"""
+    from edugenie import metrics
+
+    histograms, counters = metrics.snapshot()
+    totals = {}
+    for (name, labels), histogram in histograms.items():
+        phase = dict(labels).get('phase')
+        if name == metrics.PHASE_METRIC and phase in RERUN_SPANS:
+            count, seconds = totals.get(phase, (0, 0.0))
+            totals[phase] = (count + histogram.count, seconds + histogram.sum)
+    totals['script_runs'] = (sum(value for (name, _), value in counters.items() if name == SCRIPT_RUNS_METRIC), 0.0)
+    return totals
+
+
+class Recorder:
+    """Phase timings and per-session stats collected inside one worker"""
+
+    def __init__(self):
+        self.phases = {}
+        self.reruns = {}  # step -> {span: [count, seconds]}
+        self.errors = {}
+        self.state_bytes = []
+        self.completed = 0
+        self.cpu_seconds = 0.0
+        self.rss_growth_kib = 0
+
+    def time(self, phase, fn):
+        before = _rerun_totals()
+        start = time.perf_counter()
+        fn()
+        self.phases.setdefault(phase, []).append(time.perf_counter() - start)
+        reruns = self.reruns.setdefault(phase, {})
+        for name, (count, seconds) in _rerun_totals().items():
+            old_count, old_seconds = before.get(name, (0, 0.0))
+            totals = reruns.setdefault(name, [0, 0.0])
+            totals[0] += count - old_count
+            totals[1] += seconds - old_seconds
+
+    def error(self, phase, exc):
+        key = f"{phase}: {type(exc).__name__}: {exc}"[:160]
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def session_done(self, app):
+        try:
+            self.state_bytes.append(len(pickle.dumps(app.session_state.to_dict())))
+        except Exception:
+            pass
+        self.completed += 1
+
+    def merge(self, other):
+        for phase, values in other.phases.items():
+            self.phases.setdefault(phase, []).extend(values)
+        for phase, spans in other.reruns.items():
+            for name, (count, seconds) in spans.items():
+                totals = self.reruns.setdefault(phase, {}).setdefault(name, [0, 0.0])
+                totals[0] += count
+                totals[1] += seconds
+        for message, count in other.errors.items():
+            self.errors[message] = self.errors.get(message, 0) + count
+        self.state_bytes.extend(other.state_bytes)
+        self.completed += other.completed
+        self.cpu_seconds += other.cpu_seconds
+        self.rss_growth_kib += other.rss_growth_kib
+
+
+def _button(app, label, sidebar=False):
+    buttons = app.sidebar.button if sidebar else app.button
+    for button in buttons:
+        if button.label == label:
+            return button
+    raise RuntimeError(f"Button not found: {label}")
+
+
+def _has_button(app, label, sidebar=False):
+    return any(b.label == label for b in (app.sidebar.button if sidebar else app.button))
+
+
+def _click_and_wait(app, button, ready, timeout, poll_interval=0.1):
+    """Click, then rerun (as the polling fragment would) until `ready(app)` or an error shows"""
+    button.click().run()
+    deadline = time.perf_counter() + timeout
+    while not ready(app) and not app.error and not app.exception:
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Background job did not finish in time")
+        time.sleep(poll_interval)
+        app.run()
+    if not ready(app) and app.error:
+        raise RuntimeError(f"failed: {app.error[0].value}")
+
+
+def _check(app, phase):
+    if app.exception:
+        raise RuntimeError(f"{phase} raised: {app.exception[0].message}")
+
+
+def run_quiz_session(recorder, session_no, num_questions, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(QUIZ_SCRIPT, default_timeout=timeout)
+    phase = 'load'
+    try:
+        recorder.time(phase, app.run)
+        _check(app, phase)
+
+        phase = 'generate'
+        app.text_input(key='topic').input(TOPICS[session_no % len(TOPICS)])
+        app.slider(key='num_q').set_value(num_questions)
+        recorder.time(phase, lambda: _click_and_wait(
+            app, _button(app, "🚀 Generate Quiz"), lambda a: _has_button(a, "🎯 Start Quiz"), timeout))
+        _check(app, phase)
+
+        phase = 'start'
+        recorder.time(phase, _button(app, "🎯 Start Quiz").click().run)
+        _check(app, phase)
+
+        phase = 'answer'
+        for _ in range(num_questions):
+            labels = [b.label for b in app.button]
+            if "✅ Submit Quiz" in labels:
+                break
+            if app.radio:
+                app.radio[0].set_value(app.radio[0].options[session_no % len(app.radio[0].options)])
+            recorder.time(phase, _button(app, "➡️ Next").click().run)
+            _check(app, phase)
+
+        phase = 'submit'
+        recorder.time(phase, _button(app, "✅ Submit Quiz").click().run)
+        _check(app, phase)
+        recorder.session_done(app)
+    except Exception as e:
+        recorder.error(phase, e)
+
+
+def run_content_session(recorder, session_no, num_items, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(CONTENT_SCRIPT, default_timeout=timeout)
+    phase = 'load'
+    try:
+        recorder.time(phase, app.run)
+        _check(app, phase)
+
+        phase = 'generate'
+        app.sidebar.text_input[0].input(TOPICS[session_no % len(TOPICS)])
+        app.sidebar.slider[0].set_value(num_items)
+        recorder.time(phase, lambda: _click_and_wait(
+            app, _button(app, "🚀 Generate Content", sidebar=True), lambda a: _has_button(a, "💾 Save to Firestore"), timeout))
+        _check(app, phase)
+
+        phase = 'save'
+        recorder.time(phase, _button(app, "💾 Save to Firestore").click().run)
+        _check(app, phase)
+
+        phase = 'library'
+        recorder.time(phase, _button(app, "📚 Access Saved Content", sidebar=True).click().run)
+        _check(app, phase)
+        recorder.session_done(app)
+    except Exception as e:
+        recorder.error(phase, e)
+
+
+def _max_rss_kib():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def _worker(flow, session_numbers, items, timeout):
+    """Run a share of the sessions sequentially in this process"""
+    os.environ['EDUGENIE_OFFLINE'] = '1'
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    from streamlit.testing.v1 import AppTest
+
+    # Untimed warm-up so imports and first-run compilation are not billed to a session
+    AppTest.from_file(QUIZ_SCRIPT if flow == 'quiz' else CONTENT_SCRIPT, default_timeout=timeout).run()
+
+    runner = run_quiz_session if flow == 'quiz' else run_content_session
+    recorder = Recorder()
+    rss_start = _max_rss_kib()
+    cpu_start = time.process_time()
+    for n in session_numbers:
+        runner(recorder, n, items, timeout)
+    recorder.cpu_seconds = time.process_time() - cpu_start
+    recorder.rss_growth_kib = _max_rss_kib() - rss_start
+    return recorder
+
+
+def run_load_test(flow='quiz', sessions=10, concurrency=5, items=5, timeout=60):
+    """Run `sessions` simulated students with `concurrency` in flight; returns a report dict"""
+    concurrency = max(1, min(concurrency, sessions))
+    shares = [list(range(sessions))[w::concurrency] for w in range(concurrency)]
+
+    recorder = Recorder()
+    wall_start = time.perf_counter()
+    with multiprocessing.get_context('spawn').Pool(concurrency) as pool:
+        results = [pool.apply_async(_worker, (flow, share, items, timeout)) for share in shares]
+        for result in results:
+            recorder.merge(result.get())
+    wall = time.perf_counter() - wall_start
+    cpu_per_session = recorder.cpu_seconds / sessions if sessions else 0.0
+
+    return {
+        'flow': flow,
+        'sessions': sessions,
+        'concurrency': concurrency,
+        'completed': recorder.completed,
+        'wall_seconds': wall,
+        'throughput_per_min': recorder.completed / wall * 60 if wall else 0.0,
+        'cpu_seconds_per_session': cpu_per_session,
+        'sessions_per_min_per_core': 60.0 / cpu_per_session if cpu_per_session else 0.0,
+        'rss_growth_kib_per_session': recorder.rss_growth_kib / sessions if sessions else 0.0,
+        'session_state_bytes_avg': sum(recorder.state_bytes) / len(recorder.state_bytes) if recorder.state_bytes else 0,
+        'phases': {
+            phase: {
+                'count': len(values),
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+            }
+            for phase, values in recorder.phases.items()
+        },
+        'reruns': {
+            phase: {
+                'script_runs': spans.get('script_runs', [0])[0] / len(recorder.phases[phase]),
+                'panel_renders': spans.get('quiz_panel', [0])[0] / len(recorder.phases[phase]),
+                'panel_ms': spans['quiz_panel'][1] / spans['quiz_panel'][0] * 1000
+                if spans.get('quiz_panel', [0])[0] else None,
+                'stats_reads': spans.get('get_user_insights', [0])[0] / len(recorder.phases[phase]),
+            }
+            for phase, spans in recorder.reruns.items() if recorder.phases.get(phase)
+        },
+        'errors': recorder.errors,
+    }
+
+
+def format_report(report):
+    lines = [
+        f"Flow: {report['flow']}  sessions: {report['sessions']}  concurrency: {report['concurrency']}",
+        f"Completed: {report['completed']}  wall: {report['wall_seconds']:.2f}s  "
+        f"throughput: {report['throughput_per_min']:.1f} sessions/min",
+        f"CPU per session: {report['cpu_seconds_per_session'] * 1000:.1f} ms  "
+        f"(~{report['sessions_per_min_per_core']:.0f} sessions/min per core)",
+        f"Memory per session: RSS growth {report['rss_growth_kib_per_session']:.1f} KiB  "
+        f"session_state {report['session_state_bytes_avg'] / 1024:.1f} KiB",
+        "",
+        f"{'phase':<10} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}",
+    ]
+    for phase, stats in report['phases'].items():
+        lines.append(f"{phase:<10} {stats['count']:>6} {stats['p50'] * 1000:>9.1f} "
+                     f"{stats['p95'] * 1000:>9.1f} {stats['p99'] * 1000:>9.1f}")
+    reruns = {phase: stats for phase, stats in report.get('reruns', {}).items() if stats['script_runs']}
+    if reruns:
+        lines.append("")
+        lines.append(f"{'per step':<10} {'runs':>6} {'panels':>7} {'panel ms':>9} {'stats reads':>12}")
+        for phase, stats in reruns.items():
+            panel_ms = f"{stats['panel_ms']:.1f}" if stats['panel_ms'] is not None else '-'
+            lines.append(f"{phase:<10} {stats['script_runs']:>6.2f} {stats['panel_renders']:>7.2f} {panel_ms:>9} "
+                         f"{stats['stats_reads']:>12.2f}")
+    if report['errors']:
+        lines.append("")
+        lines.append("Errors:")
+        for message, count in sorted(report['errors'].items(), key=lambda kv: -kv[1]):
+            lines.append(f"  {count:>4} x {message}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Edugenie Streamlit pages offline")
+    parser.add_argument('--flow', choices=['quiz', 'content'], default='quiz')
+    parser.add_argument('--sessions', type=int, default=10, help="total simulated students")
+    parser.add_argument('--concurrency', type=int, default=5, help="students in flight at once")
+    parser.add_argument('--items', type=int, default=5, help="questions per quiz / study items")
+    parser.add_argument('--gemini-latency', type=float, default=0.0, help="seconds per fake Gemini call")
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0)
+    parser.add_argument('--firestore-latency', type=float, default=0.0, help="seconds per fake Firestore round trip")
+    parser.add_argument('--timeout', type=float, default=60.0, help="seconds allowed per script run")
+    args = parser.parse_args(argv)
+
+    os.environ['EDUGENIE_FAKE_LATENCY'] = str(args.gemini_latency)
+    os.environ['EDUGENIE_FAKE_ERROR_RATE'] = str(args.gemini_error_rate)
+    os.environ['EDUGENIE_FAKE_FIRESTORE_LATENCY'] = str(args.firestore_latency)
+
+    report = run_load_test(args.flow, args.sessions, args.concurrency, args.items, args.timeout)
+    print(format_report(report))
+    return 0 if not report['errors'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
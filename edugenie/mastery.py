@@ -0,0 +1,268 @@
+"""
+Per-student mastery of each topic and Bloom's level (Bayesian knowledge tracing).
+
+Each (topic, Bloom's level) is a skill with a probability that the student has
+mastered it. Every answer updates it with the standard BKT step: Bayes' rule
+on the answer given slip and guess rates, then a chance P_LEARN of learning
+the skill from the practice. A student's whole state is one small document,
+
+    mastery/{user_id}   {'skills': {'<topic_key>|<level>': [p, answers]}, 'topics': {topic_key: topic}}
+
+save_quiz_attempt() adds the update to its batch, and a batch job recomputes
+every student from all stored answers. The job is vectorized across
+sequences: answers are sorted by (student, skill, time) and step t updates the
+t-th answer of every sequence at once, so the Python loop runs once per
+position of the longest sequence rather than once per answer.
+
+    python -m edugenie.mastery recompute
+    python -m edugenie.mastery benchmark --responses 5000000
+"""
+import argparse
+import datetime
+import os
+import time
+from contextlib import nullcontext
+
+import numpy as np
+
+from edugenie import breakers, cache, metrics, topics
+from edugenie.quizzes import BLOOMS_LEVELS
+
+COLLECTION = 'mastery'
+BATCH_LIMIT = 500
+P_INIT = float(os.getenv('EDUGENIE_BKT_INIT', '0.2'))
+P_LEARN = float(os.getenv('EDUGENIE_BKT_LEARN', '0.15'))
+P_SLIP = float(os.getenv('EDUGENIE_BKT_SLIP', '0.1'))
+MASTERED = float(os.getenv('EDUGENIE_MASTERY_THRESHOLD', '0.95'))
+GUESS = {'Multiple Choice': 0.25, 'True/False': 0.5}
+DEFAULT_GUESS = 0.2
+STATE_TTL = float(os.getenv('EDUGENIE_MASTERY_TTL_SECONDS', '600'))
+
+_states = cache.get_cache('mastery', maxsize=10000, ttl=STATE_TTL)
+
+
+def skill_key(topic_key, blooms_level):
+    return f"{topic_key}|{blooms_level}"
+
+
+def split_skill(key):
+    topic_key, _, blooms_level = key.rpartition('|')
+    return topic_key, blooms_level
+
+
+def guess_rate(question_type):
+    return GUESS.get(question_type, DEFAULT_GUESS)
+
+
+def step(p, correct, guess, slip=P_SLIP, learn=P_LEARN):
+    """One BKT update of mastery `p` (scalars or arrays)"""
+    right = p * (1 - slip) / (p * (1 - slip) + (1 - p) * guess)
+    wrong = p * slip / (p * slip + (1 - p) * (1 - guess))
+    posterior = np.where(correct, right, wrong)
+    return posterior + (1 - posterior) * learn
+
+
+def trace(sequences, correct, guess, num_sequences=None, init=P_INIT):
+    """Final mastery of every sequence
+
+    `sequences` gives each answer's sequence index and must be sorted so that
+    each sequence's answers are contiguous and in time order; `correct` and
+    `guess` are per answer. Returns (mastery, answers) per sequence.
+    """
+    sequences = np.asarray(sequences, dtype=np.int64)
+    correct = np.asarray(correct, dtype=bool)
+    guess = np.broadcast_to(np.asarray(guess, dtype=np.float64), sequences.shape)
+    num_sequences = int(sequences.max()) + 1 if num_sequences is None and len(sequences) else (num_sequences or 0)
+    counts = np.bincount(sequences, minlength=num_sequences)
+    p = np.full(num_sequences, init)
+    if not len(sequences):
+        return p, counts
+
+    # Position of every answer within its sequence, then answers grouped by position
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    position = np.arange(len(sequences)) - starts[sequences]
+    by_position = np.argsort(position, kind='stable')
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(position))))
+    for t in range(len(bounds) - 1):
+        rows = by_position[bounds[t]:bounds[t + 1]]
+        seqs = sequences[rows]
+        p[seqs] = step(p[seqs], correct[rows], guess[rows])
+    return p, counts
+
+
+def _load(db, user_id, guarded):
+    state = _states.get(user_id)
+    if state is None:
+        state = {'skills': {}, 'topics': {}}
+        if db is not None and user_id:
+            with breakers.guard('firestore') if guarded else nullcontext(), metrics.span('mastery_load'):
+                snapshot = db.collection(COLLECTION).document(user_id).get()
+            if snapshot.exists:
+                data = snapshot.to_dict()
+                state = {'skills': dict(data.get('skills') or {}), 'topics': dict(data.get('topics') or {})}
+        _states.set(user_id, state)
+    return state
+
+
+def load(db, user_id):
+    """{'skills': {key: [p, answers]}, 'topics': {topic_key: topic}} for a user, cached per process"""
+    return _load(db, user_id, guarded=True)
+
+
+def update(db, user_id, topic, blooms_level, question_type, questions_data, batch):
+    """Add the mastery update for one saved attempt to `batch`; returns the new state
+
+    Call remember() with the returned state once the batch has committed.
+    Questions may carry their own 'blooms_level' (adaptive quizzes).
+    Runs inside the caller's 'firestore' breaker guard, the one around the
+    batch, so the read of an uncached state is not guarded a second time.
+    """
+    state = _load(db, user_id, guarded=False)
+    topic_key = topics.topic_key(topic)
+    skills = dict(state['skills'])
+    changed = {}
+    for question in questions_data:
+        key = skill_key(topic_key, question.get('blooms_level') or blooms_level)
+        p, answers = skills.get(key, [P_INIT, 0])
+        p = float(step(p, bool(question.get('is_correct')), guess_rate(question_type)))
+        skills[key] = changed[key] = [round(p, 4), answers + 1]
+    new_state = {'skills': skills, 'topics': dict(state['topics'], **{topic_key: topic})}
+    batch.set(db.collection(COLLECTION).document(user_id), {
+        'skills': changed,
+        'topics': {topic_key: topic},
+        'updated_at': datetime.datetime.utcnow(),
+    }, merge=True)
+    return new_state
+
+
+def remember(user_id, state):
+    _states.set(user_id, state)
+
+
+def summary(state, limit=6):
+    """The most practised skills as (topic, level, mastery, answers), most answers first"""
+    rows = []
+    for key, (p, answers) in state['skills'].items():
+        topic_key, level = split_skill(key)
+        rows.append((state['topics'].get(topic_key, topic_key), level, p, answers))
+    rows.sort(key=lambda row: (-row[3], row[0], BLOOMS_LEVELS.index(row[1]) if row[1] in BLOOMS_LEVELS else 0))
+    return rows[:limit]
+
+
+def recommend(state):
+    """(topic, Bloom's level, reason) to practise next, or None without any answers
+
+    The weakest practised skill that isn't mastered yet; if everything
+    practised is mastered, the next level up of the most practised topic.
+    """
+    if not state['skills']:
+        return None
+    weakest = None
+    for key, (p, answers) in state['skills'].items():
+        if p < MASTERED and (weakest is None or p < weakest[1]):
+            weakest = (key, p)
+    if weakest is not None:
+        topic_key, level = split_skill(weakest[0])
+        return state['topics'].get(topic_key, topic_key), level, f"{weakest[1]:.0%} mastered"
+
+    answers_by_topic = {}
+    for key, (_, answers) in state['skills'].items():
+        topic_key, _ = split_skill(key)
+        answers_by_topic[topic_key] = answers_by_topic.get(topic_key, 0) + answers
+    for topic_key in sorted(answers_by_topic, key=answers_by_topic.get, reverse=True):
+        for level in BLOOMS_LEVELS:
+            if skill_key(topic_key, level) not in state['skills']:
+                return state['topics'].get(topic_key, topic_key), level, "next level up"
+    return None
+
+
+def load_responses(db):
+    """All stored answers as arrays sorted by (student, skill, time), plus the sequence labels"""
+    query = db.collection_group('questions').select(
+        ['user_id', 'topic', 'topic_key', 'blooms_level', 'question_type', 'is_correct', 'created_at',
+         'question_number'])
+    sequence_index, labels, names = {}, [], {}
+    sequences, correct, guess, when, number = [], [], [], [], []
+    for doc in query.stream():
+        data = doc.to_dict()
+        user_id, topic_key, level = data.get('user_id'), data.get('topic_key'), data.get('blooms_level')
+        if not user_id or not topic_key or not level:
+            continue
+        label = (user_id, skill_key(topic_key, level))
+        if label not in sequence_index:
+            sequence_index[label] = len(labels)
+            labels.append(label)
+        names.setdefault((user_id, topic_key), data.get('topic') or topic_key)
+        sequences.append(sequence_index[label])
+        correct.append(bool(data.get('is_correct')))
+        guess.append(guess_rate(data.get('question_type')))
+        created = data.get('created_at')
+        when.append(created.timestamp() if hasattr(created, 'timestamp') else 0.0)
+        number.append(data.get('question_number') or 0)
+
+    sequences = np.array(sequences, dtype=np.int64)
+    order = np.lexsort((np.array(number), np.array(when), sequences))
+    return sequences[order], np.array(correct, dtype=bool)[order], np.array(guess)[order], labels, names
+
+
+def recompute(db):
+    """Rebuild every student's mastery document from all stored answers; returns summary stats"""
+    started = time.perf_counter()
+    with metrics.span('mastery_load_responses'):
+        sequences, correct, guess, labels, names = load_responses(db)
+    with metrics.span('mastery_trace'):
+        p, counts = trace(sequences, correct, guess, len(labels))
+
+    states = {}
+    for idx, (user_id, key) in enumerate(labels):
+        state = states.setdefault(user_id, {'skills': {}, 'topics': {}})
+        state['skills'][key] = [round(float(p[idx]), 4), int(counts[idx])]
+        topic_key, _ = split_skill(key)
+        state['topics'][topic_key] = names[(user_id, topic_key)]
+
+    updated_at = datetime.datetime.utcnow()
+    users = list(states)
+    with metrics.span('mastery_store'):
+        for start in range(0, len(users), BATCH_LIMIT):
+            batch = db.batch()
+            for user_id in users[start:start + BATCH_LIMIT]:
+                batch.set(db.collection(COLLECTION).document(user_id), dict(states[user_id], updated_at=updated_at))
+            batch.commit()
+    _states.clear()
+    return {'responses': len(sequences), 'users': len(users), 'skills': len(labels),
+            'seconds': time.perf_counter() - started}
+
+
+def benchmark(num_responses=5_000_000, num_sequences=200_000, seed=0):
+    """Seconds to trace synthetic answers with the vectorized batch update"""
+    rng = np.random.default_rng(seed)
+    sequences = np.sort(rng.integers(0, num_sequences, num_responses))
+    correct = rng.random(num_responses) < 0.6
+    start = time.perf_counter()
+    trace(sequences, correct, 0.25, num_sequences)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-student mastery by topic and Bloom's level")
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('recompute', help="rebuild every student's mastery from stored answers")
+    bench = commands.add_parser('benchmark', help="trace synthetic answers")
+    bench.add_argument('--responses', type=int, default=5_000_000)
+    bench.add_argument('--sequences', type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'recompute':
+        from edugenie import backends
+        stats = recompute(backends.get_firestore())
+        print(f"{stats['responses']:,} answers, {stats['users']:,} students, {stats['skills']:,} skills "
+              f"in {stats['seconds']:.2f}s")
+    elif args.command == 'benchmark':
+        seconds = benchmark(args.responses, args.sequences)
+        print(f"{args.responses:,} answers in {args.sequences:,} sequences traced in {seconds:.2f}s")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+In-process latency metrics for Edugenie.
+
+Timing spans are recorded into fixed-bucket histograms held in memory and can be
+exposed as Prometheus text, either on a small HTTP endpoint or by flushing to a
+log file periodically. Recording a span costs one perf_counter pair, a lock and a
+bisect, so it is safe to leave on in production.
+
+Configuration (environment variables):
+    EDUGENIE_METRICS_PORT           - serve /metrics on this port
+    EDUGENIE_METRICS_FILE           - write Prometheus text to this file periodically
+    EDUGENIE_METRICS_FLUSH_SECONDS  - flush interval for the file (default 60)
+"""
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PHASE_METRIC = 'edugenie_phase_seconds'
+
+# Seconds. Covers fast Firestore reads up to slow Gemini generations.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_gauges = {}
+_started = False
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Approximate quantile from bucket upper bounds"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        running = 0
+        for idx, bucket_count in enumerate(self.counts):
+            running += bucket_count
+            if running >= target:
+                return self.buckets[idx] if idx < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def observe(name, value, **labels):
+    """Record a single observation into the named histogram"""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = Histogram()
+        hist.observe(value)
+
+
+def inc(name, amount=1, **labels):
+    """Increment a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to its current value"""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def gauges():
+    """Copy of the current gauges, keyed by (name, labels)"""
+    with _lock:
+        return dict(_gauges)
+
+
+@contextmanager
+def span(phase, **labels):
+    """Time a block and record it under edugenie_phase_seconds{phase=...}"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(PHASE_METRIC, time.perf_counter() - start, phase=phase, **labels)
+
+
+def snapshot():
+    """Copy of the current histograms and counters, keyed by (name, labels)"""
+    with _lock:
+        hists = {}
+        for key, hist in _histograms.items():
+            copy = Histogram(hist.buckets)
+            copy.counts = list(hist.counts)
+            copy.sum = hist.sum
+            copy.count = hist.count
+            hists[key] = copy
+        return hists, dict(_counters)
+
+
+def reset():
+    """Drop all recorded metrics"""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = [(k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def render_prometheus():
+    """Render all metrics in the Prometheus text exposition format"""
+    hists, counters = snapshot()
+    lines = []
+
+    seen = set()
+    for (name, labels), hist in sorted(hists.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        running = 0
+        for bound, bucket_count in zip(hist.buckets, hist.counts):
+            running += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', repr(bound))])} {running}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {hist.count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {hist.sum}")
+        lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} counter")
+            seen.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), value in sorted(gauges().items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} gauge")
+            seen.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') not in ('', '/metrics'):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='0.0.0.0'):
+    """Serve /metrics from a daemon thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='edugenie-metrics', daemon=True)
+    thread.start()
+    return server
+
+
+def start_file_flusher(path, interval=60.0):
+    """Rewrite the Prometheus text to `path` every `interval` seconds"""
+    def _loop():
+        while True:
+            time.sleep(interval)
+            try:
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(render_prometheus())
+                os.replace(tmp_path, path)
+            except OSError:
+                pass
+
+    thread = threading.Thread(target=_loop, name='edugenie-metrics-flush', daemon=True)
+    thread.start()
+    return thread
+
+
+def start_from_env():
+    """Start the configured exporters once per process"""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+
+    port = os.getenv('EDUGENIE_METRICS_PORT')
+    if port:
+        try:
+            start_http_server(int(port))
+        except (OSError, ValueError):
+            pass
+
+    path = os.getenv('EDUGENIE_METRICS_FILE')
+    if path:
+        interval = float(os.getenv('EDUGENIE_METRICS_FLUSH_SECONDS', '60'))
+        start_file_flusher(path, interval)
@@ -0,0 +1,168 @@
+"""
+Outline-then-parallel generation for long study notes.
+
+A compact outline is generated first, then each section is generated
+concurrently with bounded parallelism and the sections are assembled in order.
+Outlines and sections are cached per process, so changing the number of items
+or the audience only regenerates what actually changed:
+
+- outline cache: (topic, audience) -> longest known list of section titles;
+  asking for fewer sections reuses a prefix, asking for more only requests
+  the missing titles
+- section cache: (topic, audience, title, explanations) -> section body
+
+Both caches are shared between replicas when shared state is configured, and
+each outline extension or section is generated under a single-flight lock,
+so replicas asked for the same notes at once generate them only once.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from edugenie import cache, prompts, sharedstate, topics
+
+DEFAULT_PARALLELISM = int(os.getenv('EDUGENIE_SECTION_PARALLELISM', '4'))
+
+_outline_cache = cache.get_cache('notes_outline', maxsize=256, shared=True)
+_section_cache = cache.get_cache('notes_sections', maxsize=4096, shared=True)
+
+
+def build_outline_prompt(topic, audience, num_sections, existing=None):
+    """Prompt for a compact outline, or for more titles extending `existing`"""
+    return prompts.outline_prompt(topic, audience, num_sections, existing=existing)
+
+
+def parse_outline(text):
+    """Extract section titles from a numbered or bulleted outline"""
+    titles = []
+    for line in (text or '').splitlines():
+        line = line.strip()
+        match = re.match(r'^(?:\d+[.)]|[-*•])\s*(.+)$', line)
+        if not match:
+            continue
+        title = match.group(1).strip().strip('*#').strip()
+        if title:
+            titles.append(title)
+    return titles
+
+
+def build_section_prompt(topic, audience, title, index, outline, include_explanations):
+    """Prompt for one section of the notes"""
+    return prompts.section_prompt(topic, audience, title, index, outline, include_explanations)
+
+
+def get_outline(generate, topic, audience, num_sections):
+    """Return (titles, error), reusing cached outlines where possible"""
+    key = cache.make_key(topics.cache_key(topic), audience)
+
+    def lookup():
+        known = _outline_cache.get(key) or []
+        return (known[:num_sections], None) if len(known) >= num_sections else None
+
+    def compute():
+        known = _outline_cache.get(key) or []
+        missing = num_sections - len(known)
+        text, err = generate(build_outline_prompt(topic, audience, missing, existing=known))
+        if err:
+            return None, err
+
+        titles = known + parse_outline(text)[:missing]
+        if len(titles) < num_sections:
+            return None, f"Outline had {len(titles)} sections, expected {num_sections}"
+
+        _outline_cache.set(key, titles)
+        return titles, None
+
+    return lookup() or sharedstate.single_flight(f"notes_outline:{key}", lookup, compute)
+
+
+def section_key(topic, audience, title, include_explanations):
+    return cache.make_key(topics.cache_key(topic), audience, title.lower(), bool(include_explanations))
+
+
+def _generate_section(generate, key, prompt):
+    """(body, error) for one section, generated by one replica at a time"""
+    def lookup():
+        body = _section_cache.get(key)
+        return (body, None) if body is not None else None
+
+    def compute():
+        text, err = generate(prompt)
+        if err:
+            return None, err
+        body = text.strip()
+        _section_cache.set(key, body)
+        return body, None
+
+    return sharedstate.single_flight(f"notes_sections:{key}", lookup, compute)
+
+
+def generate_sections(generate, topic, audience, titles, include_explanations,
+                      parallelism=DEFAULT_PARALLELISM, on_section=None):
+    """Generate section bodies concurrently; returns (bodies, errors)
+
+    `on_section(index, title, body, cached)` is called from the calling thread as
+    each section becomes available, cached sections first.
+    """
+    bodies = [None] * len(titles)
+    errors = {}
+    pending = []
+
+    keys = [section_key(topic, audience, title, include_explanations) for title in titles]
+    cached = _section_cache.get_many(keys)
+    for idx, title in enumerate(titles):
+        body = cached.get(keys[idx])
+        if body is not None:
+            bodies[idx] = body
+            if on_section:
+                on_section(idx, title, body, True)
+        else:
+            pending.append(idx)
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+            futures = {
+                pool.submit(_generate_section, generate, keys[idx],
+                            build_section_prompt(topic, audience, titles[idx], idx, titles, include_explanations)): idx
+                for idx in pending
+            }
+            for future in as_completed(futures):
+                idx = futures[future]
+                try:
+                    body, err = future.result()
+                except Exception as e:
+                    body, err = None, str(e)
+                if err:
+                    errors[idx] = err
+                    continue
+                bodies[idx] = body
+                if on_section:
+                    on_section(idx, titles[idx], body, False)
+
+    return bodies, errors
+
+
+def assemble(titles, bodies):
+    """Join sections in outline order as numbered items"""
+    return '\n\n'.join(f"{i}. {title}\n{body}" for i, (title, body) in enumerate(zip(titles, bodies), 1))
+
+
+def generate_sectioned_notes(generate, topic, audience, num_sections, include_explanations,
+                             parallelism=DEFAULT_PARALLELISM, on_outline=None, on_section=None):
+    """Outline, then sections in parallel; returns (text, error)
+
+    `generate(prompt)` must return (text, error) like generate_content().
+    """
+    titles, err = get_outline(generate, topic, audience, num_sections)
+    if err:
+        return None, err
+    if on_outline:
+        on_outline(titles)
+
+    bodies, errors = generate_sections(generate, topic, audience, titles, include_explanations,
+                                       parallelism=parallelism, on_section=on_section)
+    if errors:
+        failed = ', '.join(str(idx + 1) for idx in sorted(errors))
+        return None, f"Sections {failed} failed: {next(iter(errors.values()))}"
+
+    return assemble(titles, bodies), None
@@ -0,0 +1,95 @@
+"""
+Background prefetch of a student's next quiz.
+
+Each user has at most one prefetch slot holding the job ID of a follow-up quiz
+generated while they answer the current one. Slots live in a bounded,
+process-wide LRU; slots that are replaced, evicted, expired or explicitly
+dropped without being used are counted as discarded.
+
+Metrics: edugenie_prefetch_total{outcome="started|used|discarded", reason=...}
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from edugenie import jobs, metrics
+
+MAX_SLOTS = int(os.getenv('EDUGENIE_PREFETCH_SLOTS', '1000'))
+SLOT_TTL = float(os.getenv('EDUGENIE_PREFETCH_TTL_SECONDS', '1800'))
+PREFETCH_METRIC = 'edugenie_prefetch_total'
+
+_lock = threading.Lock()
+_slots = OrderedDict()
+
+
+class Slot:
+    def __init__(self, job_id, params):
+        self.job_id = job_id
+        self.params = params
+        self.created_at = time.time()
+
+
+def _drop_locked(user_key, reason):
+    slot = _slots.pop(user_key, None)
+    if slot is not None:
+        jobs.discard(slot.job_id)
+        metrics.inc(PREFETCH_METRIC, outcome='discarded', reason=reason)
+    return slot
+
+
+def _sweep_locked():
+    now = time.time()
+    for user_key in [k for k, s in _slots.items() if now - s.created_at > SLOT_TTL]:
+        _drop_locked(user_key, 'expired')
+    while len(_slots) > MAX_SLOTS:
+        _drop_locked(next(iter(_slots)), 'evicted')
+
+
+def start(user_key, params, fn, *args, **kwargs):
+    """Prefetch fn(*args, **kwargs) for `user_key` unless the same params are already in flight"""
+    with _lock:
+        current = _slots.get(user_key)
+        if current is not None and current.params == params:
+            return current.job_id
+        if current is not None:
+            _drop_locked(user_key, 'replaced')
+
+    job_id = jobs.submit(fn, *args, kind='prefetch', owner=user_key, **kwargs)
+    with _lock:
+        _slots[user_key] = Slot(job_id, params)
+        _slots.move_to_end(user_key)
+        _sweep_locked()
+    metrics.inc(PREFETCH_METRIC, outcome='started')
+    return job_id
+
+
+def peek(user_key):
+    """The user's pending Slot without claiming it, or None"""
+    with _lock:
+        _sweep_locked()
+        return _slots.get(user_key)
+
+
+def claim(user_key):
+    """Take the user's prefetched slot; returns the Slot or None
+
+    The job may still be running; the caller polls it like any other job.
+    """
+    with _lock:
+        _sweep_locked()
+        slot = _slots.pop(user_key, None)
+    if slot is None:
+        return None
+    job = jobs.get(slot.job_id)
+    if job is None or job.status == jobs.FAILED:
+        metrics.inc(PREFETCH_METRIC, outcome='discarded', reason='failed' if job else 'expired')
+        return None
+    metrics.inc(PREFETCH_METRIC, outcome='used', ready='yes' if job.finished else 'no')
+    return slot
+
+
+def discard(user_key, reason='unused'):
+    """Drop the user's prefetch without using it"""
+    with _lock:
+        _drop_locked(user_key, reason)
@@ -0,0 +1,266 @@
+"""
+Prompt templates for every Gemini call.
+
+Templates are compiled once at import: dedented, trailing whitespace and runs
+of blank lines removed, and lines that hold nothing but one placeholder marked
+so they disappear when it renders empty (the avoid list, the example block).
+Every prompt token is billed and adds latency, so the whitespace the old
+indented f-strings sent is gone, and quizzes get one worked example in the
+format of their own question type instead of a generic skeleton with empty
+option slots.
+
+Each render records the prompt's estimated tokens as edugenie_prompt_tokens
+{template} (last size) and edugenie_prompt_tokens_total{template}. Sizes of
+representative prompts are checked against prompt_sizes.json, so a template
+change that grows the prompts fails the tests:
+
+    python -m edugenie.prompts sizes            # offline estimate per template
+    python -m edugenie.prompts sizes --live     # Gemini's count_tokens (needs GEMINI_API_KEY)
+    python -m edugenie.prompts sizes --check    # fail if any prompt grew past the baseline
+    python -m edugenie.prompts sizes --write-baseline
+"""
+import argparse
+import json
+import os
+import re
+import string
+import sys
+import textwrap
+
+from edugenie import bank, metrics
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'prompt_sizes.json')
+# Allowed growth over the baseline before --check fails
+TOLERANCE = float(os.getenv('EDUGENIE_PROMPT_SIZE_TOLERANCE', '0.05'))
+
+_ONLY_FIELD = re.compile(r'\{\w+\}')
+
+
+def estimate_tokens(text):
+    """Rough token estimate (about four characters per token)"""
+    return max(1, (len(text or '') + 3) // 4)
+
+
+def count_tokens(prompt, model=None):
+    """Tokens in `prompt` from the model's count_tokens API, or the offline estimate without a model"""
+    if model is not None and hasattr(model, 'count_tokens'):
+        return model.count_tokens(prompt).total_tokens
+    return estimate_tokens(prompt)
+
+
+class Template:
+    """A prompt compiled once; render() fills in the placeholders"""
+
+    def __init__(self, name, text):
+        self.name = name
+        lines = []
+        for line in textwrap.dedent(text).strip('\n').splitlines():
+            line = line.rstrip()
+            if line or (lines and lines[-1]):
+                lines.append(line)
+        # (line, dropped when it renders empty)
+        self._lines = [(line, bool(_ONLY_FIELD.fullmatch(line.strip()))) for line in lines]
+        self.fields = sorted({field for _, field, _, _ in string.Formatter().parse(text) if field})
+
+    def render(self, **values):
+        out = []
+        for line, optional in self._lines:
+            rendered = line.format_map(values)
+            if optional and not rendered.strip():
+                continue
+            if not rendered and out and not out[-1]:
+                continue
+            out.append(rendered)
+        prompt = '\n'.join(out).strip()
+        tokens = estimate_tokens(prompt)
+        metrics.set_gauge('edugenie_prompt_tokens', tokens, template=self.name)
+        metrics.inc('edugenie_prompt_tokens_total', tokens, template=self.name)
+        return prompt
+
+
+# One worked example per question type, on a topic unlikely to be asked about
+QUIZ_EXAMPLES = {
+    'Multiple Choice': """\
+1. Which process releases water vapour from plant leaves?
+A. Condensation
+B. Transpiration
+C. Infiltration
+D. Runoff
+Answer: B
+Explanation: Plants lose water vapour through their stomata, which is transpiration.""",
+    'True/False': """\
+1. Condensation turns water vapour into liquid droplets.
+Answer: True
+Explanation: Cooling vapour condenses into the droplets that form clouds.""",
+    'Short Answer': """\
+1. What is water falling from clouds called?
+Answer: Precipitation
+Explanation: Rain, snow, sleet and hail are all precipitation.""",
+}
+
+QUIZ = Template('quiz', """
+    Generate exactly {num_questions} quiz questions based on these specifications:
+    - Topic: {topic}
+    - Bloom's Taxonomy Level: {blooms_level}
+    - Question Type: {question_type}
+
+    Format every question exactly like this example (on a different topic), numbering them from 1:
+    {example}
+
+    Make sure to provide exactly {num_questions} complete questions with all required components.
+    {avoid}
+    """)
+
+# Only the format instruction for the requested goal is sent
+STUDY_FORMATS = {
+    'Flashcards': "Use Q: ... and A: ... format with clear questions and concise answers.",
+    'Summary': "Use clear paragraphs with numbered sections covering key concepts.",
+    'Comprehensive Notes': "Provide detailed explanations with numbered points, examples, and important details.",
+}
+
+STUDY = Template('study', """
+    Generate {num_items} high-quality study items for the topic: {topic}.
+    Target audience: {audience}
+    Study goal: {goal}
+    Include explanations: {include_explanations}
+
+    Number each item (1., 2., 3., etc.). {goal_format}
+    Provide comprehensive, accurate, and educational content focused on learning and understanding the topic.
+    Do NOT generate quiz questions with multiple choice options - this is for study materials only.
+    """)
+
+OUTLINE = Template('outline', """
+    Create a compact outline of exactly {num_sections} section titles for comprehensive study notes.
+    Topic: {topic}
+    Target audience: {audience}
+
+    Return only the titles, numbered 1. to {num_sections}., one per line, with no descriptions.
+    """)
+
+OUTLINE_MORE = Template('outline_more', """
+    Topic: {topic}
+    Target audience: {audience}
+
+    Current outline:
+    {current}
+
+    Continue this outline with exactly {num_sections} more section titles for comprehensive study notes.
+    Return only the new titles, numbered from {first_number}, one per line, with no descriptions.
+    """)
+
+SECTION = Template('section', """
+    Write section {number} of {total} of comprehensive study notes.
+    Topic: {topic}
+    Target audience: {audience}
+    Section title: {title}
+    Include explanations: {include_explanations}
+    Other sections (do not repeat their content): {others}
+
+    Provide detailed explanations with key points, examples and important details.
+    Do not repeat the section title or add a section number; start directly with the content.
+    """)
+
+
+def quiz_prompt(topic, blooms_level, num_questions, question_type, avoid=None):
+    avoid_block = ''
+    if avoid:
+        avoid_block = "Do not repeat or paraphrase any of these existing questions:\n" + "\n".join(
+            f"- {bank.strip_number(text)}" for text in avoid)
+    return QUIZ.render(topic=topic, blooms_level=blooms_level, num_questions=num_questions,
+                       question_type=question_type, example=QUIZ_EXAMPLES.get(question_type, ''), avoid=avoid_block)
+
+
+def study_prompt(topic, audience, goal, num_items, include_explanations):
+    return STUDY.render(topic=topic, audience=audience, goal=goal, num_items=num_items,
+                        include_explanations=include_explanations, goal_format=STUDY_FORMATS.get(goal, ''))
+
+
+def outline_prompt(topic, audience, num_sections, existing=None):
+    if existing:
+        current = '\n'.join(f"{i}. {title}" for i, title in enumerate(existing, 1))
+        return OUTLINE_MORE.render(topic=topic, audience=audience, current=current, num_sections=num_sections,
+                                   first_number=len(existing) + 1)
+    return OUTLINE.render(topic=topic, audience=audience, num_sections=num_sections)
+
+
+def section_prompt(topic, audience, title, index, outline, include_explanations):
+    others = '; '.join(t for i, t in enumerate(outline) if i != index)
+    return SECTION.render(number=index + 1, total=len(outline), topic=topic, audience=audience, title=title,
+                          include_explanations=include_explanations, others=others)
+
+
+_OUTLINE = ['Light reactions', 'Calvin cycle', 'Photorespiration', 'Limiting factors']
+
+
+def samples():
+    """Representative prompt per template and variant, {name: prompt}, for size tracking"""
+    prompts = {f"quiz/{question_type}": quiz_prompt('Photosynthesis', 'Apply', 10, question_type)
+               for question_type in QUIZ_EXAMPLES}
+    prompts['quiz/avoid'] = quiz_prompt('Photosynthesis', 'Apply', 3, 'Multiple Choice',
+                                        avoid=['1. What does chlorophyll absorb?', '2. Where is the Calvin cycle?'])
+    prompts.update({f"study/{goal}": study_prompt('Photosynthesis', 'Undergraduate', goal, 8, True)
+                    for goal in STUDY_FORMATS})
+    prompts['outline'] = outline_prompt('Photosynthesis', 'Undergraduate', 8)
+    prompts['outline_more'] = outline_prompt('Photosynthesis', 'Undergraduate', 4, existing=_OUTLINE)
+    prompts['section'] = section_prompt('Photosynthesis', 'Undergraduate', _OUTLINE[1], 1, _OUTLINE, True)
+    return prompts
+
+
+def sizes(model=None):
+    """{sample name: tokens}, counted by `model` or estimated offline"""
+    return {name: count_tokens(prompt, model) for name, prompt in samples().items()}
+
+
+def check_sizes(current, baseline, tolerance=TOLERANCE):
+    """Samples that grew more than `tolerance` over the baseline, {name: (baseline, current)}"""
+    return {name: (baseline[name], tokens) for name, tokens in current.items()
+            if name in baseline and tokens > baseline[name] * (1 + tolerance)}
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prompt template sizes")
+    commands = parser.add_subparsers(dest='command')
+    sizes_cmd = commands.add_parser('sizes', help="tokens per template")
+    sizes_cmd.add_argument('--live', action='store_true', help="count with Gemini's count_tokens API")
+    sizes_cmd.add_argument('--model', default='models/gemini-flash-latest')
+    sizes_cmd.add_argument('--check', action='store_true', help="exit 1 if a prompt grew past the baseline")
+    sizes_cmd.add_argument('--write-baseline', action='store_true', help="store the current estimates as the baseline")
+    sizes_cmd.add_argument('--baseline', default=BASELINE_PATH)
+    args = parser.parse_args(argv)
+    if args.command != 'sizes':
+        parser.print_help()
+        return
+
+    model = None
+    if args.live:
+        from edugenie import backends
+        backends.configure_gemini()
+        model = backends.get_model(args.model)
+    current = sizes(model)
+    try:
+        baseline = load_baseline(args.baseline)
+    except FileNotFoundError:
+        baseline = {}
+    for name, tokens in current.items():
+        base = baseline.get(name)
+        change = f"{(tokens - base) / base:+.1%}" if base else ''
+        print(f"{name:<28} {tokens:>6} {base if base else '':>8} {change:>8}")
+    if args.write_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(sizes(), f, indent=2, sort_keys=True)
+            f.write('\n')
+    if args.check and not args.live:
+        grown = check_sizes(current, baseline)
+        for name, (base, tokens) in grown.items():
+            print(f"{name} grew from {base} to {tokens} tokens", file=sys.stderr)
+        if grown:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
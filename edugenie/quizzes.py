@@ -0,0 +1,116 @@
+"""
+Quiz prompts and the parser for Gemini's numbered quiz format.
+
+Shared by the quiz page and the batch syllabus CLI.
+"""
+import re
+
+from edugenie import prompts
+
+BLOOMS_LEVELS = ['Remember', 'Understand', 'Apply', 'Analyze', 'Evaluate', 'Create']
+QUESTION_TYPES = ['Multiple Choice', 'True/False']
+
+def parse_quiz(quiz_text, question_type):
+    """Parses the generated text to extract questions, options, answers, and explanations."""
+    questions = []
+    
+    if question_type == 'Multiple Choice':
+        # Split by question numbers and process each
+        parts = re.split(r'\n(?=\d+\.)', quiz_text.strip())
+        for part in parts:
+            if not part.strip():
+                continue
+                
+            lines = part.strip().split('\n')
+            question_line = ""
+            options = []
+            answer = ""
+            explanation = ""
+            
+            i = 0
+            while i < len(lines):
+                line = lines[i].strip()
+                if line and (line[0].isdigit() or line.startswith('Question')):
+                    question_line = line
+                elif line.startswith(('A.', 'B.', 'C.', 'D.')):
+                    options.append(line)
+                elif 'Answer' in line or 'Correct' in line:
+                    answer = line.split(':')[-1].strip() if ':' in line else line
+                elif 'Explanation' in line:
+                    explanation = line.split(':', 1)[-1].strip() if ':' in line else ""
+                    # Get remaining lines as part of explanation
+                    while i + 1 < len(lines) and not lines[i + 1].strip().startswith(('Answer', 'Correct', '1.', '2.', '3.', '4.', '5.')):
+                        i += 1
+                        explanation += " " + lines[i].strip()
+                i += 1
+            
+            if question_line and len(options) >= 4:
+                questions.append({
+                    "question": question_line,
+                    "options": options,
+                    "answer": answer,
+                    "explanation": explanation
+                })
+    
+    elif question_type == 'True/False':
+        parts = re.split(r'\n(?=\d+\.)', quiz_text.strip())
+        for part in parts:
+            if not part.strip():
+                continue
+                
+            lines = part.strip().split('\n')
+            question_line = ""
+            answer = ""
+            explanation = ""
+            
+            for i, line in enumerate(lines):
+                line = line.strip()
+                if line and (line[0].isdigit() or line.startswith('Question')):
+                    question_line = line
+                elif 'Answer' in line or 'Correct' in line:
+                    answer = line.split(':')[-1].strip() if ':' in line else line
+                elif 'Explanation' in line:
+                    explanation = line.split(':', 1)[-1].strip() if ':' in line else ""
+            
+            if question_line:
+                questions.append({
+                    "question": question_line,
+                    "options": ["True", "False"],
+                    "answer": answer,
+                    "explanation": explanation
+                })
+    
+    elif question_type == 'Short Answer':
+        parts = re.split(r'\n(?=\d+\.)', quiz_text.strip())
+        for part in parts:
+            if not part.strip():
+                continue
+                
+            lines = part.strip().split('\n')
+            question_line = ""
+            answer = ""
+            explanation = ""
+            
+            for i, line in enumerate(lines):
+                line = line.strip()
+                if line and (line[0].isdigit() or line.startswith('Question')):
+                    question_line = line
+                elif 'Answer' in line or 'Correct' in line:
+                    answer = line.split(':')[-1].strip() if ':' in line else line
+                elif 'Explanation' in line:
+                    explanation = line.split(':', 1)[-1].strip() if ':' in line else ""
+            
+            if question_line:
+                questions.append({
+                    "question": question_line,
+                    "options": [],
+                    "answer": answer,
+                    "explanation": explanation
+                })
+    
+    return questions
+
+
+def build_quiz_prompt(topic, blooms_level, num_questions, question_type, avoid=None):
+    """Build the Gemini prompt for a quiz, optionally steering away from existing questions"""
+    return prompts.quiz_prompt(topic, blooms_level, num_questions, question_type, avoid=avoid)
@@ -0,0 +1,78 @@
+"""
+Process-wide token-bucket rate limiting for outbound API calls.
+
+Every Gemini call takes a token from the 'gemini' bucket first, so the pages,
+background jobs and the batch CLI together stay under the project's requests
+per minute quota. EDUGENIE_GEMINI_RPM sets the rate (0, the default, means no
+limit); EDUGENIE_GEMINI_BURST how many calls may go back to back.
+
+Metrics: edugenie_ratelimit_wait_seconds{limiter}
+"""
+import os
+import threading
+import time
+
+from edugenie import metrics
+
+GEMINI_RPM = float(os.getenv('EDUGENIE_GEMINI_RPM', '0'))
+GEMINI_BURST = int(os.getenv('EDUGENIE_GEMINI_BURST', '5'))
+
+
+class RateLimiter:
+    """Token bucket refilled at `per_minute` tokens per minute, holding up to `burst`"""
+
+    def __init__(self, name, per_minute=0, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.name = name
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.configure(per_minute, burst)
+
+    def configure(self, per_minute, burst=1):
+        with self._lock:
+            self.per_minute = per_minute
+            self.burst = max(1, burst)
+            self._tokens = float(self.burst)
+            self._updated = self._clock()
+
+    def _reserve(self):
+        """Take a token now or reserve the next one; returns seconds to wait"""
+        with self._lock:
+            if not self.per_minute:
+                return 0.0
+            now = self._clock()
+            rate = self.per_minute / 60.0
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            self._tokens -= 1
+            # A negative balance is a queue of reservations, each 1/rate apart
+            return 0.0 if self._tokens >= 0 else -self._tokens / rate
+
+    def acquire(self):
+        """Block until a call may go ahead; returns the seconds waited"""
+        wait = self._reserve()
+        if wait:
+            self._sleep(wait)
+        metrics.observe('edugenie_ratelimit_wait_seconds', wait, limiter=self.name)
+        return wait
+
+
+_lock = threading.Lock()
+_limiters = {}
+
+
+def get(name):
+    """The process-wide limiter for `name`, created on first use"""
+    with _lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            if name == 'gemini':
+                limiter = RateLimiter(name, GEMINI_RPM, GEMINI_BURST)
+            else:
+                limiter = RateLimiter(name)
+            _limiters[name] = limiter
+        return limiter
+
+
+def acquire(name):
+    return get(name).acquire()
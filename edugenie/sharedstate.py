@@ -0,0 +1,260 @@
+"""
+Optional state shared between replicas.
+
+Several Streamlit replicas behind a load balancer each keep their own session
+state and caches. With EDUGENIE_SHARED_STATE_URL set they also share
+
+- quiz progress per student (`progress:{user_id}`), so a reconnect that lands
+  on another replica picks up at the same question with the same answers
+- generation cache entries (`cache:{name}:{key}`) of caches created with
+  cache.get_cache(..., shared=True), so one replica's generated notes warm
+  the others
+- stored content (`content:{key}`, see edugenie.contentstore)
+- single-flight locks (`lock:{name}`), so only one replica generates a given
+  entry while the others wait for its result
+
+    EDUGENIE_SHARED_STATE_URL=redis://host:6379/0   # Redis protocol, needs `pip install redis`
+    EDUGENIE_SHARED_STATE_URL=memory://             # in-process stand-in with the same semantics
+
+Unset, everything stays in-process as before. Every backend call takes a
+batch of keys and the Redis backend sends each batch as one pipeline, so a
+page run costs at most one round trip to read and one to write. Calls go
+through the 'shared_state' circuit breaker; when the backend is down the
+pages carry on with their local state.
+
+Metrics: edugenie_shared_state_round_trips_total{op},
+edugenie_shared_state_errors_total{op}, edugenie_single_flight_total{outcome}.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+
+from edugenie import breakers, metrics
+
+SHARED_STATE_URL = os.getenv('EDUGENIE_SHARED_STATE_URL', '').strip()
+PREFIX = os.getenv('EDUGENIE_SHARED_STATE_PREFIX', 'edugenie:')
+TIMEOUT = float(os.getenv('EDUGENIE_SHARED_STATE_TIMEOUT', '0.5'))
+PROGRESS_TTL = float(os.getenv('EDUGENIE_SHARED_PROGRESS_TTL_SECONDS', '86400'))
+CACHE_TTL = float(os.getenv('EDUGENIE_SHARED_CACHE_TTL_SECONDS', '86400'))
+LOCK_TTL = float(os.getenv('EDUGENIE_SINGLE_FLIGHT_TTL_SECONDS', '120'))
+LOCK_WAIT = float(os.getenv('EDUGENIE_SINGLE_FLIGHT_WAIT_SECONDS', '60'))
+
+# Deletes a lock only if it still holds our token
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class MemoryBackend:
+    """In-process stand-in for the Redis backend: byte values with optional TTLs"""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data = {}  # key -> (value, expires or None)
+        self.round_trips = 0
+
+    def _get_locked(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= self._clock():
+            del self._data[key]
+            return None
+        return value
+
+    def get_many(self, keys):
+        with self._lock:
+            self.round_trips += 1
+            return [self._get_locked(key) for key in keys]
+
+    def set_many(self, mapping, ttl=None):
+        with self._lock:
+            self.round_trips += 1
+            expires = self._clock() + ttl if ttl else None
+            for key, value in mapping.items():
+                self._data[key] = (value, expires)
+
+    def delete(self, keys):
+        with self._lock:
+            self.round_trips += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def acquire(self, key, token, ttl):
+        with self._lock:
+            self.round_trips += 1
+            if self._get_locked(key) is not None:
+                return False
+            self._data[key] = (token, self._clock() + ttl)
+            return True
+
+    def release(self, key, token):
+        with self._lock:
+            self.round_trips += 1
+            if self._get_locked(key) == token:
+                del self._data[key]
+
+
+class RedisBackend:
+    """The same interface over a Redis server; batches go out as one pipeline"""
+
+    def __init__(self, url, timeout=TIMEOUT):
+        import redis
+        self._client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._release = self._client.register_script(_RELEASE_SCRIPT)
+
+    def get_many(self, keys):
+        return self._client.mget(keys)
+
+    def set_many(self, mapping, ttl=None):
+        pipe = self._client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(key, value, px=int(ttl * 1000) if ttl else None)
+        pipe.execute()
+
+    def delete(self, keys):
+        self._client.delete(*keys)
+
+    def acquire(self, key, token, ttl):
+        return bool(self._client.set(key, token, nx=True, px=int(ttl * 1000)))
+
+    def release(self, key, token):
+        self._release(keys=[key], args=[token])
+
+
+_backend = None
+_configured = False
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The configured backend, or None when state is not shared"""
+    global _backend, _configured
+    with _backend_lock:
+        if not _configured:
+            _configured = True
+            if SHARED_STATE_URL.startswith('memory://'):
+                _backend = MemoryBackend()
+            elif SHARED_STATE_URL:
+                _backend = RedisBackend(SHARED_STATE_URL)
+        return _backend
+
+
+def set_backend(backend):
+    """Use `backend` (or None to stop sharing) instead of the configured one"""
+    global _backend, _configured
+    with _backend_lock:
+        _backend, _configured = backend, True
+
+
+def enabled():
+    return get_backend() is not None
+
+
+def _call(op, fn, *args):
+    with breakers.guard('shared_state'), metrics.span('shared_state', op=op):
+        result = fn(*args)
+    metrics.inc('edugenie_shared_state_round_trips_total', op=op)
+    return result
+
+
+def get_many(keys, raw=False):
+    """{key: value} for the keys present, in one round trip; values are JSON unless `raw`"""
+    backend = get_backend()
+    if backend is None or not keys:
+        return {}
+    try:
+        values = _call('get', backend.get_many, [PREFIX + key for key in keys])
+    except Exception:
+        metrics.inc('edugenie_shared_state_errors_total', op='get')
+        return {}
+    return {key: value if raw else json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+
+def set_many(mapping, ttl=None, raw=False):
+    """Write every key in one round trip; returns False if the write failed"""
+    backend = get_backend()
+    if backend is None or not mapping:
+        return False
+    encoded = {PREFIX + key: value if raw else json.dumps(value, sort_keys=True, default=str)
+               for key, value in mapping.items()}
+    try:
+        _call('set', backend.set_many, encoded, ttl)
+    except Exception:
+        metrics.inc('edugenie_shared_state_errors_total', op='set')
+        return False
+    return True
+
+
+def single_flight(name, lookup, compute, wait=LOCK_WAIT, ttl=LOCK_TTL, poll=0.2):
+    """compute(), run by one replica at a time for `name`
+
+    A replica that finds the lock taken polls lookup() until it returns
+    something other than None and uses that instead. After `wait` seconds, or
+    with no backend, compute() runs here. compute() should store its result
+    where lookup() finds it before returning, so waiters see it at once.
+    """
+    backend = get_backend()
+    if backend is None:
+        return compute()
+    key, token = f"{PREFIX}lock:{name}", uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            if _call('acquire', backend.acquire, key, token, ttl):
+                break
+        except Exception:
+            metrics.inc('edugenie_shared_state_errors_total', op='acquire')
+            return compute()
+        value = lookup()
+        if value is not None:
+            metrics.inc('edugenie_single_flight_total', outcome='shared')
+            return value
+        if time.monotonic() >= deadline:
+            metrics.inc('edugenie_single_flight_total', outcome='timeout')
+            return compute()
+        time.sleep(poll)
+
+    try:
+        # Another replica may have finished between our miss and the lock
+        value = lookup()
+        if value is not None:
+            metrics.inc('edugenie_single_flight_total', outcome='shared')
+            return value
+        metrics.inc('edugenie_single_flight_total', outcome='computed')
+        return compute()
+    finally:
+        try:
+            _call('release', backend.release, key, token)
+        except Exception:
+            metrics.inc('edugenie_shared_state_errors_total', op='release')
+
+
+def sync(state, key, snapshot, ttl=PROGRESS_TTL):
+    """Keep a session's `snapshot` in step with the shared copy under `key`
+
+    The first call for `key` in a session reads the shared copy and returns it
+    for the caller to restore (None if there is none). Later calls write the
+    snapshot only when it changed since the last write. `state` is the
+    session state, where the last synced snapshot is remembered.
+    """
+    if get_backend() is None:
+        return None
+    marker = f"_shared_{key}"
+    if marker not in state:
+        shared = get_many([key]).get(key)
+        if shared is not None:
+            state[marker] = shared
+            return shared
+    # JSON round trip so the comparison sees what the other replicas see
+    snapshot = json.loads(json.dumps(snapshot, sort_keys=True, default=str))
+    if state.get(marker) != snapshot and set_many({key: snapshot}, ttl=ttl):
+        state[marker] = snapshot
+    return None
@@ -0,0 +1,157 @@
+"""
+MinHash signatures and an LSH index for near-duplicate text lookup.
+
+Texts are reduced to shingle sets; MinHash signatures estimate their Jaccard
+similarity and LSH banding turns a lookup into a few hash-bucket probes, after
+which candidates are confirmed with the exact Jaccard similarity of their
+shingles. Everything is local and in memory.
+"""
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+# Small enough that a*h + b (a, b < p, h < 2**32) never overflows uint64
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+def char_shingles(text, size=3):
+    """Character n-grams of `text` with spaces removed"""
+    compact = text.replace(' ', '')
+    if len(compact) <= size:
+        return {compact} if compact else set()
+    return {compact[i:i + size] for i in range(len(compact) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """Universal hash family h(x) = (a*x + b) mod p, seeded for reproducibility
+
+    All permutations are applied to all shingles in one vectorized step.
+    """
+
+    def __init__(self, num_perm=32, seed=1):
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, _MERSENNE_PRIME, num_perm, dtype=np.uint64)[:, None]
+
+    def signature(self, shingles):
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((self._a * hashes + self._b) % _MERSENNE_PRIME).min(axis=1).tolist()
+
+
+class LSHIndex:
+    """Thread-safe near-duplicate index over shingle sets
+
+    threshold - minimum Jaccard similarity for a match
+    num_perm  - MinHash signature length
+    bands     - LSH bands; num_perm / bands rows per band
+    max_size  - once full, add() either ignores new keys or, with evict=True,
+                drops the oldest ones
+    """
+
+    def __init__(self, threshold, num_perm=32, bands=8, max_size=None, evict=False, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_size = max_size
+        self.evict = evict
+        self._hasher = MinHasher(num_perm, seed)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (shingles, band keys)
+        self._buckets = [{} for _ in range(bands)]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def band_keys(self, shingles):
+        """LSH band keys for a shingle set; pass to query()/add() to hash only once"""
+        signature = self._hasher.signature(shingles)
+        rows = self.rows
+        return [tuple(signature[i * rows:(i + 1) * rows]) for i in range(self.bands)]
+
+    def _query_locked(self, shingles, bands, accept=None):
+        best, best_score = None, self.threshold
+        seen = set()
+        for bucket, band in zip(self._buckets, bands):
+            for candidate in bucket.get(band, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if accept is not None and not accept(candidate):
+                    continue
+                score = jaccard(shingles, self._entries[candidate][0])
+                if score >= best_score:
+                    best, best_score = candidate, score
+        return (best, best_score) if best is not None else None
+
+    def query(self, shingles, bands=None, accept=None):
+        """(key, similarity) of the most similar indexed entry at or above the threshold, or None
+
+        accept - optional predicate on candidate keys; rejected keys never match
+        """
+        if not shingles:
+            return None
+        bands = bands or self.band_keys(shingles)
+        with self._lock:
+            return self._query_locked(shingles, bands, accept)
+
+    def _remove_locked(self, key):
+        _, bands = self._entries.pop(key)
+        for bucket, band in zip(self._buckets, bands):
+            members = bucket.get(band)
+            if members:
+                members.remove(key)
+                if not members:
+                    del bucket[band]
+
+    def _add_locked(self, key, shingles, bands):
+        if key in self._entries:
+            self._remove_locked(key)
+        if self.max_size is not None and len(self._entries) >= self.max_size:
+            if not self.evict:
+                return False
+            self._remove_locked(next(iter(self._entries)))
+        self._entries[key] = (shingles, bands)
+        for bucket, band in zip(self._buckets, bands):
+            bucket.setdefault(band, []).append(key)
+        return True
+
+    def add(self, key, shingles, bands=None):
+        """Index `shingles` under `key`; returns False if it was not added"""
+        if not shingles:
+            return False
+        bands = bands or self.band_keys(shingles)
+        with self._lock:
+            return self._add_locked(key, shingles, bands)
+
+    def query_or_add(self, key, shingles, accept=None):
+        """Matching (key, similarity) if one exists, else add `key` and return None"""
+        if not shingles:
+            return None
+        bands = self.band_keys(shingles)
+        with self._lock:
+            found = self._query_locked(shingles, bands, accept)
+            if found is None:
+                self._add_locked(key, shingles, bands)
+            return found
+
+    def remove(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove_locked(key)
@@ -0,0 +1,114 @@
+"""
+Study material prompts and parsers.
+
+Shared by the study material page and the batch syllabus CLI.
+
+content_stats() is computed once when material is generated and saved with
+it, so the library can show word counts, reading times and a table of
+contents without loading or re-scanning the text. Section offsets are UTF-8
+byte offsets into the text.
+"""
+import re
+
+from edugenie import prompts
+
+AUDIENCES = ["High School", "Undergraduate", "Graduate", "Self-learner"]
+SECTION_TITLE_CHARS = 80
+
+_MARKDOWN_HEADING = re.compile(r'^\s*#{1,6}\s+(.+?)[\s#]*$')
+_NUMBERED_HEADING = re.compile(r'^\s*(?:\*\*)?(\d+)[.)]\s+(.+?)(?:\*\*)?\s*$')
+GOALS = ["Summary", "Flashcards", "Comprehensive Notes"]
+
+
+def build_study_prompt(topic, audience, goal, num_items, include_explanations):
+    """Build the Gemini prompt for study material"""
+    return prompts.study_prompt(topic, audience, goal, num_items, include_explanations)
+
+
+def parse_questions(quiz_text):
+    """Extract questions from generated text"""
+    questions = []
+    if not quiz_text:
+        return questions
+
+    parts = re.split(r'\n(?=\d+\.)', quiz_text.strip())
+    for part in parts:
+        lines = [l.strip() for l in part.strip().split('\n') if l.strip()]
+        if not lines:
+            continue
+
+        q_text = lines[0]
+        options = []
+        answer = ''
+        explanation = ''
+
+        for line in lines[1:]:
+            if re.match(r'^[A-D]\.', line, re.I):
+                options.append(line)
+            elif line.lower().startswith('answer') or line.lower().startswith('correct'):
+                answer = line.split(':', 1)[-1].strip()
+            elif line.lower().startswith('explanation'):
+                explanation = line.split(':', 1)[-1].strip()
+            else:
+                if explanation:
+                    explanation += ' ' + line
+
+        questions.append({
+            'question': q_text,
+            'options': options,
+            'answer': answer,
+            'explanation': explanation
+        })
+
+    return questions
+
+
+def section_index(text):
+    """[{'title', 'start', 'end'}] for the text's sections, with byte offsets
+
+    Markdown headings if there are any, otherwise top-level numbered items
+    (1., 2., 3., ... in sequence, so lists inside a section don't split it).
+    """
+    encoded = (text or '').encode('utf-8')
+    markdown, numbered = [], []
+    offset, expected = 0, 1
+    for line in (text or '').splitlines(keepends=True):
+        match = _MARKDOWN_HEADING.match(line)
+        if match:
+            markdown.append((match.group(1), offset))
+        else:
+            match = _NUMBERED_HEADING.match(line)
+            if match and int(match.group(1)) == expected:
+                numbered.append((f"{expected}. {match.group(2).replace('**', '').strip()}", offset))
+                expected += 1
+        offset += len(line.encode('utf-8'))
+
+    headings = markdown or numbered
+    if headings and encoded[:headings[0][1]].strip():
+        headings.insert(0, ("Introduction", 0))
+    return [{'title': title.strip('*# ')[:SECTION_TITLE_CHARS], 'start': start,
+             'end': headings[idx + 1][1] if idx + 1 < len(headings) else len(encoded)}
+            for idx, (title, start) in enumerate(headings)]
+
+
+def section_text(text, section):
+    """The text of one section_index() entry"""
+    return text.encode('utf-8')[section['start']:section['end']].decode('utf-8')
+
+
+def content_stats(text):
+    """Word count, reading time and section index of generated material"""
+    stats = compute_read_time(text)
+    stats['sections'] = section_index(text)
+    return stats
+
+
+def compute_read_time(text):
+    """Calculate reading time"""
+    words = re.findall(r"\w+", text or '')
+    word_count = len(words)
+    read_minutes = max(1, round(word_count / 200.0))
+    return {
+        'word_count': word_count,
+        'estimated_read_time_minutes': read_minutes
+    }
@@ -0,0 +1,370 @@
+"""
+Batch generation of quizzes and study notes for a whole syllabus.
+
+A syllabus is a JSON file (see syllabus.example.json) listing topics, Bloom's
+levels, question types and study goals. Every topic x level x question type
+becomes a quiz and every topic x goal a study material, generated concurrently
+under the Gemini rate limiter and parsed with the same parsers as the pages.
+
+Results are written in Firestore batches: quizzes to syllabus_quizzes/{item_id}
+with their questions in a `questions` subcollection carrying the question bank
+fields (so the quiz page draws from them), study materials to
+study_materials/{item_id} like the page's "Save" button. Item IDs are derived
+from the item's parameters, so re-running a syllabus overwrites rather than
+duplicates.
+
+Finished items are appended to a checkpoint file only after their batch has
+committed; a re-run skips them and retries everything else.
+
+    python -m edugenie.syllabus biology.json --concurrency 8 --rpm 60
+    EDUGENIE_OFFLINE=1 python -m edugenie.syllabus syllabus.example.json   # dry run on the fakes
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from edugenie import backends, bank, breakers, dedup, generation, metrics, notes, ratelimit, topics, usage
+from edugenie.quizzes import BLOOMS_LEVELS, QUESTION_TYPES, build_quiz_prompt, parse_quiz
+from edugenie.study import AUDIENCES, GOALS, build_study_prompt, content_stats
+
+QUIZ_MODEL = 'models/gemini-flash-latest'
+NOTES_MODEL = 'gemini-flash-latest'
+QUIZ_COLLECTION = 'syllabus_quizzes'
+NOTES_COLLECTION = 'study_materials'
+BATCH_OPS_LIMIT = 500
+ITEMS_METRIC = 'edugenie_syllabus_items_total'
+
+Item = namedtuple('Item', 'id kind topic blooms_level question_type goal')
+
+
+def load(path):
+    """Read and validate a syllabus file"""
+    with open(path, encoding='utf-8') as f:
+        syllabus = json.load(f)
+
+    syllabus.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    syllabus.setdefault('audience', 'Undergraduate')
+    syllabus.setdefault('blooms_levels', [])
+    syllabus.setdefault('question_types', [])
+    syllabus.setdefault('goals', [])
+    syllabus.setdefault('num_questions', 10)
+    syllabus.setdefault('num_items', 8)
+    syllabus.setdefault('include_explanations', True)
+
+    if not syllabus.get('topics'):
+        raise ValueError("syllabus has no topics")
+    for field, allowed in (('blooms_levels', BLOOMS_LEVELS), ('question_types', QUESTION_TYPES), ('goals', GOALS)):
+        unknown = [value for value in syllabus[field] if value not in allowed]
+        if unknown:
+            raise ValueError(f"unknown {field}: {', '.join(unknown)} (expected one of {', '.join(allowed)})")
+    if syllabus['audience'] not in AUDIENCES:
+        raise ValueError(f"unknown audience: {syllabus['audience']} (expected one of {', '.join(AUDIENCES)})")
+    return syllabus
+
+
+def _item_id(kind, *parts):
+    raw = json.dumps([kind, *parts], ensure_ascii=False)
+    return f"{kind}-{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]}"
+
+
+def expand(syllabus):
+    """Every quiz and study material the syllabus asks for"""
+    items = []
+    for topic in syllabus['topics']:
+        key = topics.canonicalize(topic)
+        for level in syllabus['blooms_levels']:
+            for question_type in syllabus['question_types']:
+                items.append(Item(_item_id('quiz', key, level, question_type, syllabus['num_questions']),
+                                  'quiz', topic, level, question_type, None))
+        for goal in syllabus['goals']:
+            items.append(Item(_item_id('notes', key, goal, syllabus['audience'], syllabus['num_items'],
+                                       syllabus['include_explanations']),
+                              'notes', topic, None, None, goal))
+    return items
+
+
+def describe(item):
+    if item.kind == 'quiz':
+        return f"quiz  {item.topic} / {item.blooms_level} / {item.question_type}"
+    return f"notes {item.topic} / {item.goal}"
+
+
+class Checkpoint:
+    """Append-only record of finished item IDs"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line torn by a crash
+                    if entry.get('status') == 'done':
+                        self.done.add(entry['id'])
+
+    def mark_done(self, item_ids):
+        with self._lock:
+            self.done.update(item_ids)
+            if not self.path:
+                return
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for item_id in item_ids:
+                    f.write(json.dumps({'id': item_id, 'status': 'done'}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def generate_quiz(item, syllabus, owner):
+    """Questions for one quiz item"""
+    num_questions = syllabus['num_questions']
+    labels = {'page': 'syllabus', 'question_type': item.question_type, 'model': QUIZ_MODEL}
+
+    def generate(count, avoid=None):
+        prompt = build_quiz_prompt(item.topic, item.blooms_level, count, item.question_type, avoid=avoid)
+        text, rounds = generation.generate_with_continuation(backends.get_model(QUIZ_MODEL), prompt, labels=labels)
+        usage.record_rounds(rounds, user_id=owner, topic=item.topic, **labels)
+        return parse_quiz(text, item.question_type)[:count]
+
+    questions = bank.renumber(dedup.replace_duplicates(generate(num_questions), generate, page='syllabus'))
+    if not questions:
+        raise ValueError("no questions could be parsed from the response")
+    return questions
+
+
+def generate_notes(item, syllabus, owner):
+    """Text of one study material item"""
+    labels = {'page': 'syllabus', 'question_type': item.goal, 'model': NOTES_MODEL}
+    audience, num_items = syllabus['audience'], syllabus['num_items']
+    include_explanations = syllabus['include_explanations']
+
+    def generate(prompt):
+        text, rounds = generation.generate_with_continuation(backends.get_model(NOTES_MODEL), prompt, labels=labels)
+        usage.record_rounds(rounds, user_id=owner, topic=item.topic, **labels)
+        return text, None
+
+    if item.goal == "Comprehensive Notes":
+        text, err = notes.generate_sectioned_notes(generate, item.topic, audience, num_items, include_explanations)
+        if err:
+            raise ValueError(err)
+    else:
+        text, _ = generate(build_study_prompt(item.topic, audience, item.goal, num_items, include_explanations))
+    if not (text or '').strip():
+        raise ValueError("empty response")
+    return text
+
+
+def generate_item(item, syllabus, owner, retries=2):
+    """Generate one item, waiting out an open Gemini breaker and retrying failures"""
+    for attempt in range(retries + 1):
+        try:
+            with metrics.span('syllabus_item', kind=item.kind):
+                if item.kind == 'quiz':
+                    return generate_quiz(item, syllabus, owner)
+                return generate_notes(item, syllabus, owner)
+        except breakers.CircuitOpenError as e:
+            if attempt == retries:
+                raise
+            time.sleep(e.retry_in)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(2 ** attempt)
+
+
+def item_writes(db, item, result, syllabus):
+    """(reference, data) pairs that store one generated item"""
+    now = datetime.datetime.utcnow()
+    if item.kind == 'notes':
+        ref = db.collection(NOTES_COLLECTION).document(item.id)
+        return [
+            (ref, {
+                'topic': item.topic,
+                'audience': syllabus['audience'],
+                'goal': item.goal,
+                'num_items_requested': syllabus['num_items'],
+                'syllabus': syllabus['name'],
+                'created_at': now,
+                **content_stats(result),
+            }),
+            (ref.collection('raw').document('generated_text'), {'text': result}),
+        ]
+
+    ref = db.collection(QUIZ_COLLECTION).document(item.id)
+    writes = [(ref, {
+        'syllabus': syllabus['name'],
+        'topic': item.topic,
+        'topic_key': topics.topic_key(item.topic),
+        'blooms_level': item.blooms_level,
+        'question_type': item.question_type,
+        'num_questions': len(result),
+        'num_questions_requested': syllabus['num_questions'],
+        'created_at': now,
+    })]
+    for number, question in enumerate(result, 1):
+        doc = {
+            'question_number': number,
+            'question_text': question['question'],
+            'options': question['options'],
+            'correct_answer': question['answer'],
+            'explanation': question['explanation'],
+            'created_at': now,
+        }
+        doc.update(bank.index_fields(item.topic, item.blooms_level, item.question_type, question['question']))
+        writes.append((ref.collection('questions').document(f"{number:02d}"), doc))
+    return writes
+
+
+class BatchWriter:
+    """Buffers item writes and commits them together, then checkpoints the items
+
+    Items whose batch fails to commit are collected in `failed` ({item_id: error})
+    and left out of the checkpoint, so the next run retries them.
+    """
+
+    def __init__(self, db, checkpoint, batch_size=20):
+        self.db = db
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.failed = {}
+        self._writes = []
+        self._items = []
+
+    def add(self, item_id, writes):
+        """Queue an item's writes; returns the IDs of items committed as a result"""
+        committed = []
+        if self._writes and len(self._writes) + len(writes) > BATCH_OPS_LIMIT:
+            committed = self.flush()
+        self._writes.extend(writes)
+        self._items.append(item_id)
+        if len(self._items) >= self.batch_size:
+            committed += self.flush()
+        return committed
+
+    def flush(self):
+        """Commit everything queued; returns the committed item IDs"""
+        if not self._items:
+            return []
+        writes, items = self._writes, self._items
+        self._writes, self._items = [], []
+        try:
+            with breakers.guard('firestore'), metrics.span('syllabus_write'):
+                batch = self.db.batch()
+                for ref, data in writes:
+                    batch.set(ref, data)
+                batch.commit()
+        except Exception as e:
+            for item_id in items:
+                self.failed[item_id] = f"write failed: {e}"
+            return []
+        self.checkpoint.mark_done(items)
+        return items
+
+
+def run(syllabus, db, checkpoint, concurrency=4, batch_size=20, owner='syllabus', retries=2, log=print):
+    """Generate and store every unfinished item; returns a stats dict"""
+    items = expand(syllabus)
+    todo = [item for item in items if item.id not in checkpoint.done]
+    writer = BatchWriter(db, checkpoint, batch_size)
+    failures = {}
+    reasons = Counter()
+    generated = stored = 0
+    start = time.perf_counter()
+
+    def progress(message):
+        elapsed = time.perf_counter() - start
+        rate = generated / elapsed * 60 if elapsed else 0.0
+        log(f"[{generated + len(failures)}/{len(todo)}] {message}  ({rate:.1f} items/min)")
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='edugenie-syllabus') as pool:
+        futures = {pool.submit(generate_item, item, syllabus, owner, retries): item for item in todo}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures[item.id] = str(e) or type(e).__name__
+                reasons[type(e).__name__] += 1
+                metrics.inc(ITEMS_METRIC, kind=item.kind, status='failed')
+                progress(f"FAILED {describe(item)}: {failures[item.id]}")
+                continue
+            generated += 1
+            metrics.inc(ITEMS_METRIC, kind=item.kind, status='generated')
+            stored += len(writer.add(item.id, item_writes(db, item, result, syllabus)))
+            note = ''
+            if item.kind == 'quiz' and len(result) < syllabus['num_questions']:
+                note = f" (short: {len(result)} of {syllabus['num_questions']} questions)"
+            progress(f"ok     {describe(item)}{note}")
+
+    stored += len(writer.flush())
+    failures.update(writer.failed)
+    reasons['write failed'] += len(writer.failed)
+    try:
+        usage.flush(db)
+    except Exception:
+        pass
+
+    elapsed = time.perf_counter() - start
+    by_id = {item.id: item for item in items}
+    return {
+        'total': len(items),
+        'skipped': len(items) - len(todo),
+        'stored': stored,
+        'failed': len(failures),
+        'elapsed_seconds': elapsed,
+        'items_per_minute': stored / elapsed * 60 if elapsed else 0.0,
+        'failures': {describe(by_id[item_id]): error for item_id, error in failures.items()},
+        'failure_counts': +reasons,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate quizzes and study notes for a whole syllabus")
+    parser.add_argument('syllabus', help="syllabus JSON file")
+    parser.add_argument('--checkpoint', help="progress file (default: <syllabus>.progress.jsonl)")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rpm', type=float, default=ratelimit.GEMINI_RPM or 60,
+                        help="Gemini requests per minute across all workers")
+    parser.add_argument('--batch-size', type=int, default=20, help="items per Firestore batch")
+    parser.add_argument('--retries', type=int, default=2)
+    parser.add_argument('--owner', default='syllabus', help="user ID the token usage is accounted to")
+    parser.add_argument('--list', action='store_true', help="print the items and exit")
+    args = parser.parse_args(argv)
+
+    try:
+        syllabus = load(args.syllabus)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    checkpoint = Checkpoint(args.checkpoint or f"{os.path.splitext(args.syllabus)[0]}.progress.jsonl")
+
+    if args.list:
+        for item in expand(syllabus):
+            print(f"{'done' if item.id in checkpoint.done else 'todo'}  {describe(item)}")
+        return
+
+    backends.configure_gemini()
+    ratelimit.get('gemini').configure(args.rpm, burst=args.concurrency)
+    stats = run(syllabus, backends.get_firestore(), checkpoint, args.concurrency, args.batch_size,
+                owner=args.owner, retries=args.retries)
+
+    print(f"\n{stats['stored']} stored, {stats['failed']} failed, {stats['skipped']} already done "
+          f"of {stats['total']} items in {stats['elapsed_seconds']:.0f}s ({stats['items_per_minute']:.1f} items/min)")
+    for reason, count in stats['failure_counts'].most_common():
+        print(f"  {count:>4} x {reason}")
+    for name, error in stats['failures'].items():
+        print(f"  FAILED {name}: {error}")
+    if stats['failed']:
+        print("Run the same command again to retry the failed items.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+Topic canonicalization and near-duplicate matching.
+
+"Photosynthesis", "photosynthesis ", "Photo-synthesis" and "what is
+photosynthesis" should all share one cache entry, question bank and analytics
+row. canonicalize() folds case and accents, drops punctuation and stop words
+and applies a light suffix-stripping stemmer.
+
+topic_key() is that canonical form with the spaces removed, so word breaks
+("photo-synthesis", "photo synthesis") don't split a topic either. It is
+deterministic, so it is what gets stored (question documents, attempts,
+flashcards, mastery, usage) and queried, and every process and replica
+derives the same key.
+
+cache_key() additionally maps a canonical form onto an already known one when
+their character trigrams are very similar (slips like "photosynthesys"),
+using MinHash signatures with LSH banding so a lookup only
+compares against a handful of candidates however many topics are known. It
+is only used for in-memory caches that don't mirror a Firestore query (the
+generated notes), where the first phrasing seen in a
+process wins and a different pick elsewhere costs a cache miss. Trigram
+similarity cannot tell "World War I" from "World War II" or "organic" from
+"inorganic chemistry", so two topics never match when their numbers, roman
+numerals or single letters differ, or when one negates the other.
+"""
+import argparse
+import os
+import random
+import re
+import string
+import time
+import unicodedata
+
+from edugenie import similarity
+
+INDEX_SIZE = int(os.getenv('EDUGENIE_TOPIC_INDEX_SIZE', '200000'))
+SIMILARITY_THRESHOLD = float(os.getenv('EDUGENIE_TOPIC_SIMILARITY', '0.9'))
+
+STOP_WORDS = frozenset("""
+a an and about are as at basics be by can define definition do does explain explained for from how in
+into intro introduction is it its me of on or overview please explanation tell that the their to
+understanding what when where which who why with
+""".split())
+
+
+def _stem(word):
+    """Light suffix stripping; enough to merge plurals and simple verb forms"""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('sses'):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    if word.endswith('ing') and len(word) > 5:
+        return word[:-3]
+    if word.endswith('ed') and len(word) > 4:
+        return word[:-2]
+    return word
+
+
+def tokens(topic):
+    """Canonical tokens of a topic, in their original order"""
+    text = unicodedata.normalize('NFKD', topic or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    words = re.findall(r'[^\W_]+', text)
+    kept = [_stem(w) for w in words if w not in STOP_WORDS]
+    # A topic made only of stop words ("The Who") keeps its words
+    return kept or words
+
+
+def canonicalize(topic):
+    """Canonical form of a topic: folded, stop words removed, stemmed, space separated"""
+    return ' '.join(tokens(topic))
+
+
+_ROMAN = re.compile(r'^m{0,4}(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})$')
+NEGATING_PREFIXES = ('non', 'anti', 'dis', 'un', 'in', 'im', 'ir', 'il', 'a')
+NEGATIONS = frozenset({'no', 'non', 'not', 'anti', 'without'})
+
+
+def _markers(words):
+    """Numbers, roman numerals and single letters: the tokens that tell variants apart"""
+    return sorted(w for w in words if w.isdigit() or len(w) == 1 or _ROMAN.match(w))
+
+
+def _negates(word, other):
+    return any(word == prefix + other for prefix in NEGATING_PREFIXES)
+
+
+def distinct(a, b):
+    """True if canonical topics `a` and `b` must not be merged however similar they look
+
+    "world war i" / "world war ii", "calculus 1" / "calculus 2",
+    "organic chemistry" / "inorganic chemistry", "linear" / "non linear".
+    """
+    words_a, words_b = a.split(), b.split()
+    if _markers(words_a) != _markers(words_b):
+        return True
+    only_a, only_b = set(words_a) - set(words_b), set(words_b) - set(words_a)
+    if (only_a | only_b) & NEGATIONS:
+        return True
+    return any(_negates(x, y) or _negates(y, x) for x in only_a for y in only_b)
+
+
+class TopicIndex:
+    """Thread-safe index of known canonical topics with near-duplicate lookup
+
+    threshold - minimum trigram Jaccard similarity for two topics to match;
+                pairs that are distinct() never match
+    num_perm  - MinHash signature length
+    bands     - LSH bands; num_perm / bands rows per band
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, num_perm=32, bands=8, max_size=INDEX_SIZE, seed=1):
+        self._lsh = similarity.LSHIndex(threshold, num_perm=num_perm, bands=bands, max_size=max_size, seed=seed)
+
+    def __len__(self):
+        return len(self._lsh)
+
+    def __contains__(self, canonical):
+        return canonical in self._lsh
+
+    def match(self, topic):
+        """Known canonical topic equal or similar to `topic`, or None"""
+        canonical = canonicalize(topic)
+        if canonical in self._lsh:
+            return canonical
+        found = self._lsh.query(similarity.char_shingles(canonical),
+                                accept=lambda known: not distinct(canonical, known))
+        return found[0] if found else None
+
+    def resolve(self, topic):
+        """Canonical key for `topic`: a known near-duplicate, or its own canonical form (added)"""
+        canonical = canonicalize(topic)
+        if canonical in self._lsh:
+            return canonical
+        found = self._lsh.query_or_add(canonical, similarity.char_shingles(canonical),
+                                       accept=lambda known: not distinct(canonical, known))
+        return found[0] if found else canonical
+
+
+_index = TopicIndex()
+
+
+def topic_key(topic):
+    """Deterministic key for `topic`; the one to store and query by"""
+    return ''.join(tokens(topic))
+
+
+def cache_key(topic):
+    """In-memory cache key for `topic`, shared with near-duplicate spellings seen by this process"""
+    return _index.resolve(topic)
+
+
+def known_topics():
+    return len(_index)
+
+
+def benchmark(num_topics=100000, lookups=2000, seed=0):
+    """Mean microseconds per match() at `num_topics` known topics, for misses and near-duplicates"""
+    rng = random.Random(seed)
+    words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))) for _ in range(5000)]
+    index = TopicIndex(max_size=num_topics)
+    while len(index) < num_topics:
+        index.resolve(' '.join(rng.sample(words, rng.randint(1, 3))))
+
+    misses = [' '.join(rng.sample(words, rng.randint(1, 3))) for _ in range(lookups)]
+    # Rephrased and with one letter doubled, so the lookup has to go through LSH
+    near = [f"What is {topic[:3]}{topic[2:].title()}?" for topic in rng.sample(index._lsh.keys(), lookups)]
+    results = {}
+    for name, queries in (('miss', misses), ('near_duplicate', near)):
+        start = time.perf_counter()
+        for query in queries:
+            index.match(query)
+        results[name] = (time.perf_counter() - start) / len(queries) * 1e6
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark topic near-duplicate lookups")
+    parser.add_argument('--topics', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args(argv)
+    for name, micros in benchmark(args.topics, args.lookups).items():
+        print(f"{name:>15}: {micros:.1f} us/lookup at {args.topics} topics")
+
+
+if __name__ == '__main__':
+    main()
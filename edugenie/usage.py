@@ -0,0 +1,286 @@
+"""
+Token and cost accounting for Gemini calls.
+
+Every generation records one usage entry: prompt, output and total tokens,
+latency, and whether a cache answered instead of Gemini. Entries are summed in
+memory per (day, user, page, topic, model) and flushed in batches every
+EDUGENIE_USAGE_FLUSH_SECONDS as Increment writes to
+
+    usage_daily/{day}_{user_id}     - per-user daily totals, used for budgets
+    usage_topics/{topic_key}        - per-topic totals, used for the cost report
+
+so a busy page costs a handful of writes per interval rather than one per call.
+
+Budgets: each user may spend EDUGENIE_USER_DAILY_TOKENS tokens per UTC day
+(0 = unlimited), or the `daily_tokens` of their usage_budgets/{user_id}
+document. The job scheduler refuses work for a user who is over budget.
+
+    python -m edugenie.usage report              # topics ranked by cost
+    python -m edugenie.usage budget USER TOKENS  # set a user's daily budget
+
+Costs use EDUGENIE_PRICE_PROMPT_PER_MTOK / EDUGENIE_PRICE_OUTPUT_PER_MTOK (USD
+per million tokens).
+"""
+import argparse
+import atexit
+import datetime
+import os
+import threading
+import time
+from collections import defaultdict
+
+from edugenie import breakers, cache, metrics, topics
+from edugenie.counters import Increment
+
+FLUSH_INTERVAL = float(os.getenv('EDUGENIE_USAGE_FLUSH_SECONDS', '30'))
+DEFAULT_DAILY_TOKENS = int(os.getenv('EDUGENIE_USER_DAILY_TOKENS', '0'))
+PROMPT_PRICE = float(os.getenv('EDUGENIE_PRICE_PROMPT_PER_MTOK', '0.30'))
+OUTPUT_PRICE = float(os.getenv('EDUGENIE_PRICE_OUTPUT_PER_MTOK', '2.50'))
+BUDGET_TTL = float(os.getenv('EDUGENIE_USAGE_BUDGET_TTL_SECONDS', '60'))
+
+DAILY_COLLECTION = 'usage_daily'
+TOPICS_COLLECTION = 'usage_topics'
+BUDGETS_COLLECTION = 'usage_budgets'
+COST_METRIC = 'edugenie_gemini_cost_usd_total'
+CALLS_METRIC = 'edugenie_usage_calls_total'
+BATCH_LIMIT = 500
+FIELDS = ('calls', 'cache_hits', 'prompt_tokens', 'output_tokens', 'total_tokens', 'latency_seconds', 'cost_usd')
+
+_lock = threading.Lock()
+_pending = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+_topic_names = {}
+_local_tokens = defaultdict(int)     # (day, user) -> tokens recorded by this process
+_flushed_tokens = defaultdict(int)   # (day, user) -> the part of it already flushed
+_db = None
+_flusher = None
+
+# (day, user) -> (stored tokens, this process's flushed tokens at read time)
+_stored = cache.get_cache('usage_stored', maxsize=10000, ttl=BUDGET_TTL)
+_budgets = cache.get_cache('usage_budgets', maxsize=10000, ttl=BUDGET_TTL)
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def today():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%d')
+
+
+def cost_of(prompt_tokens, output_tokens):
+    """USD cost of a call at the configured per-million-token prices"""
+    return (prompt_tokens * PROMPT_PRICE + output_tokens * OUTPUT_PRICE) / 1e6
+
+
+def record(user_id=None, page='', topic='', model='', prompt_tokens=0, output_tokens=0, total_tokens=None,
+           latency=0.0, cache_hit=False, question_type=None):
+    """Add one Gemini call (or one call a cache saved) to the in-memory totals"""
+    if total_tokens is None:
+        total_tokens = prompt_tokens + output_tokens
+    cost = cost_of(prompt_tokens, output_tokens)
+    day = today()
+    user_id = user_id or 'default_user'
+    topic_key = topics.topic_key(topic) if topic else ''
+
+    with _lock:
+        bucket = _pending[(day, user_id, page, topic_key, model)]
+        bucket['calls'] += 1
+        bucket['cache_hits'] += 1 if cache_hit else 0
+        bucket['prompt_tokens'] += prompt_tokens
+        bucket['output_tokens'] += output_tokens
+        bucket['total_tokens'] += total_tokens
+        bucket['latency_seconds'] += latency
+        bucket['cost_usd'] += cost
+        if topic_key:
+            _topic_names.setdefault(topic_key, topic)
+        _local_tokens[(day, user_id)] += total_tokens
+
+    metrics.inc(CALLS_METRIC, page=page, question_type=question_type, cache_hit='yes' if cache_hit else 'no')
+    if cost:
+        metrics.inc(COST_METRIC, cost, page=page, question_type=question_type, model=model)
+
+
+def record_rounds(rounds, **fields):
+    """Record the summed usage of generation.generate_with_continuation() rounds"""
+    record(prompt_tokens=sum(r['prompt_tokens'] for r in rounds),
+           output_tokens=sum(r['output_tokens'] for r in rounds),
+           total_tokens=sum(r['total_tokens'] for r in rounds),
+           latency=sum(r.get('latency', 0.0) for r in rounds),
+           **fields)
+
+
+def pending():
+    """Snapshot of the unflushed totals, {(day, user, page, topic_key, model): {field: value}}"""
+    with _lock:
+        return {key: dict(bucket) for key, bucket in _pending.items()}
+
+
+def flush(db=None):
+    """Write the pending totals as batched increments; returns the number of buckets written"""
+    db = db or _db
+    if db is None:
+        return 0
+    with _lock:
+        buckets = dict(_pending)
+        _pending.clear()
+        names = dict(_topic_names)
+    if not buckets:
+        return 0
+
+    daily = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+    by_topic = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+    for (day, user_id, _, topic_key, _), bucket in buckets.items():
+        for field, value in bucket.items():
+            daily[(day, user_id)][field] += value
+            if topic_key:
+                by_topic[topic_key][field] += value
+
+    writes = []
+    for (day, user_id), totals in daily.items():
+        ref = db.collection(DAILY_COLLECTION).document(f"{day}_{user_id}")
+        writes.append((ref, dict({f: Increment(v) for f, v in totals.items()}, day=day, user_id=user_id)))
+    for topic_key, totals in by_topic.items():
+        ref = db.collection(TOPICS_COLLECTION).document(topic_key)
+        writes.append((ref, dict({f: Increment(v) for f, v in totals.items()}, topic=names.get(topic_key, topic_key))))
+
+    try:
+        with breakers.guard('firestore'), metrics.span('usage_flush'):
+            for start in range(0, len(writes), BATCH_LIMIT):
+                batch = db.batch()
+                for ref, update in writes[start:start + BATCH_LIMIT]:
+                    batch.set(ref, update, merge=True)
+                batch.commit()
+    except Exception:
+        # Put the totals back so the next flush retries them
+        with _lock:
+            for key, bucket in buckets.items():
+                for field, value in bucket.items():
+                    _pending[key][field] += value
+        raise
+
+    with _lock:
+        for (day, user_id), totals in daily.items():
+            _flushed_tokens[(day, user_id)] += totals['total_tokens']
+    return len(buckets)
+
+
+def start_flusher(db, interval=FLUSH_INTERVAL):
+    """Flush to `db` every `interval` seconds and at exit; the first caller's db wins"""
+    global _db, _flusher
+    with _lock:
+        if _flusher is not None or db is None:
+            return _flusher
+        _db = db
+
+        def _loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    flush()
+                except Exception:
+                    metrics.inc('edugenie_usage_flush_errors_total')
+
+        _flusher = threading.Thread(target=_loop, name='edugenie-usage-flush', daemon=True)
+    _flusher.start()
+    atexit.register(_flush_quietly)
+    return _flusher
+
+
+def _flush_quietly():
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+def budget_for(user_id):
+    """Daily token budget for a user; 0 means unlimited"""
+    if _db is None:
+        return DEFAULT_DAILY_TOKENS
+    budget = _budgets.get(user_id)
+    if budget is None:
+        try:
+            with breakers.guard('firestore'):
+                snapshot = _db.collection(BUDGETS_COLLECTION).document(user_id).get()
+            data = snapshot.to_dict() if snapshot.exists else None
+            budget = int((data or {}).get('daily_tokens', DEFAULT_DAILY_TOKENS))
+        except Exception:
+            return DEFAULT_DAILY_TOKENS
+        _budgets.set(user_id, budget)
+    return budget
+
+
+def set_budget(db, user_id, daily_tokens):
+    db.collection(BUDGETS_COLLECTION).document(user_id).set({'daily_tokens': int(daily_tokens)}, merge=True)
+    _budgets.pop(user_id)
+
+
+def spent_today(user_id):
+    """Tokens the user has used today: the stored total plus what this process hasn't flushed yet"""
+    key = (today(), user_id)
+    stored = _stored.get(key)
+    if stored is None:
+        total = 0
+        if _db is not None:
+            try:
+                with breakers.guard('firestore'):
+                    snapshot = _db.collection(DAILY_COLLECTION).document(f"{key[0]}_{user_id}").get()
+                total = ((snapshot.to_dict() if snapshot.exists else None) or {}).get('total_tokens', 0)
+            except Exception:
+                total = 0
+        with _lock:
+            stored = (total, _flushed_tokens[key])
+        _stored.set(key, stored)
+    total, flushed_at_read = stored
+    with _lock:
+        return total + _local_tokens[key] - flushed_at_read
+
+
+def check_budget(user_id):
+    """Raise BudgetExceeded if the user has used up today's token budget"""
+    budget = budget_for(user_id)
+    if not budget:
+        return
+    spent = spent_today(user_id)
+    if spent >= budget:
+        metrics.inc('edugenie_usage_budget_rejections_total')
+        raise BudgetExceeded(f"Daily token budget used up ({spent:,} of {budget:,} tokens). Please try again tomorrow.")
+
+
+def top_topics(db, limit=20):
+    """Topics ranked by total cost"""
+    query = db.collection(TOPICS_COLLECTION).order_by('cost_usd', direction='DESCENDING').limit(limit)
+    rows = []
+    for doc in query.stream():
+        data = doc.to_dict()
+        rows.append(dict({field: data.get(field, 0) for field in FIELDS}, topic=data.get('topic', doc.id)))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gemini token and cost accounting")
+    commands = parser.add_subparsers(dest='command')
+    report = commands.add_parser('report', help="rank topics by cost")
+    report.add_argument('--limit', type=int, default=20)
+    budget = commands.add_parser('budget', help="set a user's daily token budget (0 = unlimited)")
+    budget.add_argument('user_id')
+    budget.add_argument('daily_tokens', type=int)
+    args = parser.parse_args(argv)
+
+    from edugenie import backends
+    if args.command == 'report':
+        rows = top_topics(backends.get_firestore(), args.limit)
+        print(f"{'#':>3}  {'topic':<40} {'calls':>7} {'cached':>7} {'tokens':>12} {'cost USD':>10}")
+        for rank, row in enumerate(rows, 1):
+            cached = row['cache_hits'] / row['calls'] * 100 if row['calls'] else 0.0
+            print(f"{rank:>3}  {row['topic'][:40]:<40} {row['calls']:>7} {cached:>6.0f}% "
+                  f"{row['total_tokens']:>12,} {row['cost_usd']:>10.4f}")
+    elif args.command == 'budget':
+        set_budget(backends.get_firestore(), args.user_id, args.daily_tokens)
+        print(f"Daily budget for {args.user_id}: {args.daily_tokens or 'unlimited'} tokens")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Exam versions of a quiz without extra Gemini calls.
+
+A VariantSet takes one parsed quiz (as returned by parse_quiz) and derives N
+seeded versions from it by permuting the question order and, for multiple
+choice questions, the option order, re-lettering the options and the Answer.
+All permutations come from one NumPy draw, so even 1,000 versions take a few
+milliseconds; a version's questions are only built when asked for.
+
+Each version has an ID "<quiz key>-<seed>-<index>". The quiz key is derived
+from the questions' content, so the ID plus the original quiz is enough to
+rebuild the version and map a student's answers back to the original question
+order and option letters with to_canonical().
+
+    python -m edugenie.variants --versions 1000 --questions 20
+"""
+import argparse
+import hashlib
+import re
+import time
+
+import numpy as np
+
+from edugenie import bank
+
+LETTERS = 'ABCD'
+_OPTION_LABEL = re.compile(r'^\s*([A-Da-d])\s*[.)]\s*')
+
+
+def quiz_key(questions):
+    """Short content hash identifying the original quiz"""
+    keys = '|'.join(bank.question_key(q['question']) for q in questions)
+    return hashlib.sha1(keys.encode('utf-8')).hexdigest()[:10]
+
+
+def variant_id(key, seed, index):
+    return f"{key}-{seed}-{index}"
+
+
+def parse_variant_id(value):
+    """(quiz key, seed, index) of a version ID"""
+    key, seed, index = value.rsplit('-', 2)
+    return key, int(seed), int(index)
+
+
+def _option_texts(question):
+    """Option texts without their letters, or None if the options can't be shuffled"""
+    options = question.get('options') or []
+    if len(options) != len(LETTERS):
+        return None
+    texts = []
+    for letter, option in zip(LETTERS, options):
+        match = _OPTION_LABEL.match(option)
+        if not match or match.group(1).upper() != letter:
+            return None
+        texts.append(option[match.end():])
+    return texts
+
+
+def _correct_index(question):
+    """Index of the correct option from an answer like 'B', 'B.' or 'B. text', or -1"""
+    answer = (question.get('answer') or '').strip()
+    match = _OPTION_LABEL.match(answer + ('.' if len(answer) == 1 else ''))
+    if match:
+        return LETTERS.index(match.group(1).upper())
+    for idx, option in enumerate(question.get('options') or []):
+        if answer and answer.lower() in (option.lower(), option[3:].strip().lower()):
+            return idx
+    return -1
+
+
+class VariantSet:
+    """`count` seeded versions of one quiz"""
+
+    def __init__(self, questions, count, seed=0):
+        self.questions = list(questions)
+        self.count = count
+        self.seed = seed
+        self.key = quiz_key(self.questions)
+        num_questions = len(self.questions)
+
+        self._texts = [_option_texts(q) for q in self.questions]
+        correct = np.array([_correct_index(q) for q in self.questions], dtype=np.int64)
+        shuffled = np.array([texts is not None and c >= 0 for texts, c in zip(self._texts, correct)], dtype=bool)
+
+        # One draw per version: column 0 orders the questions, the rest each question's options.
+        # Version i only depends on the first i+1 rows, so any version can be rebuilt from its ID.
+        rng = np.random.default_rng([seed, int(self.key, 16)])
+        draws = rng.random((count, num_questions, 1 + len(LETTERS)))
+        self.order = np.argsort(draws[:, :, 0], axis=1)                  # (version, position) -> question
+        option_order = np.argsort(draws[:, :, 1:], axis=2)               # (version, question, slot) -> option
+        identity = np.arange(len(LETTERS))
+        self.option_order = np.where(shuffled[None, :, None], option_order, identity)
+
+        # Slot the correct option lands in, per version and question
+        self._correct = correct
+        self._shuffled = shuffled
+        self._correct_slot = np.argmax(self.option_order == np.maximum(correct, 0)[None, :, None], axis=2)
+
+    def ids(self):
+        return [variant_id(self.key, self.seed, index) for index in range(self.count)]
+
+    def answer_keys(self):
+        """Correct letters per version in question order, e.g. ['CADB...', ...]; '?' where not multiple choice"""
+        slots = np.take_along_axis(self._correct_slot, self.order, axis=1)
+        letters = np.array(list(LETTERS))[slots]
+        letters[~np.take_along_axis(np.broadcast_to(self._shuffled, slots.shape), self.order, axis=1)] = '?'
+        return [''.join(row) for row in letters]
+
+    def variant(self, index):
+        """Questions of one version, re-lettered, in its order"""
+        out = []
+        for position, question_idx in enumerate(self.order[index]):
+            question = self.questions[question_idx]
+            texts = self._texts[question_idx]
+            number = f"{position + 1}. {bank.strip_number(question['question'])}"
+            if not self._shuffled[question_idx]:
+                out.append(dict(question, question=number))
+                continue
+            slots = self.option_order[index, question_idx]
+            letter = LETTERS[self._correct_slot[index, question_idx]]
+            # A bare letter stays a bare letter; anything else gets the letter and text of its new slot
+            bare = re.fullmatch(r'[A-Da-d][.)]?', question['answer'].strip())
+            out.append(dict(
+                question,
+                question=number,
+                options=[f"{LETTERS[slot]}. {texts[option]}" for slot, option in enumerate(slots)],
+                answer=letter if bare else f"{letter}. {texts[self._correct[question_idx]]}",
+            ))
+        return out
+
+    def to_canonical(self, index, answers):
+        """Map {position: chosen option} in version `index` to {original index: original option}"""
+        canonical = {}
+        for position, chosen in answers.items():
+            question_idx = int(self.order[index][position])
+            options = self.questions[question_idx].get('options') or []
+            match = _OPTION_LABEL.match(chosen or '')
+            if self._shuffled[question_idx] and match:
+                chosen = options[int(self.option_order[index, question_idx, LETTERS.index(match.group(1).upper())])]
+            canonical[question_idx] = chosen
+        return canonical
+
+
+def for_id(questions, version_id):
+    """(VariantSet, index) that rebuilds the version `version_id` of `questions`"""
+    key, seed, index = parse_variant_id(version_id)
+    if key != quiz_key(questions):
+        raise ValueError(f"version {version_id} is not a version of this quiz")
+    return VariantSet(questions, index + 1, seed), index
+
+
+def to_canonical(questions, version_id, answers):
+    """Answers given on version `version_id`, keyed and lettered as in the original quiz"""
+    variant_set, index = for_id(questions, version_id)
+    return variant_set.to_canonical(index, answers)
+
+
+def benchmark(num_versions=1000, num_questions=20, rounds=20):
+    """Mean milliseconds to build `num_versions` versions with their answer keys"""
+    questions = [{
+        'question': f"{n}. Question number {n}?",
+        'options': [f"{letter}. Option {letter} of {n}" for letter in LETTERS],
+        'answer': LETTERS[n % len(LETTERS)],
+        'explanation': '',
+    } for n in range(1, num_questions + 1)]
+    start = time.perf_counter()
+    for seed in range(rounds):
+        VariantSet(questions, num_versions, seed).answer_keys()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark local quiz version generation")
+    parser.add_argument('--versions', type=int, default=1000)
+    parser.add_argument('--questions', type=int, default=20)
+    args = parser.parse_args(argv)
+    millis = benchmark(args.versions, args.questions)
+    print(f"{millis:.2f} ms for {args.versions} versions of a {args.questions}-question quiz with answer keys")
+
+
+if __name__ == '__main__':
+    main()
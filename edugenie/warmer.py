@@ -0,0 +1,347 @@
+"""
+Off-peak cache warmer for trending topics.
+
+Recent quiz attempts and saved study materials (the last
+EDUGENIE_WARMER_LOOKBACK_HOURS) are ranked by frequency and recency: every
+event adds 0.5 ** (age / EDUGENIE_WARMER_HALF_LIFE_HOURS) to its topic. A
+topic's score is spread over the Bloom's level x question type combinations
+students quizzed it at; topics only studied so far get DEFAULT_LEVEL /
+DEFAULT_TYPE. The top K combinations whose question bank holds fewer than
+EDUGENIE_WARMER_BANK_TARGET questions get a quiz generated and stored in
+
+    warmed_quizzes/{quiz_id}/questions/{nn}
+
+with the question bank fields, so the morning's quizzes on those topics are
+drawn from the bank instead of Gemini. Generation stops before the run's
+token budget (EDUGENIE_WARMER_TOKEN_BUDGET) would be exceeded, judged by the
+average cost of the quizzes generated so far, or when the off-peak window
+ends.
+
+Every run is stored in warmer_runs/{run_id} with its combinations, question
+keys and token spend. `report` counts how many questions served to students
+since a run were warmed ones (its hit-rate contribution) against the tokens it
+spent, which is what K and the budget should be tuned on.
+
+    python -m edugenie.warmer plan --k 20       # ranked combinations, nothing generated
+    python -m edugenie.warmer run --k 20        # warm now (e.g. from cron)
+    python -m edugenie.warmer schedule          # run daily in the EDUGENIE_WARMER_HOURS window
+    python -m edugenie.warmer report            # hit-rate contribution of recent runs
+
+The report reads the `questions` collection group by `created_at`, which needs
+that single-field index enabled for collection-group queries.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import defaultdict, namedtuple
+
+from edugenie import backends, bank, breakers, dedup, generation, metrics, topics, usage
+from edugenie.quizzes import BLOOMS_LEVELS, QUESTION_TYPES, build_quiz_prompt, parse_quiz
+
+QUIZ_MODEL = 'models/gemini-flash-latest'
+QUIZ_COLLECTION = 'warmed_quizzes'
+RUNS_COLLECTION = 'warmer_runs'
+OWNER = 'cache_warmer'
+DEFAULT_LEVEL = 'Understand'
+DEFAULT_TYPE = 'Multiple Choice'
+
+TOP_K = int(os.getenv('EDUGENIE_WARMER_TOP_K', '20'))
+TOKEN_BUDGET = int(os.getenv('EDUGENIE_WARMER_TOKEN_BUDGET', '200000'))
+LOOKBACK_HOURS = float(os.getenv('EDUGENIE_WARMER_LOOKBACK_HOURS', '168'))
+HALF_LIFE_HOURS = float(os.getenv('EDUGENIE_WARMER_HALF_LIFE_HOURS', '24'))
+BANK_TARGET = int(os.getenv('EDUGENIE_WARMER_BANK_TARGET', '30'))
+NUM_QUESTIONS = int(os.getenv('EDUGENIE_WARMER_QUESTIONS', '10'))
+OFF_PEAK_HOURS = os.getenv('EDUGENIE_WARMER_HOURS', '2-6')  # UTC, start-end
+
+Combo = namedtuple('Combo', 'topic topic_key blooms_level question_type score')
+
+
+def _weight(created_at, now, half_life_hours):
+    if not isinstance(created_at, datetime.datetime):
+        return 0.0
+    age = max(0.0, (now - created_at.replace(tzinfo=None)).total_seconds() / 3600)
+    return 0.5 ** (age / half_life_hours)
+
+
+def rank(db, now=None, k=TOP_K, lookback_hours=LOOKBACK_HOURS, half_life_hours=HALF_LIFE_HOURS):
+    """The `k` highest-scoring recent topic x level x type combinations, best first"""
+    now = now or datetime.datetime.utcnow()
+    since = now - datetime.timedelta(hours=lookback_hours)
+    topic_scores = defaultdict(float)
+    combo_weights = defaultdict(lambda: defaultdict(float))
+    names = {}
+
+    with breakers.guard('firestore'), metrics.span('warmer_rank'):
+        attempts = (db.collection('quiz_attempts').where('created_at', '>=', since)
+                    .select(['topic', 'topic_key', 'blooms_level', 'question_type', 'created_at']))
+        for doc in attempts.stream():
+            data = doc.to_dict()
+            key = data.get('topic_key') or topics.topic_key(data.get('topic', ''))
+            level, question_type = data.get('blooms_level'), data.get('question_type')
+            if not key or level not in BLOOMS_LEVELS or question_type not in QUESTION_TYPES:
+                continue
+            weight = _weight(data.get('created_at'), now, half_life_hours)
+            topic_scores[key] += weight
+            combo_weights[key][(level, question_type)] += weight
+            names.setdefault(key, data.get('topic') or key)
+
+        materials = db.collection('study_materials').where('created_at', '>=', since).select(['topic', 'created_at'])
+        for doc in materials.stream():
+            data = doc.to_dict()
+            key = topics.topic_key(data.get('topic', ''))
+            if key:
+                topic_scores[key] += _weight(data.get('created_at'), now, half_life_hours)
+                names.setdefault(key, data.get('topic'))
+
+    combos = []
+    for key, score in topic_scores.items():
+        weights = combo_weights.get(key) or {(DEFAULT_LEVEL, DEFAULT_TYPE): 1.0}
+        total = sum(weights.values())
+        for (level, question_type), weight in weights.items():
+            combos.append(Combo(names[key], key, level, question_type, score * weight / total))
+    combos.sort(key=lambda combo: -combo.score)
+    return combos[:k]
+
+
+def quiz_id(combo, run_id):
+    raw = json.dumps([combo.topic_key, combo.blooms_level, combo.question_type, run_id])
+    return f"warm-{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]}"
+
+
+def generate_combo(combo, num_questions=NUM_QUESTIONS, owner=OWNER):
+    """(questions, total tokens, cost in USD) of one warmed quiz; repeated slots are regenerated"""
+    labels = {'page': 'warmer', 'question_type': combo.question_type, 'model': QUIZ_MODEL}
+    spent = []
+
+    def generate(count, avoid=None):
+        prompt = build_quiz_prompt(combo.topic, combo.blooms_level, count, combo.question_type, avoid=avoid)
+        text, rounds = generation.generate_with_continuation(backends.get_model(QUIZ_MODEL), prompt, labels=labels)
+        usage.record_rounds(rounds, user_id=owner, topic=combo.topic, **labels)
+        spent.extend(rounds)
+        return parse_quiz(text, combo.question_type)[:count]
+
+    questions = dedup.replace_duplicates(generate(num_questions), generate, page='warmer')
+    cost = usage.cost_of(sum(r['prompt_tokens'] for r in spent), sum(r['output_tokens'] for r in spent))
+    return bank.renumber(questions), sum(r['total_tokens'] for r in spent), cost
+
+
+def store_quiz(db, combo, questions, run_id, now):
+    """Write a warmed quiz and its bank-indexed questions in one batch; returns their question keys"""
+    ref = db.collection(QUIZ_COLLECTION).document(quiz_id(combo, run_id))
+    batch = db.batch()
+    batch.set(ref, {
+        'run_id': run_id,
+        'topic': combo.topic,
+        'topic_key': combo.topic_key,
+        'blooms_level': combo.blooms_level,
+        'question_type': combo.question_type,
+        'num_questions': len(questions),
+        'created_at': now,
+    })
+    keys = []
+    for number, question in enumerate(questions, 1):
+        doc = {
+            'question_number': number,
+            'question_text': question['question'],
+            'options': question['options'],
+            'correct_answer': question['answer'],
+            'explanation': question['explanation'],
+            'created_at': now,
+        }
+        doc.update(bank.index_fields(combo.topic, combo.blooms_level, combo.question_type, question['question']))
+        keys.append(doc['question_key'])
+        batch.set(ref.collection('questions').document(f"{number:02d}"), doc)
+    with breakers.guard('firestore'):
+        batch.commit()
+    bank.add(combo.topic, combo.blooms_level, combo.question_type, questions)
+    return keys
+
+
+def run(db, k=TOP_K, token_budget=TOKEN_BUDGET, bank_target=BANK_TARGET, num_questions=NUM_QUESTIONS,
+        deadline=None, now=None, log=print):
+    """Warm the top `k` combinations within `token_budget`; returns the stored run summary
+
+    `deadline` (a time.time() value) stops generation when the off-peak window closes.
+    """
+    now = now or datetime.datetime.utcnow()
+    run_id = f"{now:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+    combos = rank(db, now, k)
+    warmed, skipped = [], []
+    tokens, cost = 0, 0.0
+    stopped = None
+
+    for combo in combos:
+        name = f"{combo.topic} / {combo.blooms_level} / {combo.question_type}"
+        try:
+            banked = len(bank.load(db, combo.topic, combo.blooms_level, combo.question_type))
+        except Exception:
+            banked = 0
+        if banked >= bank_target:
+            skipped.append(name)
+            log(f"skip   {name}: {banked} questions banked")
+            continue
+        average = tokens / len(warmed) if warmed else 0
+        if token_budget and tokens + average > token_budget:
+            stopped = 'budget'
+            break
+        if deadline is not None and time.time() >= deadline:
+            stopped = 'window'
+            break
+        try:
+            with metrics.span('warmer_quiz', question_type=combo.question_type):
+                questions, spent, spent_usd = generate_combo(combo, num_questions)
+            tokens += spent
+            cost += spent_usd
+            keys = store_quiz(db, combo, questions, run_id, now) if questions else []
+        except Exception as e:
+            metrics.inc('edugenie_warmer_quizzes_total', status='failed')
+            log(f"FAILED {name}: {e}")
+            continue
+        warmed.append(dict(combo._asdict(), question_keys=keys, tokens=spent, short=len(questions) < num_questions))
+        metrics.inc('edugenie_warmer_quizzes_total', status='warmed')
+        metrics.inc('edugenie_warmer_tokens_total', spent)
+        short = f" (short of {num_questions})" if len(questions) < num_questions else ''
+        log(f"warmed {name}: {len(keys)} questions{short}, {spent:,} tokens (score {combo.score:.2f})")
+
+    summary = {
+        'started_at': now,
+        'finished_at': datetime.datetime.utcnow(),
+        'k': k,
+        'token_budget': token_budget,
+        'tokens': tokens,
+        'cost_usd': cost,
+        'warmed': warmed,
+        'skipped': skipped,
+        'stopped': stopped,
+    }
+    with breakers.guard('firestore'):
+        db.collection(RUNS_COLLECTION).document(run_id).set(summary)
+    try:
+        usage.flush(db)
+    except Exception:
+        pass
+    return dict(summary, run_id=run_id)
+
+
+def hit_report(db, run_id):
+    """Questions served to students since a run, and how many of them the run warmed"""
+    with breakers.guard('firestore'):
+        snapshot = db.collection(RUNS_COLLECTION).document(run_id).get()
+    if not snapshot.exists:
+        raise KeyError(run_id)
+    data = snapshot.to_dict()
+    warmed_keys = {key for combo in data.get('warmed', []) for key in combo.get('question_keys', [])}
+
+    served = hits = 0
+    with breakers.guard('firestore'), metrics.span('warmer_report'):
+        query = (db.collection_group('questions').where('created_at', '>=', data['finished_at'])
+                 .select(['user_id', 'question_key']))
+        for doc in query.stream():
+            question = doc.to_dict()
+            if not question.get('user_id'):
+                continue  # stored by a generator, not answered by a student
+            served += 1
+            hits += question.get('question_key') in warmed_keys
+    return {
+        'run_id': run_id,
+        'finished_at': data['finished_at'],
+        'combos': len(data.get('warmed', [])),
+        'questions_warmed': len(warmed_keys),
+        'tokens': data.get('tokens', 0),
+        'cost_usd': data.get('cost_usd', 0.0),
+        'served': served,
+        'warm_hits': hits,
+        'hit_rate': hits / served if served else 0.0,
+        'tokens_per_hit': data.get('tokens', 0) / hits if hits else None,
+    }
+
+
+def recent_runs(db, limit=5):
+    query = db.collection(RUNS_COLLECTION).order_by('started_at', direction='DESCENDING').limit(limit)
+    return [doc.id for doc in query.stream()]
+
+
+def parse_hours(spec=OFF_PEAK_HOURS):
+    """(start, end) UTC hours from "2-6"; the window may wrap past midnight, e.g. "22-4\""""
+    start, end = (int(part) % 24 for part in spec.split('-', 1))
+    return start, end
+
+
+def next_window(now, hours=OFF_PEAK_HOURS):
+    """(start, end) datetimes of the current off-peak window, or of the next one"""
+    start_hour, end_hour = parse_hours(hours)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    for day in (-1, 0, 1):
+        start = midnight + datetime.timedelta(days=day, hours=start_hour)
+        end = start + datetime.timedelta(hours=(end_hour - start_hour) % 24 or 24)
+        if now < end:
+            return start, end
+    raise AssertionError("unreachable")
+
+
+def schedule(db, hours=OFF_PEAK_HOURS, log=print, **kwargs):
+    """Run once in every off-peak window, forever"""
+    while True:
+        now = datetime.datetime.utcnow()
+        start, end = next_window(now, hours)
+        if now < start:
+            log(f"next warm-up at {start:%Y-%m-%d %H:%M} UTC")
+            time.sleep((start - now).total_seconds())
+        deadline = time.time() + (end - datetime.datetime.utcnow()).total_seconds()
+        try:
+            summary = run(db, deadline=deadline, log=log, **kwargs)
+            log(f"run {summary['run_id']}: {len(summary['warmed'])} quizzes, {summary['tokens']:,} tokens")
+        except Exception as e:
+            metrics.inc('edugenie_warmer_errors_total')
+            log(f"warm-up failed: {e}")
+        time.sleep(max(0.0, (end - datetime.datetime.utcnow()).total_seconds()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate quizzes for trending topics off-peak")
+    commands = parser.add_subparsers(dest='command')
+    plan_cmd = commands.add_parser('plan', help="show the ranked combinations without generating")
+    run_cmd = commands.add_parser('run', help="warm the top combinations now")
+    schedule_cmd = commands.add_parser('schedule', help="warm once a day in the off-peak window")
+    for command in (plan_cmd, run_cmd, schedule_cmd):
+        command.add_argument('--k', type=int, default=TOP_K, help="number of combinations to consider")
+    for command in (run_cmd, schedule_cmd):
+        command.add_argument('--budget', type=int, default=TOKEN_BUDGET, help="token budget per run (0 = unlimited)")
+        command.add_argument('--bank-target', type=int, default=BANK_TARGET,
+                             help="skip combinations with at least this many banked questions")
+    schedule_cmd.add_argument('--hours', default=OFF_PEAK_HOURS, help="off-peak window in UTC hours, e.g. 2-6")
+    report_cmd = commands.add_parser('report', help="hit-rate contribution and token spend of recent runs")
+    report_cmd.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        parser.print_help()
+        return
+    db = backends.get_firestore()
+    if args.command == 'plan':
+        for position, combo in enumerate(rank(db, k=args.k), 1):
+            print(f"{position:>3}  {combo.score:>8.2f}  {combo.topic[:40]:<40} {combo.blooms_level:<10} {combo.question_type}")
+    elif args.command == 'run':
+        backends.configure_gemini()
+        summary = run(db, args.k, args.budget, args.bank_target)
+        print(f"\nrun {summary['run_id']}: {len(summary['warmed'])} quizzes warmed, {len(summary['skipped'])} already "
+              f"banked, {summary['tokens']:,} tokens (${summary['cost_usd']:.4f})"
+              + (f", stopped by {summary['stopped']}" if summary['stopped'] else ''))
+    elif args.command == 'schedule':
+        backends.configure_gemini()
+        schedule(db, args.hours, k=args.k, token_budget=args.budget, bank_target=args.bank_target)
+    elif args.command == 'report':
+        print(f"{'run':<24} {'quizzes':>7} {'tokens':>10} {'served':>8} {'warm hits':>9} {'hit rate':>8} {'tokens/hit':>10}")
+        for run_id in recent_runs(db, args.runs):
+            row = hit_report(db, run_id)
+            per_hit = f"{row['tokens_per_hit']:,.0f}" if row['tokens_per_hit'] else '-'
+            print(f"{run_id:<24} {row['combos']:>7} {row['tokens']:>10,} {row['served']:>8} {row['warm_hits']:>9} "
+                  f"{row['hit_rate']:>7.1%} {per_hit:>10}")
+
+
+if __name__ == '__main__':
+    main()
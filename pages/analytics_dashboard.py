@@ -0,0 +1,95 @@
+import streamlit as st
+
+import pandas as pd
+
+from edugenie import analytics, backends, identity, metrics
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+metrics.start_from_env()
+
+st.set_page_config(page_title="Learning Analytics - Edugenie", page_icon="📊", layout="wide")
+
+
+def student_label(row):
+    """Leaderboard name: the display name, or a short anonymous handle"""
+    return row.get('display_name') or f"Student {row['user_id'][-4:]}"
+
+
+# Main App
+st.title("📊 Learning Analytics")
+st.markdown("Accuracy by topic and Bloom's level, weekly trends and the class leaderboard")
+
+db, db_err = backends.page_firestore()
+backend = analytics.get_analytics(db) if db or analytics.local_store() else None
+if backend is None:
+    st.warning(f"Analytics need Firestore or a local store (EDUGENIE_ANALYTICS_DB). {db_err or ''}")
+    st.stop()
+
+with st.sidebar:
+    st.header("⚙️ View")
+    scope = st.radio("Show stats for:", ["Me", "Whole class"], key="analytics_scope")
+    weeks = st.slider("Weeks of history:", min_value=4, max_value=26, value=8, key="analytics_weeks")
+    if st.button("🔄 Refresh", use_container_width=True):
+        analytics.clear_cache()
+    st.caption(f"Figures are cached for {analytics.ANALYTICS_TTL:.0f}s ({backend.name} backend)")
+
+user_id = identity.current_user_id() if scope == "Me" else None
+
+try:
+    overview = analytics.cached(backend, 'overview', user_id)
+except Exception as e:
+    st.error(f"Failed to load analytics: {e}")
+    st.stop()
+
+if not overview['attempts']:
+    st.info("No quiz attempts yet. Complete a quiz to see your analytics here!")
+    st.stop()
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Quizzes", overview['attempts'])
+col2.metric("Questions", overview['questions'])
+col3.metric("Accuracy", f"{overview['accuracy']:.1f}%")
+col4.metric("Average Score", f"{overview['average_score']:.1f}%")
+
+st.subheader("📈 Weekly Trend")
+trend = pd.DataFrame(analytics.cached(backend, 'weekly_trend', user_id, weeks=weeks))
+st.line_chart(trend.set_index('week_start')[['average_score', 'accuracy']])
+
+col1, col2 = st.columns(2)
+with col1:
+    st.subheader("📚 Accuracy by Topic")
+    by_topic = analytics.cached(backend, 'by_topic', user_id)
+    if by_topic:
+        st.bar_chart(pd.DataFrame(by_topic).set_index('topic')['accuracy'])
+    else:
+        st.info("No topics yet")
+
+with col2:
+    st.subheader("🧠 Accuracy by Bloom's Level")
+    by_level = analytics.cached(backend, 'by_blooms_level', user_id)
+    if by_level:
+        st.bar_chart(pd.DataFrame(by_level).set_index('blooms_level')['accuracy'])
+    else:
+        st.info("No levels yet")
+
+st.subheader("🏆 Class Leaderboard")
+leaders = analytics.cached(backend, 'leaderboard')
+if leaders:
+    st.dataframe(
+        pd.DataFrame([{
+            'Rank': rank,
+            'Student': student_label(row),
+            'Points': row['points'],
+            'Quizzes': row['attempts'],
+            'Accuracy': f"{row['accuracy']:.1f}%",
+        } for rank, row in enumerate(leaders, 1)]),
+        hide_index=True,
+        use_container_width=True,
+    )
+else:
+    st.info("The leaderboard fills up as students complete quizzes")
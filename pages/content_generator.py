@@ -1,9 +1,11 @@
 import streamlit as st
 import os
-import json
-import re
 import datetime
 
+from edugenie import (backends, breakers, cache, contentstore, flashcards, generation, identity, jobs,
+                      metrics, notes, usage)
+from edugenie.study import AUDIENCES, GOALS, build_study_prompt, content_stats, parse_questions, section_text
+
 try:
     from dotenv import load_dotenv
     load_dotenv()
@@ -15,12 +17,6 @@ try:
 except Exception:
     genai = None
 
-try:
-    import firebase_admin
-    from firebase_admin import credentials, firestore
-except Exception:
-    firebase_admin = None
-
 # --- Configuration ---
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 if not GEMINI_API_KEY:
@@ -35,148 +31,123 @@ if GEMINI_API_KEY and genai:
     except Exception:
         pass
 
+metrics.start_from_env()
+
 # Page config
 st.set_page_config(page_title="Study Material Generator", page_icon="📚", layout="wide")
 
 # Collection name - PREDEFINED, no user input needed
 COLLECTION_NAME = 'study_materials'
 
-def init_firestore():
-    """Initialize Firestore client"""
-    if firebase_admin is None:
-        return None, "firebase-admin not installed"
+# Material this long is shown a section at a time
+LONG_CONTENT_WORDS = int(os.getenv('EDUGENIE_LONG_CONTENT_WORDS', '800'))
 
-    try:
-        app = None
-        try:
-            app = firebase_admin.get_app()
-        except ValueError:
-            pass
-
-        if app is None:
-            cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH')
-            cred_json = os.getenv('FIREBASE_CREDENTIALS_JSON')
-            
-            try:
-                if 'firebase_credentials' in st.secrets:
-                    cred_dict = dict(st.secrets['firebase_credentials'])
-                    cred = credentials.Certificate(cred_dict)
-                    firebase_admin.initialize_app(cred)
-                elif cred_json:
-                    cred_dict = json.loads(cred_json)
-                    cred = credentials.Certificate(cred_dict)
-                    firebase_admin.initialize_app(cred)
-                elif cred_path and os.path.exists(cred_path):
-                    cred = credentials.Certificate(cred_path)
-                    firebase_admin.initialize_app(cred)
-                else:
-                    return None, "No Firebase credentials found"
-            except Exception as e:
-                if cred_json:
-                    cred_dict = json.loads(cred_json)
-                    cred = credentials.Certificate(cred_dict)
-                    firebase_admin.initialize_app(cred)
-                elif cred_path and os.path.exists(cred_path):
-                    cred = credentials.Certificate(cred_path)
-                    firebase_admin.initialize_app(cred)
-                else:
-                    return None, f"Firebase initialization failed: {str(e)}"
+# Last good library listing and saved texts, shown while Firestore is unavailable
+_saved_materials = cache.get_cache('saved_materials', maxsize=1)
+_saved_texts = cache.get_cache('saved_material_texts', maxsize=256)
 
-        db = firestore.client()
-        return db, None
+def generate_content(prompt, model_name='gemini-flash-latest', goal=None, topic=None, user_id=None):
+    """Generate content using Gemini; usage is accounted to `user_id` and `topic`"""
+    if genai is None and not backends.is_offline():
+        return None, "google.generativeai not installed"
+
+    try:
+        model = backends.get_model(model_name)
+        labels = {'page': 'study_material', 'question_type': goal, 'model': model_name}
+        text, rounds = generation.generate_with_continuation(model, prompt, labels=labels)
+        usage.record_rounds(rounds, user_id=user_id, topic=topic, **labels)
+        return text, None
     except Exception as e:
         return None, str(e)
 
 
-def parse_questions(quiz_text):
-    """Extract questions from generated text"""
-    questions = []
-    if not quiz_text:
-        return questions
-
-    parts = re.split(r'\n(?=\d+\.)', quiz_text.strip())
-    for part in parts:
-        lines = [l.strip() for l in part.strip().split('\n') if l.strip()]
-        if not lines:
-            continue
-
-        q_text = lines[0]
-        options = []
-        answer = ''
-        explanation = ''
-
-        for line in lines[1:]:
-            if re.match(r'^[A-D]\.', line, re.I):
-                options.append(line)
-            elif line.lower().startswith('answer') or line.lower().startswith('correct'):
-                answer = line.split(':', 1)[-1].strip()
-            elif line.lower().startswith('explanation'):
-                explanation = line.split(':', 1)[-1].strip()
-            else:
-                if explanation:
-                    explanation += ' ' + line
-
-        questions.append({
-            'question': q_text,
-            'options': options,
-            'answer': answer,
-            'explanation': explanation
-        })
+def generate_notes_by_section(topic, audience, num_items, include_explanations, user_id=None):
+    """Generate comprehensive notes outline-first, publishing sections as job progress"""
+    goal = "Comprehensive Notes"
+    progress = {'titles': [], 'sections': {}}
 
-    return questions
+    def generate(prompt):
+        return generate_content(prompt, goal=goal, topic=topic, user_id=user_id)
 
+    def on_outline(titles):
+        progress['titles'] = list(titles)
+        jobs.report_progress(progress)
 
-def generate_content(prompt, model_name='gemini-flash-latest'):
-    """Generate content using Gemini"""
-    if genai is None:
-        return None, "google.generativeai not installed"
+    def on_section(idx, title, body, cached):
+        if cached:
+            usage.record(user_id=user_id, page='study_material', topic=topic, model='gemini-flash-latest',
+                         question_type=goal, cache_hit=True)
+        progress['sections'][idx] = (body, cached)
+        jobs.report_progress(progress)
 
-    try:
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt)
-        return response.text, None
-    except Exception as e:
-        return None, str(e)
+    return notes.generate_sectioned_notes(
+        generate, topic, audience, num_items, include_explanations,
+        on_outline=on_outline, on_section=on_section
+    )
 
 
-def compute_read_time(text):
-    """Calculate reading time"""
-    words = re.findall(r"\w+", text or '')
-    word_count = len(words)
-    read_minutes = max(1, round(word_count / 200.0))
-    return {
-        'word_count': word_count,
-        'estimated_read_time_minutes': read_minutes
-    }
+def run_generation(topic, audience, goal, num_items, include_explanations, sectioned_notes, user_id=None):
+    """Generate study material; runs on the background job pool"""
+    if sectioned_notes:
+        generated_text, err = generate_notes_by_section(topic, audience, num_items, include_explanations,
+                                                        user_id=user_id)
+    else:
+        with metrics.span('prompt_build', page='study_material', question_type=goal):
+            prompt = build_study_prompt(topic, audience, goal, num_items, include_explanations)
+        generated_text, err = generate_content(prompt, goal=goal, topic=topic, user_id=user_id)
+
+    if err:
+        raise RuntimeError(err)
+    return generated_text
+
+
+def render_section_progress(progress):
+    """Show the outline with finished sections filled in"""
+    titles = progress.get('titles') or []
+    if not titles:
+        st.info("🔄 Planning sections...")
+        return
+
+    sections = progress['sections']
+    st.progress(len(sections) / len(titles), text=f"🔄 {len(sections)} of {len(titles)} sections ready")
+    for idx, title in enumerate(titles):
+        if idx in sections:
+            body, cached = sections[idx]
+            st.markdown(f"✅ **{idx + 1}. {title}**" + (" *(cached)*" if cached else ""))
+            st.write(body)
+        else:
+            st.markdown(f"⏳ **{idx + 1}. {title}**")
 
 
-def save_to_firestore(db, topic, audience, goal, num_items, generated_text, parsed_questions):
-    """Save study material to Firestore"""
+def save_to_firestore(db, topic, audience, goal, num_items, generated_text, parsed_questions, stats=None):
+    """Save study material to Firestore, with its stats and section index on the listing document"""
     try:
-        meta = {
-            'topic': topic,
-            'audience': audience,
-            'goal': goal,
-            'num_items_requested': num_items,
-            'created_at': datetime.datetime.utcnow()
-        }
-        
-        set_ref = db.collection(COLLECTION_NAME).document()
-        set_ref.set(meta)
-
-        # Save questions as subcollection
-        for q in parsed_questions:
-            qdoc = {
-                'question': q.get('question', ''),
-                'options': q.get('options', []),
-                'answer': q.get('answer', ''),
-                'explanation': q.get('explanation', ''),
+        with breakers.guard('firestore'), metrics.span('save_to_firestore', page='study_material', question_type=goal):
+            meta = {
+                'topic': topic,
+                'audience': audience,
+                'goal': goal,
+                'num_items_requested': num_items,
                 'created_at': datetime.datetime.utcnow()
             }
-            set_ref.collection('questions').add(qdoc)
-
-        # Save raw text
-        set_ref.collection('raw').document('generated_text').set({'text': generated_text})
+            meta.update(stats or content_stats(generated_text))
+        
+            set_ref = db.collection(COLLECTION_NAME).document()
+            set_ref.set(meta)
+
+            # Save questions as subcollection
+            for q in parsed_questions:
+                qdoc = {
+                    'question': q.get('question', ''),
+                    'options': q.get('options', []),
+                    'answer': q.get('answer', ''),
+                    'explanation': q.get('explanation', ''),
+                    'created_at': datetime.datetime.utcnow()
+                }
+                set_ref.collection('questions').add(qdoc)
+
+            # Save raw text
+            set_ref.collection('raw').document('generated_text').set({'text': generated_text})
 
         return True, set_ref.id
     except Exception as e:
@@ -184,35 +155,127 @@ def save_to_firestore(db, topic, audience, goal, num_items, generated_text, pars
 
 
 def load_saved_materials(db):
-    """Load all saved study materials"""
+    """Load all saved study materials; falls back to the last good listing with an error"""
     try:
-        study_sets = db.collection(COLLECTION_NAME)\
-            .order_by('created_at', direction=firestore.Query.DESCENDING)\
-            .limit(20)\
-            .stream()
+        with breakers.guard('firestore'), metrics.span('load_saved_materials', page='study_material'):
+            study_sets = db.collection(COLLECTION_NAME)\
+                .order_by('created_at', direction='DESCENDING')\
+                .limit(20)\
+                .stream()
         
-        study_sets_list = []
-        for doc in study_sets:
-            study_sets_list.append({'id': doc.id, **doc.to_dict()})
+            study_sets_list = []
+            for doc in study_sets:
+                study_sets_list.append({'id': doc.id, **doc.to_dict()})
         
+        _saved_materials.set('latest', study_sets_list)
         return study_sets_list, None
     except Exception as e:
-        return [], str(e)
+        return _saved_materials.get('latest') or [], str(e)
+
+
+def load_saved_text(db, material_id):
+    """Generated text of a saved material; saved texts never change, so they are cached"""
+    text = _saved_texts.get(material_id)
+    if text is None:
+        with breakers.guard('firestore'):
+            raw_doc = db.collection(COLLECTION_NAME)\
+                .document(material_id)\
+                .collection('raw')\
+                .document('generated_text')\
+                .get()
+        text = raw_doc.to_dict().get('text', '') if raw_doc.exists else ''
+        _saved_texts.set(material_id, text)
+    return text
+
+
+def add_to_deck(db, topic, text, material_id=None):
+    """Parse flashcards out of `text` and add them to the student's review deck"""
+    cards = flashcards.parse_flashcards(text)
+    if not cards:
+        st.warning("⚠️ No Q:/A: flashcards found in this content")
+        return
+    try:
+        added, updated = flashcards.save_cards(db, identity.current_user_id(), topic, cards, material_id=material_id)
+    except Exception as e:
+        st.error(f"❌ Couldn't add the flashcards: {e}")
+        return
+    st.success(f"🗂️ Added {added} card(s) to your review deck" + (f", updated {updated}" if updated else "")
+               + ". Review them on the Flashcard Review page.")
+
+
+def render_content(text, stats, key, height=300):
+    """Long material one section at a time from its section index, short material in full"""
+    sections = stats.get('sections') or []
+    if stats.get('word_count', 0) < LONG_CONTENT_WORDS or len(sections) < 2:
+        st.text_area("Generated Content", value=text, height=height, key=key, label_visibility="collapsed")
+        return
+    choice = st.selectbox("📑 Section", range(len(sections)), format_func=lambda i: sections[i]['title'],
+                          key=f"{key}_section")
+    st.markdown(section_text(text, sections[choice]))
+
+
+def read_time_caption(stats):
+    sections = len(stats.get('sections') or [])
+    return (f"📖 Reading time: ~{stats['estimated_read_time_minutes']} min ({stats['word_count']} words"
+            + (f", {sections} sections)" if sections > 1 else ")"))
+
+
+@st.fragment(run_every=1)
+def content_job_status():
+    """Poll the background generation job, showing partial sections while it runs"""
+    job_info = st.session_state.content_job
+    job = jobs.get(job_info['id'])
+
+    if job is not None and not job.finished:
+        if job.progress:
+            render_section_progress(job.progress)
+        else:
+            st.info(f"🔄 Generating personalized content... ({job.elapsed():.0f}s)")
+        return
+
+    st.session_state.content_job = None
+    if job is None:
+        st.session_state.content_job_error = "Generation job expired. Please generate again."
+    elif job.status == jobs.FAILED:
+        st.session_state.content_job_error = f"Generation failed: {job.error}"
+    else:
+        st.session_state.generated_content_key = contentstore.put(job.result)
+        st.session_state.content_stats = content_stats(job.result)
+        st.session_state.content_metadata = job_info['meta']
+        
+        # No question parsing needed - this is for study materials only
+        st.session_state.parsed_questions = []
+
+    if job is not None:
+        jobs.discard(job.id)
+    st.rerun()
 
 
 # Initialize session state
-if 'generated_content' not in st.session_state:
-    st.session_state.generated_content = None
+if 'generated_content_key' not in st.session_state:
+    st.session_state.generated_content_key = None  # the text lives in the process content store
 if 'content_metadata' not in st.session_state:
     st.session_state.content_metadata = {}
 if 'parsed_questions' not in st.session_state:
     st.session_state.parsed_questions = []
 if 'show_saved' not in st.session_state:
     st.session_state.show_saved = False
+if 'content_job' not in st.session_state:
+    st.session_state.content_job = None
+if 'content_stats' not in st.session_state:
+    st.session_state.content_stats = {}
 
 # --- HEADER ---
 st.title("📚 Study Material Generator")
 st.markdown("*Generate personalized study content and save it to your library*")
+for message in breakers.outage_messages():
+    st.warning(message)
+
+contentstore.touch(identity.session_id(), [st.session_state.generated_content_key])
+generated_content = contentstore.get(st.session_state.generated_content_key)
+if st.session_state.generated_content_key and generated_content is None:
+    st.session_state.generated_content_key = None
+    st.info("⌛ Your generated material expired after a long break. Generate it again to continue.")
 
 # --- SIDEBAR ---
 with st.sidebar:
@@ -226,13 +289,13 @@ with st.sidebar:
     
     audience = st.selectbox(
         "👥 Target Audience",
-        ["High School", "Undergraduate", "Graduate", "Self-learner"],
+        AUDIENCES,
         index=1
     )
     
     goal = st.selectbox(
         "🎯 Study Goal",
-        ["Summary", "Flashcards", "Comprehensive Notes"],
+        GOALS,
         index=0,
         help="Choose what type of content to generate"
     )
@@ -251,10 +314,23 @@ with st.sidebar:
         help="Add detailed explanations to answers"
     )
     
+    sectioned_notes = False
+    if goal == "Comprehensive Notes":
+        sectioned_notes = st.checkbox(
+            "🧩 Generate Section by Section",
+            value=True,
+            help="Outline first, then write sections in parallel. Faster for long notes and avoids cut-off output."
+        )
+    
     st.markdown("---")
     
     # Generate button
-    generate_btn = st.button("🚀 Generate Content", type="primary", use_container_width=True)
+    generate_btn = st.button(
+        "🚀 Generate Content",
+        type="primary",
+        use_container_width=True,
+        disabled=st.session_state.content_job is not None
+    )
     
     st.markdown("---")
     
@@ -274,7 +350,7 @@ with st.sidebar:
 if st.session_state.show_saved:
     st.header("📚 Your Saved Study Materials")
     
-    db, db_err = init_firestore()
+    db, db_err = backends.page_firestore()
     if db is None:
         st.error(f"❌ Firestore not available: {db_err}")
         st.info("💡 Configure Firebase to save and access your study materials")
@@ -282,12 +358,15 @@ if st.session_state.show_saved:
         with st.spinner("Loading saved materials..."):
             materials, err = load_saved_materials(db)
             
-            if err:
+            if err and not materials:
                 st.error(f"❌ Error loading materials: {err}")
             elif not materials:
                 st.info("📭 No saved materials yet. Generate and save some content first!")
             else:
-                st.success(f"✅ Found {len(materials)} saved study material(s)")
+                if err:
+                    st.warning(f"⚠️ Showing the last loaded list: {err}")
+                else:
+                    st.success(f"✅ Found {len(materials)} saved study material(s)")
                 
                 for idx, material in enumerate(materials):
                     created_date = material.get('created_at', 'N/A')
@@ -308,28 +387,26 @@ if st.session_state.show_saved:
                         
                         st.markdown("---")
                         
-                        # Load raw text
+                        # Stats were stored with the material; older materials compute them once loaded
+                        stats = material if 'word_count' in material else None
+                        if stats:
+                            st.info(read_time_caption(stats))
+                        
+                        # Load raw text only when asked for
+                        if not st.toggle("📄 Show content", key=f"open_{material['id']}"):
+                            continue
                         try:
-                            raw_doc = db.collection(COLLECTION_NAME)\
-                                .document(material['id'])\
-                                .collection('raw')\
-                                .document('generated_text')\
-                                .get()
+                            raw_text = load_saved_text(db, material['id'])
                             
-                            if raw_doc.exists:
-                                raw_text = raw_doc.to_dict().get('text', '')
-                                st.subheader("📄 Content")
-                                st.text_area(
-                                    "Generated Content",
-                                    value=raw_text,
-                                    height=200,
-                                    key=f"saved_content_{idx}",
-                                    label_visibility="collapsed"
-                                )
+                            if raw_text:
+                                if stats is None:
+                                    stats = content_stats(raw_text)
+                                    st.info(read_time_caption(stats))
+                                render_content(raw_text, stats, key=f"saved_content_{idx}", height=200)
                                 
-                                # Calculate reading time
-                                read_info = compute_read_time(raw_text)
-                                st.info(f"📖 Reading time: ~{read_info['estimated_read_time_minutes']} min ({read_info['word_count']} words)")
+                                if material.get('goal') == 'Flashcards':
+                                    if st.button("🗂️ Add to My Review Deck", key=f"deck_{material['id']}"):
+                                        add_to_deck(db, material.get('topic', ''), raw_text, material_id=material['id'])
                         except Exception as e:
                             st.warning(f"⚠️ Could not load content: {e}")
 
@@ -341,46 +418,31 @@ else:
         if not topic:
             st.error("❌ Please enter a topic to generate content")
         else:
-            with st.spinner("🔄 Generating personalized content..."):
-                prompt = f"""
-Generate {num_items} high-quality study items for the topic: {topic}.
-
-Target audience: {audience}
-Study goal: {goal}
-Include explanations: {include_explanations}
-
-Format requirements:
-- Number each item (1., 2., 3., etc.)
-- For flashcards: use Q: ... and A: ... format with clear questions and concise answers
-- For summaries: use clear paragraphs with numbered sections covering key concepts
-- For comprehensive notes: provide detailed explanations with numbered points, examples, and important details
+            # Runs on the shared worker pool so reruns don't lose the generation
+            backends.page_firestore()  # starts the usage flusher, so budgets see other processes' spend
+            user_id = identity.current_user_id()
+            st.session_state.content_job = {
+                'id': jobs.submit(
+                    run_generation, topic, audience, goal, num_items, include_explanations, sectioned_notes,
+                    user_id=user_id, kind='study_material', owner=user_id
+                ),
+                'meta': {
+                    'topic': topic,
+                    'audience': audience,
+                    'goal': goal,
+                    'num_items': num_items
+                }
+            }
+            st.rerun()
 
-Provide comprehensive, accurate, and educational content focused on learning and understanding the topic.
-Do NOT generate quiz questions with multiple choice options - this is for study materials only.
-"""
+    if st.session_state.get('content_job_error'):
+        st.error(f"❌ {st.session_state.pop('content_job_error')}")
 
-                generated_text, err = generate_content(prompt)
-                
-                if err:
-                    st.error(f"❌ Generation failed: {err}")
-                else:
-                    # Store in session state
-                    st.session_state.generated_content = generated_text
-                    st.session_state.content_metadata = {
-                        'topic': topic,
-                        'audience': audience,
-                        'goal': goal,
-                        'num_items': num_items
-                    }
-                    
-                    # No question parsing needed - this is for study materials only
-                    st.session_state.parsed_questions = []
-                    
-                    st.success("✅ Content generated successfully!")
-                    st.rerun()
+    if st.session_state.content_job:
+        content_job_status()
 
     # Display generated content
-    if st.session_state.generated_content:
+    if generated_content:
         st.markdown("---")
         st.header("📝 Generated Study Material")
         
@@ -399,24 +461,18 @@ Do NOT generate quiz questions with multiple choice options - this is for study
         st.markdown("---")
         
         # Show content
+        stats = st.session_state.content_stats
         st.subheader("📄 Content")
-        st.text_area(
-            "Generated Text",
-            value=st.session_state.generated_content,
-            height=300,
-            key='content_display',
-            label_visibility="collapsed"
-        )
+        render_content(generated_content, stats, key='content_display')
         
         # Show reading time
-        read_info = compute_read_time(st.session_state.generated_content)
-        st.info(f"📖 Estimated reading time: **~{read_info['estimated_read_time_minutes']} minutes** ({read_info['word_count']} words)")
+        st.info(f"📖 Estimated reading time: **~{stats['estimated_read_time_minutes']} minutes** ({stats['word_count']} words)")
         
         # SAVE SECTION - Always visible when content exists
         st.markdown("---")
         st.header("💾 Save Your Study Material")
         
-        db, db_err = init_firestore()
+        db, db_err = backends.page_firestore()
         if db is None:
             st.warning(f"⚠️ Firestore not available: {db_err}")
             st.info("💡 To enable saving, configure Firebase credentials in your environment")
@@ -437,8 +493,9 @@ Do NOT generate quiz questions with multiple choice options - this is for study
                             meta.get('audience', ''),
                             meta.get('goal', ''),
                             meta.get('num_items', 0),
-                            st.session_state.generated_content,
-                            st.session_state.parsed_questions
+                            generated_content,
+                            st.session_state.parsed_questions,
+                            stats=st.session_state.content_stats
                         )
                         
                         if success:
@@ -446,6 +503,10 @@ Do NOT generate quiz questions with multiple choice options - this is for study
                             st.balloons()
                         else:
                             st.error(f"❌ Save failed: {result}")
+            
+            if meta.get('goal') == 'Flashcards':
+                if st.button("🗂️ Add to My Review Deck", use_container_width=True):
+                    add_to_deck(db, meta.get('topic', ''), generated_content)
     else:
         # Show welcome message
         st.info("👈 Enter a topic in the sidebar and click 'Generate Content' to get started!")
@@ -0,0 +1,94 @@
+import streamlit as st
+
+from edugenie import backends, breakers, flashcards, identity, metrics
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+metrics.start_from_env()
+
+st.set_page_config(page_title="Flashcard Review - Edugenie", page_icon="🗂️", layout="wide")
+
+
+def _reveal():
+    st.session_state.review_revealed = True
+
+
+def _grade(quality):
+    try:
+        st.session_state.review_session.grade(db, quality)
+    except Exception as e:
+        st.session_state.review_error = f"Couldn't save that review: {e}"
+    st.session_state.review_revealed = False
+
+
+def _new_session():
+    st.session_state.review_session = None
+    st.session_state.review_revealed = False
+
+
+if 'review_session' not in st.session_state:
+    st.session_state.review_session = None
+if 'review_revealed' not in st.session_state:
+    st.session_state.review_revealed = False
+
+# Main App
+st.title("🗂️ Flashcard Review")
+st.markdown("Review your flashcards when they are due, spaced out so you remember them for longer")
+for message in breakers.outage_messages():
+    st.warning(message)
+
+db, db_err = backends.page_firestore()
+if db is None:
+    st.warning(f"Flashcard review needs Firestore. {db_err or ''}")
+    st.stop()
+
+user_id = identity.current_user_id()
+
+with st.sidebar:
+    st.header("⚙️ Review")
+    topic_filter = st.text_input("Only this topic (optional):", key="review_topic")
+    st.button("🔄 Start New Session", on_click=_new_session, use_container_width=True)
+    try:
+        col1, col2 = st.columns(2)
+        col1.metric("Due now", flashcards.due_count(db, user_id, topic=topic_filter or None))
+        col2.metric("Deck", flashcards.deck_size(db, user_id))
+    except Exception:
+        st.caption("⚠️ Deck stats couldn't be loaded right now")
+
+session = st.session_state.review_session
+if session is None or session.topic != (topic_filter or None):
+    session = st.session_state.review_session = flashcards.ReviewSession(user_id, topic=topic_filter or None)
+    st.session_state.review_revealed = False
+
+if st.session_state.get('review_error'):
+    st.error(st.session_state.pop('review_error'))
+
+try:
+    current = session.current(db)
+except Exception as e:
+    st.error(f"Failed to load due cards: {e}")
+    st.stop()
+
+if current is None:
+    if session.reviewed:
+        st.success(f"🎉 Session complete: {session.reviewed} card(s) reviewed. Come back when more are due!")
+    else:
+        st.info("📭 No cards are due. Add flashcards from the Study Material Generator to build your deck.")
+    st.stop()
+
+cid, card = current
+st.caption(f"{card.get('topic', '')} · reviewed this session: {session.reviewed}")
+st.subheader(card['front'])
+
+if not st.session_state.review_revealed:
+    st.button("👀 Show Answer", type="primary", on_click=_reveal)
+else:
+    st.success(card['back'])
+    st.write("How well did you remember it?")
+    cols = st.columns(len(flashcards.GRADES))
+    for col, (label, quality) in zip(cols, flashcards.GRADES.items()):
+        col.button(label, key=f"grade_{label}", on_click=_grade, args=(quality,), use_container_width=True)
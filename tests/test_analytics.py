@@ -0,0 +1,88 @@
+"""Tests for Firestore-aggregation and SQL analytics backends"""
+import datetime
+
+import pytest
+
+from edugenie import analytics, fakes, topics
+
+NOW = datetime.datetime(2026, 3, 18, 12, 0)  # a Wednesday
+
+ATTEMPTS = [
+    # user, topic, level, total, correct, days ago
+    ('u1', 'Photosynthesis', 'Remember', 5, 5, 0),
+    ('u1', 'photosynthesis ', 'Apply', 5, 2, 8),
+    ('u1', 'Cells', 'Remember', 4, 1, 1),
+    ('u2', 'Cells', 'Apply', 10, 9, 15),
+]
+
+
+def _backends():
+    db = fakes.FakeFirestoreClient()
+    sql = analytics.SQLAnalytics()
+    batch = db.batch()
+    for user_id, topic, level, total, correct, days in ATTEMPTS:
+        timestamp = NOW - datetime.timedelta(days=days)
+        pct = correct / total * 100
+        db.collection('quiz_attempts').add({
+            'user_id': user_id, 'topic': topic, 'topic_key': topics.topic_key(topic),
+            'blooms_level': level, 'total_questions': total, 'correct_answers': correct,
+            'score_percentage': pct, 'timestamp': timestamp,
+        })
+        analytics.leaderboard_update(db, user_id, None, total, correct, batch)
+        sql.record_attempt(user_id, topic, level, 'Multiple Choice', total, correct, pct, timestamp)
+    batch.commit()
+    return analytics.FirestoreAnalytics(db), sql
+
+
+def test_backends_agree_on_rollups():
+    firestore_backend, sql_backend = _backends()
+    for backend in (firestore_backend, sql_backend):
+        overview = backend.overview('u1')
+        assert overview['attempts'] == 3 and overview['questions'] == 14 and overview['correct'] == 8
+
+        topics = {row['topic'].strip().lower(): row for row in backend.by_topic('u1')}
+        assert topics['photosynthesis']['attempts'] == 2
+        assert topics['photosynthesis']['accuracy'] == 70.0
+
+        levels = {row['blooms_level']: row['attempts'] for row in backend.by_blooms_level()}
+        assert levels == {'Remember': 2, 'Apply': 2}
+
+        trend = backend.weekly_trend(weeks=3, now=NOW)
+        assert [row['week_start'] for row in trend] == [datetime.date(2026, 3, 2), datetime.date(2026, 3, 9),
+                                                         datetime.date(2026, 3, 16)]
+        assert [row['attempts'] for row in trend] == [1, 1, 2]
+
+        leaders = backend.leaderboard(limit=2)
+        assert [row['user_id'] for row in leaders] == ['u2', 'u1']
+        assert leaders[0]['points'] == 9
+
+
+def test_cached_results_expire_with_clear():
+    firestore_backend, _ = _backends()
+    analytics.clear_cache()
+    first = analytics.cached(firestore_backend, 'overview', 'u2')
+    firestore_backend.db.collection('quiz_attempts').add({'user_id': 'u2', 'total_questions': 1,
+                                                         'correct_answers': 1, 'score_percentage': 100})
+    assert analytics.cached(firestore_backend, 'overview', 'u2') == first
+    analytics.clear_cache()
+    assert analytics.cached(firestore_backend, 'overview', 'u2')['attempts'] == 2
+
+
+def test_last_good_result_is_served_when_the_backend_fails():
+    class Flaky:
+        name = 'flaky'
+        fail = False
+
+        def overview(self, user_id=None):
+            if self.fail:
+                raise RuntimeError("deadline exceeded")
+            return {'attempts': 3}
+
+    backend = Flaky()
+    analytics.clear_cache()
+    assert analytics.cached(backend, 'overview', 'u1') == {'attempts': 3}
+    analytics.clear_cache()
+    backend.fail = True
+    assert analytics.cached(backend, 'overview', 'u1') == {'attempts': 3}
+    with pytest.raises(RuntimeError):
+        analytics.cached(backend, 'overview', 'someone-else')
@@ -0,0 +1,86 @@
+"""Tests for the stored-question bank"""
+import random
+
+from edugenie import bank, fakes
+
+
+def _store(db, topic, level, qtype, texts, user_id='u1'):
+    attempt = db.collection('quiz_attempts').document()
+    attempt.set({'topic': topic, 'blooms_level': level, 'question_type': qtype, 'user_id': user_id})
+    for idx, text in enumerate(texts, 1):
+        doc = {
+            'question_text': f"{idx}. {text}",
+            'options': ['True', 'False'],
+            'correct_answer': 'True',
+            'explanation': '',
+        }
+        doc.update(bank.index_fields(topic, level, qtype, doc['question_text'], user_id=user_id))
+        attempt.collection('questions').add(doc)
+
+
+def setup_function():
+    bank._banks.clear()
+    bank._seen.clear()
+
+
+def test_question_key_ignores_numbering_case_and_punctuation():
+    assert bank.question_key("1. Is the Sun a star?") == bank.question_key("Question 7: is the sun a star")
+    assert bank.question_key("Is the Sun a star?") != bank.question_key("Is the Moon a star?")
+    assert bank.strip_number("12) What is DNA?") == "What is DNA?"
+
+
+def test_draw_dedupes_and_skips_seen_questions():
+    db = fakes.FakeFirestoreClient()
+    _store(db, 'Astronomy', 'Remember', 'True/False', ["Is the Sun a star?", "Is Mars red?"], user_id='u1')
+    _store(db, ' astronomy', 'Remember', 'True/False', ["Is the sun a star", "Is Pluto a planet?"], user_id='u2')
+
+    assert len(bank.load(db, 'Astronomy', 'Remember', 'True/False')) == 3
+
+    drawn = bank.draw(db, 'Astronomy', 'Remember', 'True/False', 5, user_id='u1', rng=random.Random(0))
+    assert [q['question'] for q in drawn] == ["Is Pluto a planet?"]
+
+    bank.mark_seen('u3', 'Astronomy', [{'question': '1. Is Mars red?'}])
+    drawn = bank.draw(db, 'Astronomy', 'Remember', 'True/False', 5, user_id='u3')
+    assert len(drawn) == 2 and "Is Mars red?" not in [q['question'] for q in drawn]
+
+
+def test_add_extends_loaded_bank_and_renumber():
+    db = fakes.FakeFirestoreClient()
+    assert bank.load(db, 'Cells', 'Apply', 'True/False') == []
+    bank.add('Cells', 'Apply', 'True/False', [
+        {'question': '3. Do cells divide?', 'options': ['True', 'False'], 'answer': 'True', 'user_answer': 'True'},
+    ])
+    questions = bank.load(db, 'Cells', 'Apply', 'True/False')
+    assert questions[0]['question'] == 'Do cells divide?' and 'user_answer' not in questions[0]
+    assert bank.renumber(questions)[0]['question'] == '1. Do cells divide?'
+
+
+def test_backfill_indexes_legacy_questions():
+    db = fakes.FakeFirestoreClient()
+    attempt = db.collection('quiz_attempts').document()
+    attempt.set({'topic': 'Cells', 'blooms_level': 'Apply', 'user_id': 'u1'})
+    attempt.collection('questions').add({
+        'question_text': '1. Which organelle makes ATP?',
+        'options': ['A. Nucleus', 'B. Mitochondria', 'C. Ribosome', 'D. Golgi'],
+        'correct_answer': 'B',
+    })
+
+    assert bank.backfill(db) == 1
+    assert bank.backfill(db) == 0
+    assert len(bank.load(db, 'cells', 'Apply', 'Multiple Choice')) == 1
+
+
+def test_near_duplicate_spellings_load_their_own_questions_in_either_order():
+    db = fakes.FakeFirestoreClient()
+    _store(db, 'Photosynthesis', 'Remember', 'True/False', [f"Do plants need light {n}?" for n in range(5)])
+    for order in (['Photo-synthesis', 'Photosynthesis', 'Photosynthesys'],
+                  ['Photosynthesys', 'Photosynthesis', 'Photo-synthesis']):
+        setup_function()
+        sizes = {topic: len(bank.load(db, topic, 'Remember', 'True/False')) for topic in order}
+        assert sizes == {'Photo-synthesis': 5, 'Photosynthesis': 5, 'Photosynthesys': 0}
+
+        bank.mark_seen('u2', order[0], [{'question': "Do plants need light 0?"}])
+        seen = {topic: len(bank.seen_keys(db, 'u2', topic)) for topic in order}
+        assert seen == {'Photo-synthesis': order[0] != 'Photosynthesys',
+                        'Photosynthesis': order[0] != 'Photosynthesys',
+                        'Photosynthesys': order[0] == 'Photosynthesys'}
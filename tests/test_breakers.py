@@ -0,0 +1,77 @@
+"""Tests for the dependency circuit breakers"""
+import pytest
+
+from edugenie import breakers, metrics
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fail(breaker):
+    with pytest.raises(ValueError):
+        with breaker.guard():
+            raise ValueError("timeout")
+
+
+def state_gauge(name):
+    return metrics.gauges()[(breakers.STATE_METRIC, (('dependency', name),))]
+
+
+def test_opens_at_failure_rate_and_fails_fast():
+    breaker = breakers.CircuitBreaker('test-open', failure_rate=0.5, min_calls=4, open_seconds=10, clock=Clock())
+    with breaker.guard():
+        pass
+    fail(breaker)
+    fail(breaker)
+    assert breaker.state == breakers.CLOSED  # 2 of 3 failed, but below min_calls
+    fail(breaker)
+    assert breaker.state == breakers.OPEN
+    assert state_gauge('test-open') == 2
+
+    calls = []
+    with pytest.raises(breakers.CircuitOpenError, match="retrying in 10s"):
+        with breaker.guard():
+            calls.append(1)
+    assert calls == []
+
+
+def test_old_failures_leave_the_window():
+    clock = Clock()
+    breaker = breakers.CircuitBreaker('test-window', failure_rate=0.5, min_calls=2, window=30, clock=clock)
+    fail(breaker)
+    clock.now = 60
+    with breaker.guard():
+        pass
+    assert breaker.state == breakers.CLOSED
+
+
+def test_half_open_probe_closes_or_reopens():
+    clock = Clock()
+    breaker = breakers.CircuitBreaker('test-probe', min_calls=1, open_seconds=10, clock=clock)
+    fail(breaker)
+    clock.now = 10
+
+    # One probe at a time; a failed probe opens the breaker for another period
+    assert breaker.allow()
+    assert breaker.state == breakers.HALF_OPEN and state_gauge('test-probe') == 1
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == breakers.OPEN and breaker.retry_in() == 10
+
+    clock.now = 20
+    with breaker.guard():
+        pass
+    assert breaker.state == breakers.CLOSED and state_gauge('test-probe') == 0
+
+
+def test_other_breakers_errors_do_not_count():
+    breaker = breakers.CircuitBreaker('test-nested', min_calls=1)
+    with pytest.raises(breakers.CircuitOpenError):
+        with breaker.guard():
+            raise breakers.CircuitOpenError('gemini', 5)
+    assert breaker.state == breakers.CLOSED
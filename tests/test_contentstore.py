@@ -0,0 +1,51 @@
+"""Tests for the off-session content store"""
+import os
+
+from edugenie.contentstore import ContentStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_put_get_dedups_and_returns_fresh_copies(tmp_path):
+    store = ContentStore(str(tmp_path), memory_bytes=1 << 20)
+    key = store.put([{'question': 'Q1'}])
+    assert store.put([{'question': 'Q1'}]) == key
+    value = store.get(key)
+    value.append('changed')
+    assert store.get(key) == [{'question': 'Q1'}]
+    assert store.get('missing', []) == [] and store.get(None) is None
+
+
+def test_memory_is_bounded_and_evictions_spill_to_disk(tmp_path):
+    store = ContentStore(str(tmp_path), memory_bytes=2000, disk_bytes=1 << 20)
+    keys = [store.put({'n': n, 'text': os.urandom(400).hex()}) for n in range(20)]
+    stats = store.stats()
+    assert stats['memory_bytes'] <= 2000 and stats['disk_entries'] > 0
+    assert [store.get(key)['n'] for key in keys] == list(range(20))
+
+    # A fresh store over the same directory finds the spilled entries
+    assert ContentStore(str(tmp_path)).get(keys[0])['n'] == 0
+
+
+def test_reap_drops_idle_sessions_and_unreferenced_content(tmp_path):
+    clock = Clock()
+    store = ContentStore(str(tmp_path), memory_bytes=1 << 20, idle_seconds=100, clock=clock)
+    kept, dropped = store.put('kept'), store.put('dropped')
+    store.touch('active', [kept])
+    store.touch('idle', [dropped])
+
+    clock.now = 60
+    store.touch('active', [kept])
+    assert store.reap() == (0, 0)
+
+    clock.now = 150
+    store.touch('active', [kept])
+    assert store.reap() == (1, 1)
+    assert store.get(kept) == 'kept' and store.get(dropped) is None
+    assert store.stats()['sessions'] == 1
@@ -0,0 +1,38 @@
+"""Tests for sharded per-user counters"""
+from edugenie import counters, fakes
+
+
+def test_increments_spread_over_shards_and_sum_on_read():
+    db = fakes.FakeFirestoreClient()
+    for _ in range(40):
+        counters.increment(db, 'u1', counters.attempt_values(5, 3, 60.0), num_shards=4)
+
+    shards = [s for s in db.get_all(counters.shard_refs(db, 'u1', 4)) if s.exists]
+    assert len(shards) > 1
+    assert counters.read(db, 'u1', num_shards=4) == {'attempts': 40, 'questions': 200, 'correct': 120, 'score_sum': 2400.0}
+    assert counters.read(db, 'nobody', num_shards=4)['attempts'] == 0
+
+
+def test_increment_inside_batch_commits_with_it():
+    db = fakes.FakeFirestoreClient()
+    batch = db.batch()
+    counters.increment(db, 'u1', {'attempts': 1}, batch=batch)
+    assert counters.read(db, 'u1')['attempts'] == 0
+    batch.commit()
+    assert counters.read(db, 'u1')['attempts'] == 1
+
+
+def test_rebuild_from_attempts():
+    db = fakes.FakeFirestoreClient()
+    for user_id, correct in (('u1', 2), ('u1', 4), ('u2', 1)):
+        db.collection('quiz_attempts').add({'user_id': user_id, 'total_questions': 5,
+                                            'correct_answers': correct, 'score_percentage': correct * 20})
+    assert counters.rebuild(db, num_shards=3) == 2
+    assert counters.read(db, 'u1', num_shards=3) == {'attempts': 2, 'questions': 10, 'correct': 6, 'score_sum': 120}
+
+
+def test_benchmark_shows_hot_document_contention():
+    db = fakes.FakeFirestoreClient(document_write_interval=0.02)
+    results = counters.benchmark(db, shard_counts=(1, 8), writers=8, writes_per_writer=2)
+    assert results[1]['correct'] and results[8]['correct']
+    assert results[8]['writes_per_second'] > results[1]['writes_per_second']
@@ -0,0 +1,70 @@
+"""Tests for MinHash/LSH question de-duplication"""
+from edugenie import dedup, similarity
+
+
+def _q(text):
+    return {'question': text}
+
+
+def test_lsh_index_finds_similar_and_evicts_oldest():
+    index = similarity.LSHIndex(0.7, max_size=2, evict=True)
+    index.add('a', similarity.char_shingles('which gas do plants absorb during photosynthesis', 5))
+    found = index.query(similarity.char_shingles('which gases do plants absorb during photosynthesis', 5))
+    assert found[0] == 'a' and found[1] >= 0.7
+    assert index.query(similarity.char_shingles('what is the capital city of france', 5)) is None
+
+    index.add('b', {'xxxxx'})
+    index.add('c', {'yyyyy'})
+    assert 'a' not in index and len(index) == 2
+
+
+def test_find_duplicates_within_quiz_keeps_first():
+    questions = [
+        _q("1. Which gas do plants absorb during photosynthesis?"),
+        _q("2. What is the powerhouse of the cell?"),
+        _q("3. which gas do plants absorb during photosynthesis"),
+    ]
+    assert dedup.find_duplicates(questions) == [2]
+
+
+def test_same_stem_with_different_options_is_not_a_repeat():
+    stem = "Which of these is a noble gas?"
+    questions = [
+        {'question': stem, 'options': ['A. Neon', 'B. Nitrogen', 'C. Oxygen', 'D. Hydrogen'], 'answer': 'A'},
+        {'question': stem, 'options': ['A. Chlorine', 'B. Argon', 'C. Sodium', 'D. Carbon'], 'answer': 'B'},
+        {'question': stem, 'options': ['A. Nitrogen', 'B. Neon', 'C. Hydrogen', 'D. Oxygen'], 'answer': 'B'},
+        {'question': "Name the largest planet.", 'options': [], 'answer': 'Jupiter'},
+        {'question': "Name the largest planet.", 'options': [], 'answer': 'Saturn'},
+    ]
+    # Only the reshuffled copy of the first question repeats it
+    assert dedup.find_duplicates(questions) == [2]
+
+
+def test_replace_duplicates_retries_then_drops():
+    repeat = _q("Which gas do plants absorb during photosynthesis?")
+    calls = []
+
+    def regenerate(count, avoid):
+        calls.append(avoid)
+        return [repeat] * count
+
+    questions = dedup.replace_duplicates([repeat, _q("What is the powerhouse of the cell?"), repeat], regenerate,
+                                         rounds=2)
+    assert len(calls) == 2 and calls[0] == [repeat['question'], "What is the powerhouse of the cell?"]
+    assert len(questions) == 2
+
+    fresh = iter([_q("Name the largest planet.")])
+    questions = dedup.replace_duplicates([repeat, repeat], lambda count, avoid: [next(fresh)])
+    assert [q['question'] for q in questions] == [repeat['question'], "Name the largest planet."]
+
+
+def test_find_duplicates_against_history():
+    dedup._histories.pop('student')
+    dedup.remember('student', [_q("1. What is the powerhouse of the cell?")])
+    questions = [_q("1. What is the powerhouse of the cell ?"), _q("2. Name the largest planet.")]
+    assert dedup.find_duplicates(questions, user_key='student') == [0]
+    assert dedup.find_duplicates(questions, user_key='someone-else') == []
+
+
+def test_benchmark_runs():
+    assert dedup.benchmark(num_questions=5, history_size=20, rounds=3) > 0
@@ -0,0 +1,105 @@
+"""Tests for the local Gemini and Firestore stand-ins"""
+import pytest
+
+from edugenie import fakes
+
+
+QUIZ_PROMPT = """
+Generate exactly 3 quiz questions based on these specifications:
+- Topic: Photosynthesis
+- Bloom's Taxonomy Level: Remember
+- Question Type: Multiple Choice
+"""
+
+
+def test_fake_model_is_deterministic():
+    a = fakes.FakeGenerativeModel(seed=1).generate_content(QUIZ_PROMPT).text
+    b = fakes.FakeGenerativeModel(seed=1).generate_content(QUIZ_PROMPT).text
+    assert a == b
+    assert a.count('Answer:') == 3
+    assert a.startswith('1. ')
+    assert '\nD. ' in a
+
+
+def test_fake_model_usage_and_finish_reason():
+    response = fakes.FakeGenerativeModel().generate_content(QUIZ_PROMPT)
+    assert response.candidates[0].finish_reason == fakes.STOP
+    assert response.usage_metadata.total_token_count > response.usage_metadata.prompt_token_count
+
+
+def test_fake_model_recordings_and_streaming():
+    recordings = {fakes.prompt_key('hello'): 'recorded answer ' * 50}
+    model = fakes.FakeGenerativeModel(recordings=recordings, stream_chunk_chars=64)
+    stream = model.generate_content('hello', stream=True)
+    chunks = [chunk.text for chunk in stream]
+    assert len(chunks) > 1
+    assert ''.join(chunks) == stream.text == 'recorded answer ' * 50
+
+
+def test_fake_model_error_injection():
+    model = fakes.FakeGenerativeModel(error_rate=1.0)
+    with pytest.raises(fakes.FakeServiceError):
+        model.generate_content('anything')
+
+
+def test_fake_firestore_query():
+    db = fakes.FakeFirestoreClient()
+    for idx, user in enumerate(['u1', 'u2', 'u1', 'u1']):
+        db.collection('quiz_attempts').add({'user_id': user, 'score': idx})
+
+    query = db.collection('quiz_attempts').where('user_id', '==', 'u1').order_by('score', direction='DESCENDING').limit(2)
+    assert [d.to_dict()['score'] for d in query.stream()] == [3, 2]
+
+    first = list(query.stream())[0]
+    rest = db.collection('quiz_attempts').where('user_id', '==', 'u1').order_by('score', direction='DESCENDING').start_after(first)
+    assert [d.to_dict()['score'] for d in rest.stream()] == [2, 0]
+
+
+def test_fake_firestore_subcollections_batch_and_get_all():
+    db = fakes.FakeFirestoreClient()
+    ref = db.collection('quiz_attempts').document('a1')
+    ref.set({'topic': 'x'})
+    ref.collection('questions').add({'n': 1})
+
+    # Subcollection documents do not leak into the parent collection
+    assert len(db.collection('quiz_attempts').get()) == 1
+    assert len(ref.collection('questions').get()) == 1
+
+    db.collection('quiz_attempts').document('a2').collection('questions').add({'n': 2})
+    group = db.collection_group('questions').where('n', '>=', 1).get()
+    assert sorted(d.to_dict()['n'] for d in group) == [1, 2]
+
+    results = db.collection_group('questions').count(alias='c').sum('n', alias='s').avg('n', alias='a').get()
+    assert {r.alias: r.value for r in results[0]} == {'c': 2, 's': 3, 'a': 1.5}
+    assert db.collection('empty').avg('n', alias='a').get()[0][0].value is None
+
+    batch = db.batch()
+    batch.set(db.collection('c').document('d1'), {'v': 1})
+    batch.set(db.collection('c').document('d2'), {'v': 2})
+    batch.commit()
+
+    snaps = list(db.get_all([db.collection('c').document('d1'), db.collection('c').document('missing')]))
+    assert snaps[0].to_dict() == {'v': 1}
+    assert not snaps[1].exists
+
+
+def test_fake_firestore_merge_is_nested_but_update_replaces_maps():
+    ref = fakes.FakeFirestoreClient().collection('mastery').document('u1')
+    ref.set({'skills': {'a|Apply': [0.5, 1], 'b|Apply': [0.2, 1]}, 'topics': {'a': 'A'}})
+    ref.set({'skills': {'a|Apply': [0.7, 2]}, 'counts': {'n': fakes.Increment(2)}}, merge=True)
+    ref.set({'counts': {'n': fakes.Increment(3)}}, merge=True)
+    assert ref.get().to_dict() == {'skills': {'a|Apply': [0.7, 2], 'b|Apply': [0.2, 1]},
+                                   'topics': {'a': 'A'}, 'counts': {'n': 5}}
+
+    ref.update({'skills': {'c|Apply': [0.1, 1]}})
+    assert ref.get().to_dict()['skills'] == {'c|Apply': [0.1, 1]}
+
+
+def test_fake_firestore_array_operators_use_firestore_spelling():
+    db = fakes.FakeFirestoreClient()
+    db.collection('cards').add({'tags': ['bio', 'cells']})
+    db.collection('cards').add({'tags': ['chem']})
+    assert len(db.collection('cards').where('tags', 'array-contains', 'bio').get()) == 1
+    assert len(db.collection('cards').where('tags', 'array-contains-any', ['chem', 'bio']).get()) == 2
+    with pytest.raises(fakes.FakeServiceError):
+        db.collection('cards').where('tags', 'array_contains', 'bio').get()
@@ -0,0 +1,52 @@
+"""Tests for flashcard parsing and spaced repetition"""
+import datetime
+
+from edugenie import flashcards
+from edugenie.fakes import FakeFirestoreClient
+
+NOW = datetime.datetime(2024, 3, 1, 9, 0)
+
+
+def test_parse_flashcards():
+    text = "1. Q: What is ATP?\nA: The energy currency\nof the cell.\n\n2. **Q:** Where is glycolysis?\n**A:** Cytoplasm.\n3. Q: Unanswered"
+    assert flashcards.parse_flashcards(text) == [
+        {'front': 'What is ATP?', 'back': 'The energy currency of the cell.'},
+        {'front': 'Where is glycolysis?', 'back': 'Cytoplasm.'},
+    ]
+
+
+def test_sm2_intervals_grow_and_lapse_resets():
+    card = flashcards.new_card({'front': 'f', 'back': 'b'}, 'Cells', NOW)
+    intervals = []
+    for _ in range(4):
+        card.update(flashcards.schedule(card, 4, NOW))
+        intervals.append(card['interval'])
+    assert intervals[:2] == [1.0, 6.0] and intervals[3] > intervals[2] > 6.0
+
+    card.update(flashcards.schedule(card, 1, NOW))
+    assert card['repetitions'] == 0 and card['lapses'] == 1
+    assert card['due'] == NOW + datetime.timedelta(minutes=flashcards.RELEARN_MINUTES)
+    assert card['ease'] >= flashcards.MIN_EASE
+
+
+def test_save_keeps_schedule_and_session_pages_through_due_cards():
+    db = FakeFirestoreClient()
+    cards = [{'front': f"Question {n}?", 'back': f"Answer {n}"} for n in range(25)]
+    assert flashcards.save_cards(db, 'u1', 'Cells', cards, now=NOW) == (25, 0)
+
+    session = flashcards.ReviewSession('u1', page_size=10, now=NOW)
+    later = NOW + datetime.timedelta(minutes=1)
+    seen = []
+    while True:
+        current = session.current(db, now=NOW)
+        if current is None:
+            break
+        seen.append(current[0])
+        session.grade(db, 4 if len(seen) > 1 else 1, now=later)
+    assert len(seen) == len(set(seen)) == 25
+    assert flashcards.due_count(db, 'u1', NOW + datetime.timedelta(hours=1)) == 1
+
+    # Saving the deck again updates the text but not the schedule
+    assert flashcards.save_cards(db, 'u1', 'Cells', cards[:3], now=NOW) == (0, 3)
+    assert flashcards.due_count(db, 'u1', NOW) == 0
+    assert flashcards.deck_size(db, 'u1') == 25
@@ -0,0 +1,42 @@
+"""Tests for truncation detection and continuation"""
+from edugenie import fakes, generation
+
+PROMPT = """Generate exactly 6 quiz questions based on these specifications:
+- Topic: Mars
+- Question Type: Multiple Choice
+"""
+
+
+def test_stitch_removes_overlap():
+    assert generation.stitch("The quick brown fox jumps", "brown fox jumps over the dog") == \
+        "The quick brown fox jumps over the dog"
+
+
+def test_stitch_replaces_restarted_line():
+    text = "1. First question?\n2. Which planet is the lar"
+    addition = "2. Which planet is the largest?\nA. Jupiter"
+    assert generation.stitch(text, addition) == "1. First question?\n2. Which planet is the largest?\nA. Jupiter"
+
+
+def test_stitch_plain_append():
+    assert generation.stitch("abc", "def") == "abcdef"
+
+
+def test_continues_until_complete():
+    full = fakes.FakeGenerativeModel().generate_content(PROMPT).text
+    model = fakes.FakeGenerativeModel(max_output_chars=400)
+
+    text, rounds = generation.generate_with_continuation(model, PROMPT, max_rounds=10)
+
+    assert text == full
+    assert rounds[-1]['finish_reason'] == 'STOP'
+    assert all(r['finish_reason'] == 'MAX_TOKENS' for r in rounds[:-1])
+    assert [r['round'] for r in rounds] == list(range(len(rounds)))
+    assert all(r['total_tokens'] > 0 for r in rounds)
+
+
+def test_continuation_rounds_are_capped():
+    model = fakes.FakeGenerativeModel(max_output_chars=100)
+    text, rounds = generation.generate_with_continuation(model, PROMPT, max_rounds=2)
+    assert len(rounds) == 3
+    assert generation.is_truncated(model.generate_content(PROMPT))
@@ -0,0 +1,53 @@
+"""Tests for the 2PL fit and adaptive quizzes"""
+import numpy as np
+
+from edugenie import irt
+from edugenie.bank import question_key
+from edugenie.fakes import FakeFirestoreClient
+
+
+def test_fit_recovers_synthetic_parameters():
+    seconds, iterations, corr_b, corr_a, corr_theta = irt.benchmark(100_000, 2_000, 200, seed=1)
+    assert corr_b > 0.95
+    assert corr_a > 0.7
+    assert corr_theta > 0.9
+
+
+def test_run_stores_items_and_abilities():
+    db = FakeFirestoreClient()
+    rng = np.random.default_rng(0)
+    for user in range(30):
+        attempt = db.collection('quiz_attempts').document()
+        for item, difficulty in enumerate([-2.0, 0.0, 2.0]):
+            correct = bool(rng.random() < irt.probability(rng.normal(), 1.0, difficulty))
+            attempt.collection('questions').document().set({
+                'user_id': f"u{user}", 'question_key': f"q{item}", 'is_correct': correct,
+                'topic_key': 'cell', 'blooms_level': 'Understand', 'question_type': 'Multiple Choice'})
+
+    stats = irt.run(db, min_responses=5)
+    assert stats['responses'] == 90 and stats['users'] == 30 and stats['stored_items'] == 3
+    params = irt.item_params(db, 'cell')
+    assert params['q0'][1] < params['q1'][1] < params['q2'][1]
+    assert db.collection(irt.ABILITIES_COLLECTION).document('u0').get().exists
+
+
+def test_adaptive_quiz_targets_ability_and_stops_early():
+    pool = [{'question': f"{n}. Question {n}", 'options': [], 'answer': 'x', 'explanation': ''} for n in range(40)]
+    difficulties = [-3.0 + n * 0.15 for n in range(40)]
+    params = {question_key(q['question']): (2.0, b) for q, b in zip(pool, difficulties)}
+    quiz = irt.AdaptiveQuiz(pool, params, max_questions=30, target_se=0.5)
+
+    true_theta = 1.0
+    while not quiz.done:
+        idx = pool.index(quiz.next_question())
+        quiz.record(difficulties[idx] < true_theta)
+    assert len(quiz.asked) < 30
+    assert abs(quiz.theta - true_theta) < 0.6
+    assert quiz.se <= 0.5
+
+
+def test_unfitted_questions_use_level_prior():
+    pool = [{'question': 'Easy one', 'blooms_level': 'Remember'},
+            {'question': 'Hard one', 'blooms_level': 'Create'}]
+    quiz = irt.AdaptiveQuiz(pool, {}, max_questions=2, prior_mean=1.5)
+    assert quiz.next_question()['question'] == 'Hard one'
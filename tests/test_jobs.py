@@ -0,0 +1,46 @@
+"""Tests for the background job executor"""
+import threading
+
+from edugenie import jobs
+
+
+def test_job_runs_and_reports_progress():
+    release = threading.Event()
+
+    def work(x):
+        jobs.report_progress({'step': 1})
+        release.wait(5)
+        return x * 2
+
+    job_id = jobs.submit(work, 21, kind='test')
+    job = jobs.get(job_id)
+    assert job.kind == 'test'
+    release.set()
+
+    job = jobs.wait(job_id, timeout=5)
+    assert job.status == jobs.DONE
+    assert job.result == 42
+    assert job.progress == {'step': 1}
+
+    jobs.discard(job_id)
+    assert jobs.get(job_id) is None
+
+
+def test_failed_job_keeps_error():
+    def boom():
+        raise RuntimeError("no quota")
+
+    job = jobs.wait(jobs.submit(boom), timeout=5)
+    assert job.status == jobs.FAILED
+    assert job.error == "no quota"
+
+
+def test_store_evicts_oldest_finished(monkeypatch):
+    monkeypatch.setattr(jobs, 'STORE_SIZE', 3)
+    ids = [jobs.submit(lambda: None) for _ in range(3)]
+    for job_id in ids:
+        jobs.wait(job_id, timeout=5)
+
+    newest = jobs.submit(lambda: None)
+    assert jobs.get(ids[0]) is None
+    assert jobs.get(newest) is not None
@@ -0,0 +1,76 @@
+"""Tests for knowledge-tracing mastery"""
+import datetime
+
+import numpy as np
+
+import pytest
+
+from edugenie import breakers, mastery
+from edugenie.fakes import FakeFirestoreClient
+
+
+def test_vectorized_trace_matches_sequential_updates():
+    rng = np.random.default_rng(0)
+    sequences = np.sort(rng.integers(0, 50, 2000))
+    correct = rng.random(2000) < 0.5
+    p, counts = mastery.trace(sequences, correct, 0.25, 50)
+
+    for seq in range(50):
+        expected = mastery.P_INIT
+        for answer in correct[sequences == seq]:
+            expected = mastery.step(expected, answer, 0.25)
+        assert abs(p[seq] - expected) < 1e-12
+    assert counts.sum() == 2000
+
+
+def test_update_then_recompute_agree():
+    db = FakeFirestoreClient()
+    answers = [True, True, False, True, True, True]
+    attempt = db.collection('quiz_attempts').document()
+    start = datetime.datetime(2024, 1, 1)
+    for idx, correct in enumerate(answers):
+        attempt.collection('questions').document().set({
+            'user_id': 'u1', 'topic': 'Photosynthesis', 'topic_key': 'photosynthesis', 'blooms_level': 'Apply',
+            'question_type': 'Multiple Choice', 'is_correct': correct, 'question_number': idx + 1,
+            'created_at': start + datetime.timedelta(seconds=idx)})
+
+    batch = db.batch()
+    state = mastery.update(db, 'u2', 'Photosynthesis', 'Apply', 'Multiple Choice',
+                           [{'is_correct': c} for c in answers], batch)
+    batch.commit()
+    mastery.remember('u2', state)
+
+    stats = mastery.recompute(db)
+    assert stats == dict(stats, responses=6, users=1, skills=1)
+    recomputed = mastery.load(db, 'u1')
+    key = mastery.skill_key('photosynthesis', 'Apply')
+    assert recomputed['skills'][key][1] == 6
+    assert abs(recomputed['skills'][key][0] - mastery.load(db, 'u2')['skills'][key][0]) < 1e-3
+
+
+def test_recommend_weakest_then_next_level():
+    state = {'skills': {'cells|Remember': [0.99, 10], 'cells|Understand': [0.4, 3]}, 'topics': {'cells': 'Cells'}}
+    assert mastery.recommend(state)[:2] == ('Cells', 'Understand')
+    state['skills']['cells|Understand'] = [0.97, 8]
+    assert mastery.recommend(state)[:2] == ('Cells', 'Apply')
+    assert mastery.recommend({'skills': {}, 'topics': {}}) is None
+
+
+def test_update_inside_a_half_open_guard_is_the_probe(monkeypatch):
+    now = [0.0]
+    breaker = breakers.CircuitBreaker('firestore', min_calls=1, open_seconds=10, clock=lambda: now[0])
+    monkeypatch.setitem(breakers._breakers, 'firestore', breaker)
+    with pytest.raises(ValueError):
+        with breakers.guard('firestore'):
+            raise ValueError("timeout")
+    now[0] = 11
+
+    # As in save_quiz_attempt: one guard around the batch, mastery state not cached yet
+    db = FakeFirestoreClient()
+    with breakers.guard('firestore'):
+        batch = db.batch()
+        state = mastery.update(db, 'half-open-user', 'Photosynthesis', 'Apply', 'Multiple Choice',
+                               [{'is_correct': True}], batch)
+        batch.commit()
+    assert breaker.state == breakers.CLOSED
+    assert state['skills']['photosynthesis|Apply'][1] == 1
@@ -0,0 +1,48 @@
+"""Tests for the in-process latency metrics"""
+from edugenie import metrics
+
+
+def setup_function():
+    metrics.reset()
+
+
+def test_span_records_histogram():
+    with metrics.span('parse_quiz', page='quiz', question_type='True/False'):
+        pass
+    hists, _ = metrics.snapshot()
+    key = (metrics.PHASE_METRIC, (('page', 'quiz'), ('phase', 'parse_quiz'), ('question_type', 'True/False')))
+    assert hists[key].count == 1
+
+
+def test_none_labels_are_dropped():
+    metrics.observe('x_seconds', 0.2, page='quiz', model=None)
+    hists, _ = metrics.snapshot()
+    assert ('x_seconds', (('page', 'quiz'),)) in hists
+
+
+def test_render_prometheus():
+    metrics.observe('x_seconds', 0.2, page='quiz')
+    metrics.observe('x_seconds', 3.0, page='quiz')
+    metrics.inc('x_total', page='quiz')
+    text = metrics.render_prometheus()
+    assert '# TYPE x_seconds histogram' in text
+    assert 'x_seconds_bucket{page="quiz",le="0.25"} 1' in text
+    assert 'x_seconds_bucket{page="quiz",le="+Inf"} 2' in text
+    assert 'x_seconds_count{page="quiz"} 2' in text
+    assert 'x_total{page="quiz"} 1' in text
+
+
+def test_gauges_keep_the_latest_value():
+    metrics.set_gauge('x_state', 2, dependency='gemini')
+    metrics.set_gauge('x_state', 0, dependency='gemini')
+    text = metrics.render_prometheus()
+    assert '# TYPE x_state gauge' in text
+    assert 'x_state{dependency="gemini"} 0' in text
+
+
+def test_quantile():
+    hist = metrics.Histogram(buckets=(1, 2, 3))
+    for value in (0.5, 1.5, 2.5, 2.5):
+        hist.observe(value)
+    assert hist.quantile(0.5) == 2
+    assert hist.quantile(0.99) == 3
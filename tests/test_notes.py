@@ -0,0 +1,69 @@
+"""Tests for outline-then-parallel study notes"""
+from edugenie import cache, fakes, notes
+
+
+def make_generate():
+    model = fakes.FakeGenerativeModel()
+    prompts = []
+
+    def generate(prompt):
+        prompts.append(prompt)
+        return model.generate_content(prompt).text, None
+
+    return generate, prompts
+
+
+def setup_function():
+    notes._outline_cache.clear()
+    notes._section_cache.clear()
+
+
+def test_parse_outline():
+    text = "Here is the outline:\n1. Light reactions\n2) **Calvin cycle**\n- Factors"
+    assert notes.parse_outline(text) == ['Light reactions', 'Calvin cycle', 'Factors']
+
+
+def test_sections_assembled_in_order():
+    generate, prompts = make_generate()
+    seen = []
+    text, err = notes.generate_sectioned_notes(
+        generate, 'Cells', 'Undergraduate', 4, True,
+        on_section=lambda idx, title, body, cached: seen.append(idx)
+    )
+    assert err is None
+    assert len(prompts) == 5
+    assert sorted(seen) == [0, 1, 2, 3]
+    assert [line.split('.')[0] for line in text.split('\n\n')] == ['1', '2', '3', '4']
+
+
+def test_changing_item_count_only_generates_new_sections():
+    generate, prompts = make_generate()
+    notes.generate_sectioned_notes(generate, 'Cells', 'Undergraduate', 4, True)
+
+    prompts.clear()
+    notes.generate_sectioned_notes(generate, 'Cells', 'Undergraduate', 6, True)
+    # one outline extension plus the two new sections
+    assert len(prompts) == 3
+    assert 'Continue this outline with exactly 2 more' in prompts[0]
+
+    prompts.clear()
+    notes.generate_sectioned_notes(generate, 'cells ', 'Undergraduate', 3, True)
+    assert prompts == []
+
+
+def test_failed_sections_are_not_cached():
+    calls = {'n': 0}
+    model = fakes.FakeGenerativeModel()
+
+    def flaky(prompt):
+        calls['n'] += 1
+        if 'Section title' in prompt and 'section 2 of' in prompt and calls['n'] < 5:
+            return None, 'boom'
+        return model.generate_content(prompt).text, None
+
+    text, err = notes.generate_sectioned_notes(flaky, 'Atoms', 'High School', 3, True, parallelism=1)
+    assert text is None and 'Sections 2 failed' in err
+
+    text, err = notes.generate_sectioned_notes(flaky, 'Atoms', 'High School', 3, True, parallelism=1)
+    assert err is None
+    assert cache.get_cache('notes_sections') is notes._section_cache
@@ -0,0 +1,57 @@
+"""Tests for per-user quiz prefetching"""
+from edugenie import jobs, metrics, prefetch
+
+
+def _count(outcome, reason=None):
+    labels = (('outcome', outcome),) + ((('reason', reason),) if reason else ())
+    _, counters = metrics.snapshot()
+    return counters.get((prefetch.PREFETCH_METRIC, tuple(sorted(labels))), 0)
+
+
+def test_claim_returns_prefetched_job():
+    job_id = prefetch.start('user-a', {'topic': 'Cells'}, lambda: 'quiz')
+    assert prefetch.peek('user-a').job_id == job_id
+
+    slot = prefetch.claim('user-a')
+    assert slot.job_id == job_id
+    assert jobs.wait(slot.job_id, timeout=5).result == 'quiz'
+    assert prefetch.claim('user-a') is None
+
+
+def test_same_params_reuse_slot_and_new_params_replace_it():
+    first = prefetch.start('user-b', {'topic': 'Cells'}, lambda: 1)
+    assert prefetch.start('user-b', {'topic': 'Cells'}, lambda: 2) == first
+
+    replaced = _count('discarded', 'replaced')
+    second = prefetch.start('user-b', {'topic': 'Atoms'}, lambda: 3)
+    assert second != first
+    assert jobs.get(first) is None
+    assert _count('discarded', 'replaced') == replaced + 1
+    prefetch.discard('user-b')
+
+
+def test_discard_and_failed_jobs_are_counted():
+    declined = _count('discarded', 'declined')
+    prefetch.start('user-c', {'topic': 'Cells'}, lambda: 1)
+    prefetch.discard('user-c', reason='declined')
+    assert prefetch.peek('user-c') is None
+    assert _count('discarded', 'declined') == declined + 1
+
+    def boom():
+        raise RuntimeError("quota")
+
+    failed = _count('discarded', 'failed')
+    job_id = prefetch.start('user-c', {'topic': 'Atoms'}, boom)
+    jobs.wait(job_id, timeout=5)
+    assert prefetch.claim('user-c') is None
+    assert _count('discarded', 'failed') == failed + 1
+
+
+def test_slots_are_bounded(monkeypatch):
+    monkeypatch.setattr(prefetch, 'MAX_SLOTS', 2)
+    for user in ('u1', 'u2', 'u3'):
+        prefetch.start(user, {'topic': user}, lambda: None)
+    assert prefetch.peek('u1') is None
+    assert prefetch.peek('u3') is not None
+    prefetch.discard('u2')
+    prefetch.discard('u3')
@@ -0,0 +1,35 @@
+"""Tests for the prompt templates"""
+from edugenie import fakes, prompts
+from edugenie.quizzes import build_quiz_prompt, parse_quiz
+
+
+def test_templates_send_no_wasted_whitespace():
+    for name, prompt in prompts.samples().items():
+        lines = prompt.splitlines()
+        assert all(line == line.rstrip() and not line.startswith(' ') for line in lines), name
+        assert '\n\n\n' not in prompt, name
+
+
+def test_quiz_examples_follow_the_question_type():
+    true_false = build_quiz_prompt('Cells', 'Apply', 5, 'True/False')
+    assert 'A.' not in true_false and 'Answer: True' in true_false
+    assert 'D. Runoff' in build_quiz_prompt('Cells', 'Apply', 5, 'Multiple Choice')
+    for question_type, example in prompts.QUIZ_EXAMPLES.items():
+        assert len(parse_quiz(example, question_type)) == 1
+    assert 'existing questions' not in true_false
+    assert '- What is ATP?' in build_quiz_prompt('Cells', 'Apply', 5, 'True/False', avoid=['3. What is ATP?'])
+
+
+def test_prompt_sizes_do_not_regress():
+    assert prompts.check_sizes(prompts.sizes(), prompts.load_baseline()) == {}
+    assert set(prompts.sizes()) == set(prompts.load_baseline())
+
+
+def test_count_tokens_uses_the_model_when_given():
+    class Model:
+        def count_tokens(self, contents):
+            return fakes.FakeTokenCount(7)
+
+    prompt = prompts.samples()['section']
+    assert prompts.count_tokens(prompt, Model()) == 7
+    assert prompts.count_tokens(prompt) == prompts.estimate_tokens(prompt)
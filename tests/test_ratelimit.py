@@ -0,0 +1,27 @@
+"""Tests for the token-bucket rate limiter"""
+from edugenie import ratelimit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_burst_then_steady_rate():
+    clock = Clock()
+    limiter = ratelimit.RateLimiter('test', per_minute=60, burst=2, clock=clock, sleep=clock.sleep)
+    waits = [limiter.acquire() for _ in range(5)]
+    assert waits[:2] == [0.0, 0.0]
+    assert all(abs(wait - 1.0) < 1e-9 for wait in waits[2:])
+    assert abs(clock.now - 3.0) < 1e-9
+
+
+def test_zero_rate_is_unlimited():
+    limiter = ratelimit.RateLimiter('test', per_minute=0)
+    assert all(limiter.acquire() == 0.0 for _ in range(100))
@@ -0,0 +1,78 @@
+"""Tests for state shared between replicas"""
+import threading
+import time
+
+import pytest
+
+from edugenie import cache, sharedstate
+
+
+@pytest.fixture
+def backend():
+    backend = sharedstate.MemoryBackend()
+    sharedstate.set_backend(backend)
+    yield backend
+    sharedstate.set_backend(None)
+
+
+def test_shared_cache_warms_other_replicas_in_one_round_trip(backend):
+    writer = cache.LRUCache(shared_name='notes_test')
+    for n in range(5):
+        writer.set(f"k{n}", f"body {n}")
+
+    reader = cache.LRUCache(shared_name='notes_test')
+    reader.set('k0', 'local')
+    before = backend.round_trips
+    found = reader.get_many([f"k{n}" for n in range(7)])
+    assert backend.round_trips == before + 1
+    assert found == {'k0': 'local', 'k1': 'body 1', 'k2': 'body 2', 'k3': 'body 3', 'k4': 'body 4'}
+    # Fetched entries are now local
+    reader.get_many(['k1', 'k2'])
+    assert backend.round_trips == before + 1
+
+
+def test_single_flight_computes_once_across_callers(backend):
+    results, calls = {}, []
+    store = {}
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        store['value'] = 'generated'
+        return 'generated'
+
+    def worker(n):
+        results[n] = sharedstate.single_flight('section', lambda: store.get('value'), compute, poll=0.01)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1 and set(results.values()) == {'generated'}
+    assert backend.acquire('edugenie:lock:section', 'other', 1)
+
+
+def test_sync_restores_then_writes_only_changes(backend):
+    first, second = {}, {}
+    assert sharedstate.sync(first, 'progress:u1', {'current_question': 2}) is None
+    before = backend.round_trips
+    assert sharedstate.sync(first, 'progress:u1', {'current_question': 2}) is None
+    assert backend.round_trips == before
+
+    assert sharedstate.sync(second, 'progress:u1', {'current_question': 0}) == {'current_question': 2}
+    sharedstate.sync(second, 'progress:u1', {'current_question': 3})
+    assert sharedstate.get_many(['progress:u1']) == {'progress:u1': {'current_question': 3}}
+
+
+def test_memory_backend_expires_entries():
+    now = [0.0]
+    backend = sharedstate.MemoryBackend(clock=lambda: now[0])
+    backend.set_many({'a': b'1', 'b': b'2'}, ttl=10)
+    assert backend.acquire('lock', 't1', 5) and not backend.acquire('lock', 't2', 5)
+    now[0] = 6
+    assert backend.acquire('lock', 't2', 5)
+    backend.release('lock', 't1')
+    assert backend.get_many(['a', 'lock']) == [b'1', 't2']
+    now[0] = 11
+    assert backend.get_many(['a', 'b']) == [None, None]
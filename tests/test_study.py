@@ -0,0 +1,21 @@
+"""Tests for study material stats and section index"""
+from edugenie.study import content_stats, section_index, section_text
+
+
+def test_sections_cover_text_with_byte_offsets():
+    text = "Overview of cells é\n\n1. Structure\nParts:\n1. membrane\n2. Energy\nATP é\n3. **Division**\nMitosis"
+    sections = section_index(text)
+    assert [s['title'] for s in sections] == ['Introduction', '1. Structure', '2. Energy', '3. Division']
+    assert ''.join(section_text(text, s) for s in sections) == text
+    assert sections[-1]['end'] == len(text.encode('utf-8'))
+
+
+def test_markdown_headings_take_precedence():
+    text = "# Cells\n1. one\n2. two\n## Energy\nATP"
+    assert [s['title'] for s in section_index(text)] == ['Cells', 'Energy']
+
+
+def test_content_stats():
+    stats = content_stats("word " * 450)
+    assert stats['word_count'] == 450 and stats['estimated_read_time_minutes'] == 2
+    assert stats['sections'] == []
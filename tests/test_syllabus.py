@@ -0,0 +1,70 @@
+"""Tests for batch syllabus generation"""
+import json
+
+import pytest
+
+from edugenie import bank, fakes, syllabus
+
+SYLLABUS = {
+    'name': 'Biology',
+    'audience': 'High School',
+    'topics': ['Photosynthesis', 'Cell Division'],
+    'blooms_levels': ['Remember', 'Apply'],
+    'question_types': ['Multiple Choice', 'True/False'],
+    'num_questions': 3,
+    'goals': ['Summary'],
+    'num_items': 3,
+}
+
+
+@pytest.fixture
+def plan(tmp_path, monkeypatch):
+    monkeypatch.setenv('EDUGENIE_OFFLINE', '1')
+    path = tmp_path / 'biology.json'
+    path.write_text(json.dumps(SYLLABUS))
+    return syllabus.load(str(path)), str(tmp_path / 'biology.progress.jsonl')
+
+
+def test_expand_covers_the_grid_with_stable_ids(plan):
+    course, _ = plan
+    items = syllabus.expand(course)
+    assert len(items) == 2 * 2 * 2 + 2
+    assert len({item.id for item in items}) == len(items)
+    assert [item.id for item in syllabus.expand(course)] == [item.id for item in items]
+
+
+def test_load_rejects_unknown_levels(tmp_path):
+    path = tmp_path / 'bad.json'
+    path.write_text(json.dumps(dict(SYLLABUS, blooms_levels=['Memorize'])))
+    with pytest.raises(ValueError, match='Memorize'):
+        syllabus.load(str(path))
+
+
+def test_run_stores_items_in_batches_and_resumes(plan):
+    course, progress = plan
+    db = fakes.FakeFirestoreClient()
+    stats = syllabus.run(course, db, syllabus.Checkpoint(progress), concurrency=4, batch_size=3, log=lambda _: None)
+    assert stats['stored'] == 10 and stats['failed'] == 0
+
+    # Quiz questions are visible to the question bank
+    assert len(bank.load(db, 'photosynthesis', 'Apply', 'True/False')) == 3
+    notes = db.collection(syllabus.NOTES_COLLECTION).stream()
+    assert sorted(doc.to_dict()['topic'] for doc in notes) == ['Cell Division', 'Photosynthesis']
+
+    again = syllabus.run(course, db, syllabus.Checkpoint(progress), log=lambda _: None)
+    assert again['skipped'] == 10 and again['stored'] == 0
+
+
+def test_failed_commit_is_not_checkpointed(plan, monkeypatch):
+    course, progress = plan
+    db = fakes.FakeFirestoreClient()
+    checkpoint = syllabus.Checkpoint(progress)
+    writer = syllabus.BatchWriter(db, checkpoint, batch_size=1)
+
+    def broken_batch():
+        raise RuntimeError("unavailable")
+
+    monkeypatch.setattr(db, 'batch', broken_batch)
+    assert writer.add('quiz-1', []) == []
+    assert 'quiz-1' in writer.failed
+    assert syllabus.Checkpoint(progress).done == set()
@@ -0,0 +1,61 @@
+"""Tests for topic canonicalization and near-duplicate matching"""
+from edugenie import topics
+
+
+def test_canonicalize_merges_simple_variants():
+    variants = ["Photosynthesis", "photosynthesis ", "What is photosynthesis?", "PHOTOSYNTHESIS!"]
+    assert {topics.canonicalize(v) for v in variants} == {"photosynthesis"}
+    assert topics.canonicalize("The French Revolutions") == "french revolution"
+    assert topics.canonicalize("Café culture") == "cafe culture"
+    # Topics made only of stop words are kept rather than emptied
+    assert topics.canonicalize("The Who") == "the who"
+
+
+def test_topic_key_is_deterministic_and_ignores_word_breaks():
+    assert {topics.topic_key(v) for v in ["Photosynthesis", "Photo-synthesis", "What is photo synthesis?"]} == {
+        "photosynthesis"}
+    assert topics.topic_key("World War I") != topics.topic_key("World War II")
+    # Spelling slips share in-memory cache entries only
+    first = topics.cache_key("Ferrofluid dynamics in strong magnetic fields")
+    assert topics.cache_key("Ferofluid dynamics in strong magnetic fields") == first
+    assert topics.topic_key("Ferofluid dynamics in strong magnetic fields") == "ferofluiddynamicstrongmagneticfield"
+
+
+def test_index_matches_near_duplicates_only():
+    index = topics.TopicIndex()
+    key = index.resolve("Mitochondria function in eukaryotic cells")
+    assert index.resolve("mitochondria-functions in eukaryotic cells") == key
+    assert index.match("What is mitoochondria function in eukaryotic cells?") == key
+    assert index.match("Plate tectonics") is None
+    assert index.resolve("Photo-synthesis") == "photo synthesis"
+    assert index.resolve("photosynthesis") == "photo synthesis"
+    assert len(index) == 2
+
+
+def test_index_keeps_variants_apart():
+    # A loose threshold, so only the variant check keeps these apart
+    index = topics.TopicIndex(threshold=0.5)
+    pairs = [("History of World War I in Europe", "History of World War II in Europe"),
+             ("Calculus 1 integration techniques", "Calculus 2 integration techniques"),
+             ("Vitamin B metabolism and deficiency", "Vitamin C metabolism and deficiency"),
+             ("Organic chemistry reaction mechanisms", "Inorganic chemistry reaction mechanisms"),
+             ("Linear differential equations", "Non-linear differential equations"),
+             ("Symmetric key cryptography", "Asymmetric key cryptography")]
+    for first, second in pairs:
+        assert index.resolve(first) != index.resolve(second), (first, second)
+    assert index.resolve("Histories of World War II in Europe") == topics.canonicalize(pairs[0][1])
+    assert not topics.distinct("photo synthesis", "photosynthesis")
+
+
+def test_index_respects_max_size():
+    index = topics.TopicIndex(max_size=1)
+    index.resolve("Algebra")
+    assert index.resolve("Geometry") == "geometry"
+    assert "geometry" not in index
+    assert len(index) == 1
+
+
+def test_benchmark_reports_per_lookup_micros():
+    results = topics.benchmark(num_topics=500, lookups=50)
+    assert set(results) == {'miss', 'near_duplicate'}
+    assert all(value > 0 for value in results.values())
@@ -0,0 +1,58 @@
+"""Tests for token and cost accounting"""
+import pytest
+
+from edugenie import fakes, jobs, usage
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = fakes.FakeFirestoreClient()
+    monkeypatch.setattr(usage, '_db', db)
+    usage._pending.clear()
+    usage._stored.clear()
+    usage._budgets.clear()
+    yield db
+    usage._pending.clear()
+
+
+def test_records_aggregate_in_memory_until_flushed(db):
+    for _ in range(3):
+        usage.record(user_id='u1', page='quiz', topic='Photosynthesis', model='m',
+                     prompt_tokens=100, output_tokens=50, latency=0.5)
+    usage.record(user_id='u1', page='quiz', topic='photosynthesis', model='m', cache_hit=True)
+
+    (bucket,) = usage.pending().values()
+    assert bucket['calls'] == 4 and bucket['cache_hits'] == 1
+    assert bucket['total_tokens'] == 450
+    assert bucket['cost_usd'] == pytest.approx(3 * usage.cost_of(100, 50))
+
+    assert usage.flush() == 1
+    assert usage.pending() == {}
+    (row,) = usage.top_topics(db)
+    assert row['topic'] == 'Photosynthesis' and row['calls'] == 4 and row['total_tokens'] == 450
+    daily = db.collection(usage.DAILY_COLLECTION).document(f"{usage.today()}_u1").get().to_dict()
+    assert daily['total_tokens'] == 450 and daily['latency_seconds'] == pytest.approx(1.5)
+
+
+def test_report_ranks_topics_by_cost(db):
+    usage.record(user_id='u1', topic='cells', prompt_tokens=10, output_tokens=10)
+    usage.record(user_id='u2', topic='gravity', prompt_tokens=10, output_tokens=5000)
+    usage.record(user_id='u2', topic='algebra', prompt_tokens=10, output_tokens=500)
+    usage.flush()
+    assert [row['topic'] for row in usage.top_topics(db)] == ['gravity', 'algebra', 'cells']
+
+
+def test_scheduler_refuses_jobs_over_budget(db):
+    usage.set_budget(db, 'u1', 1000)
+    usage.record(user_id='u1', topic='cells', prompt_tokens=400, output_tokens=200)
+    ok = jobs.wait(jobs.submit(lambda: 'ran', owner='u1'), timeout=5)
+    assert ok.status == jobs.DONE
+
+    usage.flush()
+    usage.record(user_id='u1', topic='cells', prompt_tokens=300, output_tokens=100)
+    refused = jobs.wait(jobs.submit(lambda: 'ran', owner='u1'), timeout=5)
+    assert refused.status == jobs.FAILED and 'budget' in refused.error
+
+    # Other users and unowned jobs are unaffected
+    assert jobs.wait(jobs.submit(lambda: 'ran', owner='u2'), timeout=5).status == jobs.DONE
+    assert jobs.wait(jobs.submit(lambda: 'ran'), timeout=5).status == jobs.DONE
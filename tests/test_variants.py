@@ -0,0 +1,68 @@
+"""Tests for local quiz versions"""
+import pytest
+
+from edugenie import variants
+
+QUIZ = [
+    {'question': '1. Which organelle makes ATP?',
+     'options': ['A. Nucleus', 'B. Mitochondrion', 'C. Ribosome', 'D. Golgi body'],
+     'answer': 'B', 'explanation': 'Respiration.'},
+    {'question': '2. Photosynthesis happens in chloroplasts.',
+     'options': ['A. True', 'B. False'], 'answer': 'A', 'explanation': ''},
+    {'question': '3. Which carries genetic information?',
+     'options': ['A. Lipids', 'B. Starch', 'C. DNA', 'D. Water'],
+     'answer': 'C. DNA', 'explanation': ''},
+]
+
+
+def test_versions_are_reproducible_from_their_id():
+    first = variants.VariantSet(QUIZ, 50, seed=7)
+    again = variants.VariantSet(QUIZ, 5, seed=7)
+    assert first.variant(3) == again.variant(3)
+    assert first.answer_keys()[:5] == again.answer_keys()
+    rebuilt, index = variants.for_id(QUIZ, first.ids()[42])
+    assert rebuilt.variant(index) == first.variant(42)
+
+
+def test_answers_follow_the_shuffled_options():
+    variant_set = variants.VariantSet(QUIZ, 100, seed=1)
+    keys = variant_set.answer_keys()
+    for index in range(100):
+        for position, question in enumerate(variant_set.variant(index)):
+            letter = question['answer'][0]
+            original = QUIZ[variant_set.order[index][position]]
+            if len(question['options']) == 4:
+                assert keys[index][position] == letter
+                correct_text = question['options']['ABCD'.index(letter)][3:]
+                assert correct_text in ('Mitochondrion', 'DNA')
+            else:
+                assert question['options'] == original['options']
+                assert keys[index][position] == '?'
+    assert len(set(keys)) > 10
+
+
+def test_text_answers_get_the_letter_and_text_of_their_new_slot():
+    quiz = [dict(QUIZ[0], answer='Mitochondrion')] + QUIZ[1:]
+    variant_set = variants.VariantSet(quiz, 20, seed=3)
+    for index in range(20):
+        for question in variant_set.variant(index):
+            if question['question'].endswith('makes ATP?'):
+                assert question['answer'] in question['options']
+                assert question['answer'].endswith('. Mitochondrion')
+            elif question['question'].endswith('genetic information?'):
+                assert question['answer'] in question['options'] and question['answer'].endswith('. DNA')
+
+
+def test_to_canonical_maps_back_to_original_key():
+    variant_set = variants.VariantSet(QUIZ, 20, seed=3)
+    for index, vid in enumerate(variant_set.ids()):
+        version = variant_set.variant(index)
+        correct = {pos: next(o for o in q['options'] if o[0] == q['answer'][0]) for pos, q in enumerate(version)}
+        canonical = variants.to_canonical(QUIZ, vid, correct)
+        assert canonical == {0: 'B. Mitochondrion', 1: 'A. True', 2: 'C. DNA'}
+
+
+def test_id_of_another_quiz_is_rejected():
+    other = variants.VariantSet(QUIZ[:2], 3).ids()[0]
+    with pytest.raises(ValueError):
+        variants.for_id(QUIZ, other)
@@ -0,0 +1,62 @@
+"""Tests for the off-peak cache warmer"""
+import datetime
+
+import pytest
+
+from edugenie import bank, fakes, warmer
+
+NOW = datetime.datetime(2024, 5, 6, 3, 0)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setenv('EDUGENIE_OFFLINE', '1')
+    db = fakes.FakeFirestoreClient()
+    events = [('Photosynthesis', 'Apply', 'Multiple Choice', 2)] * 3 + [('Photosynthesis', 'Remember', 'True/False', 5),
+              ('Ancient Rome', 'Remember', 'Multiple Choice', 150), ('Mitosis', 'Apply', 'Multiple Choice', 400)]
+    for topic, level, question_type, hours_ago in events:
+        db.collection('quiz_attempts').document().set({
+            'topic': topic, 'topic_key': topic.lower(), 'blooms_level': level, 'question_type': question_type,
+            'created_at': NOW - datetime.timedelta(hours=hours_ago)})
+    db.collection('study_materials').document().set({'topic': 'Plate Tectonics', 'created_at': NOW})
+    return db
+
+
+def test_rank_weighs_frequency_and_recency(db):
+    combos = warmer.rank(db, NOW, k=10)
+    assert [(c.topic, c.blooms_level, c.question_type) for c in combos] == [
+        ('Photosynthesis', 'Apply', 'Multiple Choice'),
+        ('Plate Tectonics', warmer.DEFAULT_LEVEL, warmer.DEFAULT_TYPE),
+        ('Photosynthesis', 'Remember', 'True/False'),
+        ('Ancient Rome', 'Remember', 'Multiple Choice'),
+    ]  # Mitosis is older than the lookback window
+
+
+def test_run_fills_the_bank_within_budget_and_reports_hits(db):
+    summary = warmer.run(db, k=3, token_budget=0, num_questions=4, now=NOW, log=lambda _: None)
+    assert len(summary['warmed']) == 3 and summary['tokens'] > 0
+    tectonics = [combo for combo in summary['warmed'] if combo['topic'] == 'Plate Tectonics'][0]
+    assert 0 < len(tectonics['question_keys']) <= 4
+    assert len(bank.load(db, 'Plate Tectonics', warmer.DEFAULT_LEVEL, warmer.DEFAULT_TYPE)) == len(tectonics['question_keys'])
+
+    per_quiz = summary['tokens'] / 3
+    limited = warmer.run(db, k=3, token_budget=int(per_quiz * 1.5), bank_target=100, num_questions=4,
+                         now=NOW, log=lambda _: None)
+    assert len(limited['warmed']) == 1 and limited['stopped'] == 'budget'
+
+    # A student is served two warmed questions and one other after the run
+    warmed_keys = summary['warmed'][0]['question_keys']
+    attempt = db.collection('quiz_attempts').document()
+    for key in warmed_keys[:2] + ['not-warmed']:
+        attempt.collection('questions').document().set(
+            {'user_id': 'u1', 'question_key': key, 'created_at': datetime.datetime.utcnow()})
+    report = warmer.hit_report(db, summary['run_id'])
+    assert (report['served'], report['warm_hits']) == (3, 2)
+    assert report['tokens_per_hit'] == summary['tokens'] / 2
+
+
+def test_off_peak_window_wraps_midnight():
+    start, end = warmer.next_window(datetime.datetime(2024, 5, 6, 1, 30), '22-4')
+    assert (start, end) == (datetime.datetime(2024, 5, 5, 22), datetime.datetime(2024, 5, 6, 4))
+    start, _ = warmer.next_window(datetime.datetime(2024, 5, 6, 7, 0), '2-6')
+    assert start == datetime.datetime(2024, 5, 7, 2)